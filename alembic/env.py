@@ -29,6 +29,9 @@ from app.models.configuracion_sistema import ConfiguracionSistema
 from app.models.auditoria import Auditoria
 from app.models.empresa import Empresa
 from app.models.password_reset import PasswordReset
+from app.models.numeracion import ContadorNumeracion
+from app.models.cadena_verifactu import CadenaVerifactu
+from app.models.checkpoint_verifactu import CheckpointVerifactu
 
 # añade aquí otros modelos si existen
 
@@ -57,24 +60,52 @@ def run_migrations_offline() -> None:
         context.run_migrations()
 
 
-def run_migrations_online() -> None:
-    """Run migrations in 'online' mode."""
-    config.set_main_option("sqlalchemy.url", get_database_url())
+def get_database_urls() -> list[str]:
+    """
+    BD principal y, con DB_SHARDING, el fichero de cada empresa.
+    `alembic -x shard=principal upgrade head` o `-x shard=<empresa_id>`
+    limitan la migración a una sola BD.
 
-    connectable = engine_from_config(
-        config.get_section(config.config_ini_section, {}),
-        prefix="sqlalchemy.",
-        poolclass=pool.NullPool,
-    )
+    Las migraciones nuevas se ejecutan en TODAS: las que toquen tablas
+    globales (user, empresa, password_reset) deben comprobar que existen,
+    porque los ficheros de empresa no las tienen.
+    """
+    from app.core.config import settings
+    from app.db.shards import empresas_con_shard, url_shard
+
+    principal = get_database_url()
+    shard = context.get_x_argument(as_dictionary=True).get("shard")
+
+    if shard == "principal" or not settings.DB_SHARDING:
+        return [principal]
+    if shard:
+        return [url_shard(int(shard))]
+
+    return [principal] + [url_shard(e) for e in empresas_con_shard()]
 
-    with connectable.connect() as connection:
-        context.configure(
-            connection=connection,
-            target_metadata=target_metadata,
+
+def run_migrations_online() -> None:
+    """Run migrations in 'online' mode (una pasada por BD)."""
+    for url in get_database_urls():
+        print(f">>> Migrando {url}")
+        config.set_main_option("sqlalchemy.url", url)
+
+        connectable = engine_from_config(
+            config.get_section(config.config_ini_section, {}),
+            prefix="sqlalchemy.",
+            poolclass=pool.NullPool,
         )
 
-        with context.begin_transaction():
-            context.run_migrations()
+        with connectable.connect() as connection:
+            context.configure(
+                connection=connection,
+                target_metadata=target_metadata,
+            )
+
+            with context.begin_transaction():
+                context.run_migrations()
+
+        connectable.dispose()
 
 
 if context.is_offline_mode():
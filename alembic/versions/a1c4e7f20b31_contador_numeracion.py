@@ -0,0 +1,57 @@
+"""Contador de numeración atómico por empresa/serie/año
+
+Revision ID: a1c4e7f20b31
+Revises: 33e899977cfb
+Create Date: 2026-10-19 09:12:41.118204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a1c4e7f20b31'
+down_revision: Union[str, Sequence[str], None] = '33e899977cfb'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+
+    # Puede existir ya si se arrancó la app (create_all)
+    if "contador_numeracion" in sa.inspect(conn).get_table_names():
+        return
+
+    op.create_table('contador_numeracion',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('empresa_id', sa.Integer(), nullable=False),
+    sa.Column('serie', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('anio', sa.Integer(), nullable=False),
+    sa.Column('ultimo_numero', sa.Integer(), nullable=False),
+    sa.Column('actualizado_en', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['empresa_id'], ['empresa.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('empresa_id', 'serie', 'anio', name='uq_contador_numeracion')
+    )
+    op.create_index(op.f('ix_contador_numeracion_empresa_id'), 'contador_numeracion', ['empresa_id'], unique=False)
+
+    # Arrancar cada contador donde lo dejó Emisor.siguiente_numero
+    conn.execute(sa.text("""
+        INSERT INTO contador_numeracion (empresa_id, serie, anio, ultimo_numero, actualizado_en)
+        SELECT empresa_id,
+               TRIM(COALESCE(serie_facturacion, '')),
+               ultimo_anio_numerado,
+               MAX(COALESCE(siguiente_numero, 1) - 1, 0),
+               CURRENT_TIMESTAMP
+        FROM emisor
+        WHERE ultimo_anio_numerado IS NOT NULL
+    """))
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_contador_numeracion_empresa_id'), table_name='contador_numeracion')
+    op.drop_table('contador_numeracion')
@@ -0,0 +1,69 @@
+"""Outbox de emails sobre envios_email
+
+Revision ID: a7e3c5f1b928
+Revises: f6c2d9a4b137
+Create Date: 2026-10-19 19:02:37.418211
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7e3c5f1b928'
+down_revision: Union[str, Sequence[str], None] = 'f6c2d9a4b137'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+
+    # La tabla la crea create_all al arrancar: si aún no existe, nada que hacer
+    if "envios_email" not in sa.inspect(conn).get_table_names():
+        return
+
+    cols = [r[1] for r in conn.execute(sa.text("PRAGMA table_info('envios_email')"))]
+
+    with op.batch_alter_table("envios_email") as batch:
+        if "empresa_id" not in cols:
+            batch.add_column(sa.Column("empresa_id", sa.Integer(), nullable=True))
+        if "pdf_path" not in cols:
+            batch.add_column(sa.Column("pdf_path", sa.String(), nullable=True))
+        if "creado_en" not in cols:
+            batch.add_column(sa.Column("creado_en", sa.DateTime(), nullable=True))
+        if "intentos" not in cols:
+            batch.add_column(sa.Column("intentos", sa.Integer(), nullable=False, server_default="0"))
+        if "proximo_intento" not in cols:
+            batch.add_column(sa.Column("proximo_intento", sa.DateTime(), nullable=True))
+        # enviado_en pasa a ser la fecha real de envío (NULL si no se envió)
+        batch.alter_column("enviado_en", existing_type=sa.DateTime(), nullable=True)
+
+    # Históricos: se grabaron como OK antes de enviar; se dejan como están
+    conn.execute(sa.text("""
+        UPDATE envios_email
+        SET creado_en = COALESCE(creado_en, enviado_en),
+            empresa_id = COALESCE(
+                empresa_id,
+                (SELECT f.empresa_id FROM factura f WHERE f.id = envios_email.factura_id)
+            )
+    """))
+
+    indices = [i["name"] for i in sa.inspect(conn).get_indexes("envios_email")]
+    if "ix_envios_email_empresa_id" not in indices:
+        op.create_index("ix_envios_email_empresa_id", "envios_email", ["empresa_id"])
+    if "ix_envios_email_estado_proximo" not in indices:
+        op.create_index("ix_envios_email_estado_proximo", "envios_email", ["estado", "proximo_intento"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_envios_email_estado_proximo", table_name="envios_email")
+    op.drop_index("ix_envios_email_empresa_id", table_name="envios_email")
+    with op.batch_alter_table("envios_email") as batch:
+        batch.drop_column("proximo_intento")
+        batch.drop_column("intentos")
+        batch.drop_column("creado_en")
+        batch.drop_column("pdf_path")
+        batch.drop_column("empresa_id")
@@ -0,0 +1,43 @@
+"""Outbox de envío en registroverifactu
+
+Revision ID: b7d2a9c3e514
+Revises: a1c4e7f20b31
+Create Date: 2026-10-19 11:40:03.552017
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7d2a9c3e514'
+down_revision: Union[str, Sequence[str], None] = 'a1c4e7f20b31'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    cols = [r[1] for r in conn.execute(sa.text("PRAGMA table_info('registroverifactu')"))]
+
+    with op.batch_alter_table("registroverifactu") as batch:
+        if "intentos_envio" not in cols:
+            batch.add_column(sa.Column("intentos_envio", sa.Integer(), nullable=False, server_default="0"))
+        if "proximo_intento" not in cols:
+            batch.add_column(sa.Column("proximo_intento", sa.DateTime(), nullable=True))
+        if "enviado_en" not in cols:
+            batch.add_column(sa.Column("enviado_en", sa.DateTime(), nullable=True))
+
+    indices = [i["name"] for i in sa.inspect(conn).get_indexes("registroverifactu")]
+    if "ix_registroverifactu_estado_envio" not in indices:
+        op.create_index("ix_registroverifactu_estado_envio", "registroverifactu", ["estado_envio"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_registroverifactu_estado_envio", table_name="registroverifactu")
+    with op.batch_alter_table("registroverifactu") as batch:
+        batch.drop_column("enviado_en")
+        batch.drop_column("proximo_intento")
+        batch.drop_column("intentos_envio")
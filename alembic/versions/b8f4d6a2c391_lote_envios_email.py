@@ -0,0 +1,41 @@
+"""Lote de envío masivo en envios_email
+
+Revision ID: b8f4d6a2c391
+Revises: a7e3c5f1b928
+Create Date: 2026-10-19 20:14:05.216377
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b8f4d6a2c391'
+down_revision: Union[str, Sequence[str], None] = 'a7e3c5f1b928'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+
+    if "envios_email" not in sa.inspect(conn).get_table_names():
+        return
+
+    cols = [r[1] for r in conn.execute(sa.text("PRAGMA table_info('envios_email')"))]
+
+    if "lote" not in cols:
+        with op.batch_alter_table("envios_email") as batch:
+            batch.add_column(sa.Column("lote", sa.String(), nullable=True))
+
+    indices = [i["name"] for i in sa.inspect(conn).get_indexes("envios_email")]
+    if "ix_envios_email_lote" not in indices:
+        op.create_index("ix_envios_email_lote", "envios_email", ["lote"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_envios_email_lote", table_name="envios_email")
+    with op.batch_alter_table("envios_email") as batch:
+        batch.drop_column("lote")
@@ -0,0 +1,86 @@
+"""Cabeza de cadena Veri*Factu por empresa y secuencia en registroverifactu
+
+Revision ID: c3f8e1d6a902
+Revises: b7d2a9c3e514
+Create Date: 2026-10-19 13:05:27.640918
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3f8e1d6a902'
+down_revision: Union[str, Sequence[str], None] = 'b7d2a9c3e514'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    cols = [r[1] for r in conn.execute(sa.text("PRAGMA table_info('registroverifactu')"))]
+
+    if "secuencia" not in cols:
+        with op.batch_alter_table("registroverifactu") as batch:
+            batch.add_column(sa.Column("secuencia", sa.Integer(), nullable=True))
+
+    # Numerar la historia existente en el orden en que se encadenó
+    conn.execute(sa.text("""
+        UPDATE registroverifactu
+        SET secuencia = (
+            SELECT t.rn FROM (
+                SELECT id, ROW_NUMBER() OVER (
+                    PARTITION BY empresa_id ORDER BY fecha_registro, id
+                ) AS rn
+                FROM registroverifactu
+            ) t
+            WHERE t.id = registroverifactu.id
+        )
+        WHERE secuencia IS NULL
+    """))
+
+    indices = [i["name"] for i in sa.inspect(conn).get_indexes("registroverifactu")]
+    if "ux_registroverifactu_empresa_secuencia" not in indices:
+        op.create_index(
+            "ux_registroverifactu_empresa_secuencia",
+            "registroverifactu",
+            ["empresa_id", "secuencia"],
+            unique=True,
+        )
+
+    if "cadena_verifactu" not in sa.inspect(conn).get_table_names():
+        op.create_table('cadena_verifactu',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('empresa_id', sa.Integer(), nullable=False),
+        sa.Column('ultimo_registro_id', sa.Integer(), nullable=True),
+        sa.Column('ultimo_hash', sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+        sa.Column('secuencia', sa.Integer(), nullable=False),
+        sa.Column('actualizado_en', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['empresa_id'], ['empresa.id'], ),
+        sa.ForeignKeyConstraint(['ultimo_registro_id'], ['registroverifactu.id'], ),
+        sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index(op.f('ix_cadena_verifactu_empresa_id'), 'cadena_verifactu', ['empresa_id'], unique=True)
+
+    # Cabeza = último registro de cada empresa
+    conn.execute(sa.text("""
+        INSERT INTO cadena_verifactu (empresa_id, ultimo_registro_id, ultimo_hash, secuencia, actualizado_en)
+        SELECT r.empresa_id, r.id, r.hash_actual, r.secuencia, CURRENT_TIMESTAMP
+        FROM registroverifactu r
+        WHERE r.secuencia = (
+            SELECT MAX(r2.secuencia) FROM registroverifactu r2
+            WHERE r2.empresa_id = r.empresa_id
+        )
+        AND r.empresa_id NOT IN (SELECT empresa_id FROM cadena_verifactu)
+    """))
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_cadena_verifactu_empresa_id'), table_name='cadena_verifactu')
+    op.drop_table('cadena_verifactu')
+    op.drop_index("ux_registroverifactu_empresa_secuencia", table_name="registroverifactu")
+    with op.batch_alter_table("registroverifactu") as batch:
+        batch.drop_column("secuencia")
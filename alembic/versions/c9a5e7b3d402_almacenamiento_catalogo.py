@@ -0,0 +1,44 @@
+"""Catálogo de almacenamiento (/data)
+
+Revision ID: c9a5e7b3d402
+Revises: b8f4d6a2c391
+Create Date: 2026-10-19 21:03:47.518204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c9a5e7b3d402'
+down_revision: Union[str, Sequence[str], None] = 'b8f4d6a2c391'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+
+    if "almacenamiento_catalogo" in sa.inspect(conn).get_table_names():
+        return
+
+    # Se rellena solo con el primer escaneo (app/services/catalogo_almacenamiento.py)
+    op.create_table('almacenamiento_catalogo',
+    sa.Column('ruta', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('padre', sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+    sa.Column('es_dir', sa.Boolean(), nullable=False),
+    sa.Column('tamano', sa.Integer(), nullable=False),
+    sa.Column('archivos', sa.Integer(), nullable=False),
+    sa.Column('mtime', sa.Float(), nullable=True),
+    sa.Column('actualizado_en', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('ruta')
+    )
+    op.create_index(op.f('ix_almacenamiento_catalogo_padre'), 'almacenamiento_catalogo', ['padre'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_almacenamiento_catalogo_padre'), table_name='almacenamiento_catalogo')
+    op.drop_table('almacenamiento_catalogo')
@@ -0,0 +1,56 @@
+"""Almacén de blobs por contenido (/data/.blobs)
+
+Revision ID: d1b6f8c4e513
+Revises: c9a5e7b3d402
+Create Date: 2026-10-19 23:41:12.804391
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd1b6f8c4e513'
+down_revision: Union[str, Sequence[str], None] = 'c9a5e7b3d402'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    tablas = sa.inspect(conn).get_table_names()
+
+    # Los archivos ya existentes se incorporan con:
+    #   python -m app.services.blobs adoptar
+    if "blob" not in tablas:
+        op.create_table('blob',
+        sa.Column('sha256', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column('tamano', sa.Integer(), nullable=False),
+        sa.Column('referencias', sa.Integer(), nullable=False),
+        sa.Column('creado_en', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('sha256')
+        )
+        op.create_index(op.f('ix_blob_referencias'), 'blob', ['referencias'], unique=False)
+
+    if "blob_ruta" not in tablas:
+        op.create_table('blob_ruta',
+        sa.Column('ruta', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column('sha256', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column('empresa_id', sa.Integer(), nullable=True),
+        sa.Column('actualizado_en', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['sha256'], ['blob.sha256'], ),
+        sa.PrimaryKeyConstraint('ruta')
+        )
+        op.create_index(op.f('ix_blob_ruta_sha256'), 'blob_ruta', ['sha256'], unique=False)
+        op.create_index(op.f('ix_blob_ruta_empresa_id'), 'blob_ruta', ['empresa_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_blob_ruta_empresa_id'), table_name='blob_ruta')
+    op.drop_index(op.f('ix_blob_ruta_sha256'), table_name='blob_ruta')
+    op.drop_table('blob_ruta')
+    op.drop_index(op.f('ix_blob_referencias'), table_name='blob')
+    op.drop_table('blob')
@@ -0,0 +1,45 @@
+"""Checkpoints de verificación de la cadena Veri*Factu
+
+Revision ID: d4a7b2c9e815
+Revises: c3f8e1d6a902
+Create Date: 2026-10-19 14:22:09.301457
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd4a7b2c9e815'
+down_revision: Union[str, Sequence[str], None] = 'c3f8e1d6a902'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+
+    if "checkpoint_verifactu" in sa.inspect(conn).get_table_names():
+        return
+
+    op.create_table('checkpoint_verifactu',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('empresa_id', sa.Integer(), nullable=False),
+    sa.Column('secuencia', sa.Integer(), nullable=False),
+    sa.Column('registro_id', sa.Integer(), nullable=False),
+    sa.Column('hash_actual', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('firma', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('creado_en', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['empresa_id'], ['empresa.id'], ),
+    sa.ForeignKeyConstraint(['registro_id'], ['registroverifactu.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_checkpoint_verifactu_empresa_id'), 'checkpoint_verifactu', ['empresa_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_checkpoint_verifactu_empresa_id'), table_name='checkpoint_verifactu')
+    op.drop_table('checkpoint_verifactu')
@@ -0,0 +1,33 @@
+"""Versión del formato de hash en registroverifactu
+
+Revision ID: e5b1c8f3a274
+Revises: d4a7b2c9e815
+Create Date: 2026-10-19 15:48:36.027114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5b1c8f3a274'
+down_revision: Union[str, Sequence[str], None] = 'd4a7b2c9e815'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    cols = [r[1] for r in conn.execute(sa.text("PRAGMA table_info('registroverifactu')"))]
+
+    # Los registros existentes se generaron con el hash JSON (v1)
+    if "version_hash" not in cols:
+        with op.batch_alter_table("registroverifactu") as batch:
+            batch.add_column(sa.Column("version_hash", sa.Integer(), nullable=False, server_default="1"))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("registroverifactu") as batch:
+        batch.drop_column("version_hash")
@@ -0,0 +1,60 @@
+"""Desglose de IVA por factura e IVA por línea
+
+Revision ID: f6c2d9a4b137
+Revises: e5b1c8f3a274
+Create Date: 2026-10-19 17:10:52.774310
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f6c2d9a4b137'
+down_revision: Union[str, Sequence[str], None] = 'e5b1c8f3a274'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    cols = [r[1] for r in conn.execute(sa.text("PRAGMA table_info('lineafactura')"))]
+
+    if "iva" not in cols:
+        with op.batch_alter_table("lineafactura") as batch:
+            batch.add_column(sa.Column("iva", sa.Float(), nullable=True))
+
+    if "factura_iva_desglose" not in sa.inspect(conn).get_table_names():
+        op.create_table('factura_iva_desglose',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('factura_id', sa.Integer(), nullable=False),
+        sa.Column('empresa_id', sa.Integer(), nullable=False),
+        sa.Column('fecha', sa.Date(), nullable=False),
+        sa.Column('tipo', sa.Float(), nullable=False),
+        sa.Column('base', sa.Float(), nullable=False),
+        sa.Column('cuota', sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(['empresa_id'], ['empresa.id'], ),
+        sa.ForeignKeyConstraint(['factura_id'], ['factura.id'], ),
+        sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index(op.f('ix_factura_iva_desglose_factura_id'), 'factura_iva_desglose', ['factura_id'], unique=False)
+        op.create_index('ix_factura_iva_desglose_empresa_fecha_tipo', 'factura_iva_desglose', ['empresa_id', 'fecha', 'tipo'], unique=False)
+
+    # Facturas ya emitidas: un único tipo (iva_global)
+    conn.execute(sa.text("""
+        INSERT INTO factura_iva_desglose (factura_id, empresa_id, fecha, tipo, base, cuota)
+        SELECT f.id, f.empresa_id, f.fecha, COALESCE(f.iva_global, 0), f.subtotal, f.iva_total
+        FROM factura f
+        WHERE f.estado IN ('VALIDADA', 'ANULADA')
+          AND f.id NOT IN (SELECT factura_id FROM factura_iva_desglose)
+    """))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_factura_iva_desglose_empresa_fecha_tipo', table_name='factura_iva_desglose')
+    op.drop_index(op.f('ix_factura_iva_desglose_factura_id'), table_name='factura_iva_desglose')
+    op.drop_table('factura_iva_desglose')
+    with op.batch_alter_table("lineafactura") as batch:
+        batch.drop_column("iva")
@@ -4,6 +4,7 @@ from starlette.requests import Request
 from datetime import datetime, timedelta
 from sqlmodel import select
 from app.db.session import Session, engine
+from app.db.shards import sesion_empresa
 from app.models.emisor import Emisor
 from app.models.user import User
 from app.core.logger import logger
@@ -39,7 +40,7 @@ class AuthMiddleware(BaseHTTPMiddleware):
             "/manifest",
             "/favicon",
             "/sw.js",
-            
+            "/health",
         )
 
         if path in rutas_publicas_exact or any(path.startswith(p) for p in rutas_publicas_prefix):
@@ -94,7 +95,7 @@ class AuthMiddleware(BaseHTTPMiddleware):
         # ---------------------------------------------------
         # CARGAR EMISOR
         # ---------------------------------------------------
-        with Session(engine) as db:
+        with sesion_empresa(empresa_id) as db:
             emisor = db.exec(
                 select(Emisor).where(Emisor.empresa_id == empresa_id)
             ).first()
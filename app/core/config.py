@@ -14,6 +14,29 @@ class Settings(BaseSettings):
     else:
         # Local: sin BD o futura ruta si la quisieras
         DATABASE_URL: str | None = None
+    # SQLite (perfil de producción, ver app/db/session.py)
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+    SQLITE_CACHE_SIZE: int = -65536              # negativo = KiB (64 MiB)
+    SQLITE_MMAP_SIZE: int = 268435456            # 256 MiB
+    SQLITE_CHECKPOINT_INTERVALO: float = 60.0    # segundos; 0 = sin hilo
+    # Una BD SQLite por empresa (ver app/db/shards.py)
+    DB_SHARDING: bool = False
+    DB_SHARDS_DIR: str = "/data/empresas"
+    DB_SHARDS_MAX_ENGINES: int = 32              # engines abiertos a la vez (LRU)
+    DB_SHARDS_INACTIVIDAD: float = 600.0         # segundos sin uso → se cierra
+
+    # ========================
+    # ALMACENAMIENTO (/storage)
+    # ========================
+    ALMACENAMIENTO_RAIZ: str = "/data"
+    ALMACENAMIENTO_ESCANEO_INTERVALO: float = 3600.0   # reconciliación del catálogo; 0 = sin hilo
+
+    # ========================
+    # BACKUP (app/services/backup.py)
+    # ========================
+    BACKUP_DIR: str = "/backups"                 # fuera de ALMACENAMIENTO_RAIZ
+    BACKUP_WORKERS: int = 4                      # archivos copiados en paralelo
+
     # ========================
     # SECURITY / JWT
     # ========================
@@ -39,6 +62,53 @@ class Settings(BaseSettings):
     SMTP_PASSWORD: str | None = None
     EMAIL_FROM: str = "no-reply@localhost"
     EMAIL_TLS: bool = True
+    # Pool de conexiones SMTP (app/services/smtp_service.py)
+    SMTP_POOL_MAX: int = 4                       # conexiones libres por servidor/usuario
+    SMTP_MENSAJES_POR_CONEXION: int = 100        # después se rehace la conexión
+    SMTP_NOOP_TRAS: float = 30.0                 # segundos libre → NOOP antes de reusar
+    SMTP_INACTIVIDAD_MAX: float = 240.0          # segundos libre → se cierra
+    SMTP_MAX_POR_MINUTO: int = 0                 # por servidor SMTP; 0 = sin límite
+
+    # ========================
+    # EMAIL OUTBOX
+    # ========================
+    EMAIL_OUTBOX_ACTIVO: bool = True
+    EMAIL_OUTBOX_INTERVALO: float = 10.0         # segundos entre barridos
+    EMAIL_OUTBOX_WORKERS: int = 4                # empresas en paralelo
+    EMAIL_OUTBOX_LOTE: int = 50                  # emails por empresa y pasada
+    EMAIL_MAX_INTENTOS: int = 6
+    EMAIL_BACKOFF_BASE: float = 30.0             # segundos
+    EMAIL_BACKOFF_MAX: float = 3600.0
+    EMAIL_LEASE_SEGUNDOS: int = 300              # reserva de un envío en curso
+    EMAIL_MASIVO_HISTORIAL: int = 20             # trabajos masivos recordados en memoria
+
+    # ========================
+    # VERI*FACTU OUTBOX
+    # ========================
+    VERIFACTU_OUTBOX_ACTIVO: bool = True
+    VERIFACTU_OUTBOX_INTERVALO: float = 5.0      # segundos entre barridos
+    VERIFACTU_OUTBOX_WORKERS: int = 4            # empresas en paralelo
+    VERIFACTU_MAX_INTENTOS: int = 8
+    VERIFACTU_BACKOFF_BASE: float = 10.0         # segundos
+    VERIFACTU_BACKOFF_MAX: float = 3600.0
+    VERIFACTU_LEASE_SEGUNDOS: int = 120          # reserva de un envío en curso
+    VERIFACTU_LOTE_MAX: int = 1                  # registros por petición (1 = individual)
+    VERIFACTU_LOTE_VENTANA: float = 2.0          # segundos esperando a llenar un lote
+
+    # ========================
+    # VERI*FACTU VERIFICACIÓN DE CADENA
+    # ========================
+    VERIFACTU_CHECKPOINT_CADA: int = 1000         # registros entre checkpoints
+    VERIFACTU_VERIFICACION_HORAS: float = 24.0    # 0 = sin verificación programada
+
+    # ========================
+    # VERI*FACTU HTTP (pool por empresa)
+    # ========================
+    VERIFACTU_HTTP_TIMEOUT: float = 20.0
+    VERIFACTU_HTTP_MAX_CONEXIONES: int = 10
+    VERIFACTU_HTTP_KEEPALIVE: int = 5
+    VERIFACTU_HTTP_KEEPALIVE_EXPIRY: float = 60.0
+    VERIFACTU_HTTP2: bool = False                # requiere el paquete "h2"
 
     class Config:
         env_file = ".env.dev" if os.getenv("RENDER") is None else None
@@ -12,6 +12,11 @@ from app.models.user import User
 from app.models.password_reset import PasswordReset
 from app.models.envios_email import EnviosEmail
 from app.models.concepto import Concepto
+from app.models.numeracion import ContadorNumeracion
+from app.models.cadena_verifactu import CadenaVerifactu
+from app.models.checkpoint_verifactu import CheckpointVerifactu
+from app.models.almacenamiento import EntradaAlmacenamiento
+from app.models.blob import Blob, RutaBlob
 
 
 
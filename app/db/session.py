@@ -1,12 +1,115 @@
+from fastapi import Request
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
 from sqlmodel import Session, create_engine
 from app.core.config import settings
 
-engine = create_engine(
-    settings.DATABASE_URL,
-    echo=False,
-    connect_args={"check_same_thread": False}  # ← necesario en SQLite
-)
 
-def get_session():
-    with Session(engine) as session:
+def es_sqlite(url: str | None) -> bool:
+    return bool(url) and url.startswith("sqlite")
+
+
+# ============================================================
+# PERFIL SQLITE (producción)
+# ============================================================
+# En cada conexión: WAL (lectores y escritor no se bloquean), espera en
+# lugar de "database is locked", caché/mmap más grandes y temporales en RAM.
+# El checkpoint del WAL lo hace un hilo aparte (app/db/sqlite_wal.py).
+
+def _pragmas_comunes(cur):
+    cur.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+    cur.execute(f"PRAGMA cache_size={int(settings.SQLITE_CACHE_SIZE)}")
+    cur.execute(f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE)}")
+    cur.execute("PRAGMA temp_store=MEMORY")
+
+
+def _pragmas_sqlite(dbapi_conn, _record):
+    cur = dbapi_conn.cursor()
+    cur.execute("PRAGMA journal_mode=WAL")
+    cur.execute("PRAGMA synchronous=NORMAL")
+    _pragmas_comunes(cur)
+    cur.close()
+
+
+def _pragmas_sqlite_lectura(dbapi_conn, _record):
+    cur = dbapi_conn.cursor()
+    _pragmas_comunes(cur)
+    cur.execute("PRAGMA query_only=ON")
+    cur.close()
+
+
+def crear_engine(url: str):
+    if not es_sqlite(url):
+        return create_engine(url, echo=False)
+
+    nuevo = create_engine(
+        url,
+        echo=False,
+        connect_args={
+            "check_same_thread": False,  # ← necesario en SQLite
+            "timeout": settings.SQLITE_BUSY_TIMEOUT_MS / 1000,
+        },
+    )
+    event.listen(nuevo, "connect", _pragmas_sqlite)
+    return nuevo
+
+
+def crear_engine_lectura(url: str, escritura=None):
+    """
+    Engine de SOLO LECTURA para informes y cuadros de mando.
+    - SQLite: fichero abierto con mode=ro + PRAGMA query_only. Con WAL los
+      lectores no esperan al escritor (ni al revés).
+    - Otros: transacciones read-only por defecto.
+    SQLite en memoria no admite una segunda conexión → se reutiliza el de
+    escritura.
+    """
+    if not es_sqlite(url):
+        return create_engine(
+            url,
+            echo=False,
+            connect_args={"options": "-c default_transaction_read_only=on"},
+        )
+
+    ruta = make_url(url).database
+    if not ruta or ruta == ":memory:":
+        return escritura or crear_engine(url)
+
+    nuevo = create_engine(
+        f"sqlite:///file:{ruta}?mode=ro&uri=true",
+        echo=False,
+        connect_args={
+            "check_same_thread": False,
+            "timeout": settings.SQLITE_BUSY_TIMEOUT_MS / 1000,
+        },
+    )
+    event.listen(nuevo, "connect", _pragmas_sqlite_lectura)
+    return nuevo
+
+
+engine = crear_engine(settings.DATABASE_URL)
+read_engine = crear_engine_lectura(settings.DATABASE_URL, engine)
+
+def _empresa_request(request: Request) -> int | None:
+    sesion = request.session or {}
+    empresa_id = sesion.get("empresa_id") or (sesion.get("user") or {}).get("empresa_id")
+    return int(empresa_id) if empresa_id else None
+
+
+def _sesion_request(request: Request, lectura: bool) -> Session:
+    if settings.DB_SHARDING:
+        # Con una BD por empresa, la de la empresa de la sesión HTTP
+        from app.db.shards import sesion_empresa
+        return sesion_empresa(_empresa_request(request), lectura=lectura)
+
+    return Session(read_engine if lectura else engine)
+
+
+def get_session(request: Request):
+    with _sesion_request(request, lectura=False) as session:
+        yield session
+
+
+def get_read_session(request: Request):
+    """Sesión de solo lectura: endpoints que únicamente consultan."""
+    with _sesion_request(request, lectura=True) as session:
         yield session
@@ -0,0 +1,348 @@
+# app/db/shards.py
+from __future__ import annotations
+
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine, make_url
+from sqlmodel import Session, SQLModel, select
+
+import app.db.base  # noqa: F401  (registra todos los modelos)
+from app.core.config import settings
+from app.core.logger import logger
+from app.db.session import crear_engine, crear_engine_lectura, engine, es_sqlite, read_engine
+from app.models.almacenamiento import EntradaAlmacenamiento
+from app.models.blob import Blob, RutaBlob
+from app.models.empresa import Empresa
+from app.models.password_reset import PasswordReset
+from app.models.user import User
+
+
+# ============================================================
+# UNA BD SQLITE POR EMPRESA (opcional: DB_SHARDING)
+# ============================================================
+# BD principal (DATABASE_URL): usuarios, empresas, recuperación de
+# contraseña, catálogo de almacenamiento y almacén de blobs. Todo lo demás
+# vive en {DB_SHARDS_DIR}/empresa_{id}.db.
+#
+# Las sesiones llevan dos binds: User/Empresa/PasswordReset van a la BD
+# principal y el resto de modelos al fichero de la empresa, así que los
+# routers y servicios no cambian. No puede haber JOIN entre ambas.
+#
+# Los engines de cada empresa se abren bajo demanda y se guardan en un LRU
+# (DB_SHARDS_MAX_ENGINES); los que llevan DB_SHARDS_INACTIVIDAD segundos
+# sin usarse se cierran (dispose) en el siguiente acceso.
+#
+# Un fichero nuevo se crea con create_all y se sella en la cabeza de
+# alembic; después `alembic upgrade head` migra la principal y cada shard
+# (ver alembic/env.py).
+
+MODELOS_GLOBALES = (User, Empresa, PasswordReset, EntradaAlmacenamiento, Blob, RutaBlob)
+TABLAS_GLOBALES = {m.__table__.name for m in MODELOS_GLOBALES}
+
+_ALEMBIC_DIR = Path(__file__).resolve().parents[2] / "alembic"
+_PATRON_SHARD = re.compile(r"^empresa_(\d+)\.db$")
+_BARRIDO_CADA = 30.0
+
+
+def ruta_shard(empresa_id: int) -> Path:
+    return Path(settings.DB_SHARDS_DIR) / f"empresa_{int(empresa_id)}.db"
+
+
+def url_shard(empresa_id: int) -> str:
+    return f"sqlite:///{ruta_shard(empresa_id)}"
+
+
+def empresas_con_shard() -> list[int]:
+    """Empresas que ya tienen fichero propio."""
+    carpeta = Path(settings.DB_SHARDS_DIR)
+    if not carpeta.is_dir():
+        return []
+
+    ids = []
+    for fichero in carpeta.iterdir():
+        m = _PATRON_SHARD.match(fichero.name)
+        if m:
+            ids.append(int(m.group(1)))
+    return sorted(ids)
+
+
+def bds_de_empresas() -> list[int | None]:
+    """
+    Una entrada por BD con datos de empresa, para recorridos en segundo
+    plano con sesion_empresa(): sin sharding, [None] (la principal).
+    """
+    return empresas_con_shard() if settings.DB_SHARDING else [None]
+
+
+def _tablas_empresa():
+    return [t for t in SQLModel.metadata.sorted_tables if t.name not in TABLAS_GLOBALES]
+
+
+# ============================================================
+# CREACIÓN DE UN SHARD
+# ============================================================
+
+def _sellar_migraciones(eng: Engine):
+    """Marca el fichero nuevo como migrado a la cabeza actual de alembic."""
+    from alembic.runtime.migration import MigrationContext
+    from alembic.script import ScriptDirectory
+
+    script = ScriptDirectory(str(_ALEMBIC_DIR))
+
+    with eng.begin() as conn:
+        MigrationContext.configure(conn).stamp(script, "heads")
+
+
+def _crear_shard(empresa_id: int, eng: Engine):
+    SQLModel.metadata.create_all(eng, tables=_tablas_empresa())
+    _sellar_migraciones(eng)
+    logger.info(f"[SHARDS] BD creada para empresa={empresa_id}: {ruta_shard(empresa_id)}")
+
+
+# ============================================================
+# LRU DE ENGINES
+# ============================================================
+
+@dataclass
+class _EnginesEmpresa:
+    escritura: Engine
+    lectura: Engine
+    ultimo_uso: float
+
+    def cerrar(self):
+        self.escritura.dispose()
+        if self.lectura is not self.escritura:
+            self.lectura.dispose()
+
+
+_engines: OrderedDict[int, _EnginesEmpresa] = OrderedDict()
+_lock = threading.Lock()
+_ultimo_barrido = 0.0
+
+
+def _purgar(ahora: float):
+    """Con _lock tomado: fuera los inactivos y lo que sobre del LRU."""
+    global _ultimo_barrido
+
+    limite = ahora - settings.DB_SHARDS_INACTIVIDAD
+    fuera = []
+
+    if ahora - _ultimo_barrido >= _BARRIDO_CADA:
+        _ultimo_barrido = ahora
+        fuera = [e for e, entrada in _engines.items() if entrada.ultimo_uso < limite]
+
+    while len(_engines) - len(fuera) > max(1, settings.DB_SHARDS_MAX_ENGINES):
+        candidato = next(e for e in _engines if e not in fuera)
+        fuera.append(candidato)
+
+    for empresa_id in fuera:
+        # dispose() no corta las conexiones en uso: se descartan al devolverse
+        _engines.pop(empresa_id).cerrar()
+
+
+def _engines_empresa(empresa_id: int) -> _EnginesEmpresa:
+    empresa_id = int(empresa_id)
+    ahora = time.monotonic()
+
+    with _lock:
+        entrada = _engines.get(empresa_id)
+
+        if entrada is None:
+            ruta = ruta_shard(empresa_id)
+            ruta.parent.mkdir(parents=True, exist_ok=True)
+            nuevo = not ruta.exists()
+
+            escritura = crear_engine(url_shard(empresa_id))
+            if nuevo:
+                _crear_shard(empresa_id, escritura)
+
+            entrada = _EnginesEmpresa(
+                escritura=escritura,
+                lectura=crear_engine_lectura(url_shard(empresa_id), escritura),
+                ultimo_uso=ahora,
+            )
+            _engines[empresa_id] = entrada
+
+        entrada.ultimo_uso = ahora
+        _engines.move_to_end(empresa_id)
+        _purgar(ahora)
+
+        return entrada
+
+
+def engines_abiertos() -> dict[int, Engine]:
+    with _lock:
+        return {e: entrada.escritura for e, entrada in _engines.items()}
+
+
+def cerrar_engines():
+    with _lock:
+        while _engines:
+            _engines.popitem()[1].cerrar()
+
+
+# ============================================================
+# SESIONES
+# ============================================================
+
+def sesion_empresa(empresa_id: int | None, *, lectura: bool = False) -> Session:
+    """
+    Sesión para los datos de una empresa (usar con `with`).
+    Sin DB_SHARDING, o sin empresa, es una sesión normal de la BD principal.
+    """
+    principal = read_engine if lectura else engine
+
+    if not settings.DB_SHARDING or not empresa_id:
+        return Session(principal)
+
+    entrada = _engines_empresa(empresa_id)
+
+    return Session(
+        bind=entrada.lectura if lectura else entrada.escritura,
+        binds={modelo: principal for modelo in MODELOS_GLOBALES},
+    )
+
+
+@contextmanager
+def datos_empresa(session: Session, empresa_id: int):
+    """
+    Para crear las filas propias de una empresa junto a la Empresa (alta,
+    setup). Sin sharding es la misma sesión (un solo commit, del llamador);
+    con sharding es la del fichero de la empresa y se confirma al salir.
+
+    Con sharding no hay transacción común: se confirma PRIMERO la principal
+    (Empresa, User...) y después el fichero de la empresa. Al revés, un
+    fallo de la principal dejaría filas huérfanas en empresa_{id}.db que
+    heredaría la siguiente empresa con ese id. Si falla el fichero, la
+    empresa queda sin su Emisor / ConfiguracionSistema por defecto, que
+    las pantallas de configuración crean al no encontrarlos.
+    """
+    if not settings.DB_SHARDING:
+        yield session
+        return
+
+    with sesion_empresa(empresa_id) as tenant:
+        yield tenant
+        session.commit()
+
+        try:
+            tenant.commit()
+        except Exception:
+            logger.exception(
+                f"Empresa {empresa_id} creada sin sus datos por defecto "
+                f"(fallo en {ruta_shard(empresa_id).name})"
+            )
+            raise
+
+
+def checkpoint_shards(modo: str = "PASSIVE"):
+    """Checkpoint del WAL de los shards abiertos (hilo de sqlite_wal)."""
+    for empresa_id, eng in engines_abiertos().items():
+        try:
+            with eng.connect() as conn:
+                conn.execute(text(f"PRAGMA wal_checkpoint({modo})"))
+        except Exception as e:
+            logger.warning(f"[SHARDS] Checkpoint fallido empresa={empresa_id}: {e}")
+
+
+# ============================================================
+# DIVIDIR UNA BD COMBINADA
+# ============================================================
+# Copia las filas de cada empresa de la BD principal a su fichero.
+# Idempotente (INSERT OR IGNORE): se puede relanzar. La BD principal no se
+# modifica; con DB_SHARDING activo sus tablas de empresa dejan de leerse.
+# La principal debe estar migrada a la cabeza antes de dividir.
+
+_FILTROS = {
+    "auditoria": "company_id = :empresa_id",
+    "lineafactura": "factura_id IN (SELECT id FROM principal.factura WHERE empresa_id = :empresa_id)",
+    "envios_email": "factura_id IN (SELECT id FROM principal.factura WHERE empresa_id = :empresa_id)",
+    # IVA sin empresa = tipos comunes: cada empresa recibe su copia
+    "iva": "empresa_id = :empresa_id OR empresa_id IS NULL",
+    # Catálogo de conceptos compartido (sin empresa_id): copia completa
+    "concepto": "1 = 1",
+}
+
+
+def _filtro(tabla) -> str:
+    if tabla.name in _FILTROS:
+        return _FILTROS[tabla.name]
+    if "empresa_id" in tabla.c:
+        return "empresa_id = :empresa_id"
+    raise RuntimeError(f"Tabla sin regla de reparto por empresa: {tabla.name}")
+
+
+def dividir_empresa(empresa_id: int) -> dict[str, int]:
+    """Copia a su shard las filas de una empresa. Devuelve filas por tabla."""
+    if not es_sqlite(settings.DATABASE_URL):
+        raise RuntimeError("Solo se puede dividir una BD principal SQLite")
+
+    principal = make_url(settings.DATABASE_URL).database
+    copiadas = {}
+
+    eng = _engines_empresa(empresa_id).escritura
+
+    with eng.connect() as conn:
+        # ATTACH no se admite dentro de una transacción: antes del primer INSERT
+        conn.exec_driver_sql("ATTACH DATABASE ? AS principal", (principal,))
+        try:
+            for tabla in _tablas_empresa():
+                columnas = ", ".join(f'"{c.name}"' for c in tabla.c)
+                resultado = conn.execute(
+                    text(
+                        f'INSERT OR IGNORE INTO main."{tabla.name}" ({columnas}) '
+                        f'SELECT {columnas} FROM principal."{tabla.name}" '
+                        f"WHERE {_filtro(tabla)}"
+                    ),
+                    {"empresa_id": empresa_id},
+                )
+                copiadas[tabla.name] = resultado.rowcount
+            conn.commit()
+        finally:
+            conn.exec_driver_sql("DETACH DATABASE principal")
+
+    return copiadas
+
+
+def dividir_todas() -> dict[int, dict[str, int]]:
+    with Session(engine) as session:
+        empresas = session.exec(select(Empresa.id).order_by(Empresa.id)).all()
+
+    return {e: dividir_empresa(e) for e in empresas}
+
+
+# ============================================================
+# CLI
+# ============================================================
+# python -m app.db.shards dividir [--empresa ID]
+# python -m app.db.shards listar
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="BD SQLite por empresa")
+    sub = parser.add_subparsers(dest="orden", required=True)
+
+    p_dividir = sub.add_parser("dividir", help="Copiar cada empresa a su fichero")
+    p_dividir.add_argument("--empresa", type=int, help="Solo esta empresa")
+    sub.add_parser("listar", help="Ficheros de empresa existentes")
+
+    args = parser.parse_args()
+
+    if args.orden == "listar":
+        salida = {e: str(ruta_shard(e)) for e in empresas_con_shard()}
+    elif args.empresa:
+        salida = {args.empresa: dividir_empresa(args.empresa)}
+    else:
+        salida = dividir_todas()
+
+    cerrar_engines()
+    print(json.dumps(salida, indent=2, ensure_ascii=False))
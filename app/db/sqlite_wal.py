@@ -0,0 +1,112 @@
+# app/db/sqlite_wal.py
+from __future__ import annotations
+
+import os
+import threading
+import time
+
+from sqlalchemy import text
+
+from app.core.config import settings
+from app.core.logger import logger
+from app.db.session import engine, es_sqlite
+from app.db.shards import checkpoint_shards
+
+
+# ============================================================
+# CHECKPOINT DEL WAL EN SEGUNDO PLANO
+# ============================================================
+# SQLite hace checkpoints PASSIVE automáticos, pero con lectores continuos
+# el fichero -wal puede crecer sin límite. Este hilo lanza
+# wal_checkpoint(TRUNCATE) cada SQLITE_CHECKPOINT_INTERVALO segundos y
+# guarda el resultado para el endpoint de salud. Con DB_SHARDING también
+# hace un checkpoint PASSIVE de los ficheros de empresa abiertos.
+
+_parar = threading.Event()
+_hilo: threading.Thread | None = None
+
+_estado = {
+    "ultimo_checkpoint": None,   # epoch
+    "busy": None,
+    "paginas_wal": None,
+    "paginas_copiadas": None,
+    "error": None,
+}
+
+
+def _ruta_bd() -> str | None:
+    if not es_sqlite(settings.DATABASE_URL):
+        return None
+    return engine.url.database
+
+
+def checkpoint(modo: str = "TRUNCATE") -> dict:
+    with engine.connect() as conn:
+        busy, log, copiadas = conn.execute(
+            text(f"PRAGMA wal_checkpoint({modo})")
+        ).one()
+
+    _estado.update(
+        ultimo_checkpoint=time.time(),
+        busy=busy,
+        paginas_wal=log,
+        paginas_copiadas=copiadas,
+        error=None,
+    )
+    return dict(_estado)
+
+
+def estado_wal() -> dict:
+    """Tamaño del WAL y antigüedad/resultado del último checkpoint."""
+    ruta = _ruta_bd()
+    if not ruta:
+        return {"sqlite": False}
+
+    wal = f"{ruta}-wal"
+    ultimo = _estado["ultimo_checkpoint"]
+
+    with engine.connect() as conn:
+        modo = conn.execute(text("PRAGMA journal_mode")).scalar()
+
+    return {
+        "sqlite": True,
+        "journal_mode": modo,
+        "wal_bytes": os.path.getsize(wal) if os.path.exists(wal) else 0,
+        "segundos_desde_checkpoint": round(time.time() - ultimo, 1) if ultimo else None,
+        # páginas del WAL que el último checkpoint no pudo copiar (lectores activos)
+        "paginas_pendientes": (
+            (_estado["paginas_wal"] or 0) - (_estado["paginas_copiadas"] or 0)
+            if ultimo else None
+        ),
+        "ultimo_busy": _estado["busy"],
+        "error": _estado["error"],
+    }
+
+
+def _bucle():
+    while not _parar.wait(settings.SQLITE_CHECKPOINT_INTERVALO):
+        try:
+            checkpoint()
+        except Exception as e:
+            _estado["error"] = str(e)
+            logger.warning(f"[SQLITE] Checkpoint fallido: {e}")
+
+        if settings.DB_SHARDING:
+            checkpoint_shards()
+
+
+def iniciar_checkpoints_wal():
+    global _hilo
+
+    if not _ruta_bd() or settings.SQLITE_CHECKPOINT_INTERVALO <= 0:
+        return
+    if _hilo and _hilo.is_alive():
+        return
+
+    _parar.clear()
+    _hilo = threading.Thread(target=_bucle, name="sqlite-checkpoint", daemon=True)
+    _hilo.start()
+
+
+def detener_checkpoints_wal():
+    _parar.set()
@@ -8,6 +8,15 @@ from fastapi.responses import FileResponse
 from jinja2 import pass_context
 from app.db.session import engine
 from app.db.base import init_db
+from app.db.shards import cerrar_engines, datos_empresa, sesion_empresa
+from app.db.sqlite_wal import iniciar_checkpoints_wal, detener_checkpoints_wal
+from app.services.verifactu_outbox import iniciar_outbox_verifactu, detener_outbox_verifactu
+from app.services.email_outbox import iniciar_email_outbox, detener_email_outbox
+from app.services.smtp_service import cerrar_conexiones_smtp
+from app.services.cache_http import ArchivosEstaticos
+from app.services.catalogo_almacenamiento import iniciar_catalogo_almacenamiento, detener_catalogo_almacenamiento
+from app.services.verifactu_http import cerrar_clientes, cerrar_clientes_async
+from app.services.verificador_cadena import iniciar_verificacion_programada, detener_verificacion_programada
 
 # =========================
 # MODELOS BASE
@@ -41,6 +50,7 @@ from app.routers import registro
 from app.routers import usuarios
 from app.routers import debug
 from app.routers.storage import router as storage_router
+from app.routers.health import router as health_router
 
 router = APIRouter()
 
@@ -69,7 +79,7 @@ DATA_DIR = Path("/data")
 if DATA_DIR.exists():
     app.mount(
         "/data",
-        StaticFiles(directory=str(DATA_DIR)),
+        ArchivosEstaticos(directory=str(DATA_DIR)),
         name="data_files"
     )
 # ============================================================
@@ -100,7 +110,7 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 PDF_ROOT = BASE_DIR / "facturas_pdf"
 PDF_ROOT.mkdir(exist_ok=True)
 
-app.mount("/pdf", StaticFiles(directory=PDF_ROOT), name="pdf")
+app.mount("/pdf", ArchivosEstaticos(directory=PDF_ROOT), name="pdf")
 
 
 # ============================================================
@@ -118,7 +128,7 @@ UPLOADS_DIR.mkdir(parents=True, exist_ok=True)
 
 app.mount(
     "/uploads",
-    StaticFiles(directory=str(UPLOADS_DIR)),
+    ArchivosEstaticos(directory=str(UPLOADS_DIR)),
     name="uploads",
 )
 
@@ -146,36 +156,58 @@ def on_startup():
 
         empresa_id = empresa.id
 
-        # =========================
-        # EMISOR LIGADO A EMPRESA
-        # =========================
-        emisor = session.exec(
-            select(Emisor).where(Emisor.empresa_id == empresa_id)
-        ).first()
-
-        if not emisor:
-            emisor = Emisor(
-                empresa_id=empresa_id
-            )
-            session.add(emisor)
+        with datos_empresa(session, empresa_id) as datos:
+            # =========================
+            # EMISOR LIGADO A EMPRESA
+            # =========================
+            emisor = datos.exec(
+                select(Emisor).where(Emisor.empresa_id == empresa_id)
+            ).first()
 
-        # =========================
-        # CONFIG POR EMPRESA
-        # =========================
-        config = session.exec(
-            select(ConfiguracionSistema).where(
-                ConfiguracionSistema.empresa_id == empresa_id
-            )
-        ).first()
+            if not emisor:
+                emisor = Emisor(
+                    empresa_id=empresa_id
+                )
+                datos.add(emisor)
+
+            # =========================
+            # CONFIG POR EMPRESA
+            # =========================
+            config = datos.exec(
+                select(ConfiguracionSistema).where(
+                    ConfiguracionSistema.empresa_id == empresa_id
+                )
+            ).first()
 
-        if not config:
-            config = ConfiguracionSistema(empresa_id=empresa_id)
-            session.add(config)
+            if not config:
+                config = ConfiguracionSistema(empresa_id=empresa_id)
+                datos.add(config)
 
         session.commit()
 
+    # Envíos Veri*Factu y emails en segundo plano (outbox con reintentos)
+    iniciar_checkpoints_wal()
+    iniciar_outbox_verifactu()
+    iniciar_email_outbox()
+    iniciar_verificacion_programada()
+    iniciar_catalogo_almacenamiento()
+
     print(">>> Sistema listo")
 
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    detener_outbox_verifactu()
+    detener_email_outbox()
+    detener_verificacion_programada()
+    detener_checkpoints_wal()
+    detener_catalogo_almacenamiento()
+    cerrar_engines()
+    cerrar_conexiones_smtp()
+    cerrar_clientes()
+    await cerrar_clientes_async()
+
+
 @app.get("/")
 async def root(request: Request):
     user = request.session.get("user")
@@ -212,7 +244,7 @@ def get_emisor_logo(context):
         if not empresa_id:
             return None
 
-        with Session(engine) as db:
+        with sesion_empresa(empresa_id) as db:
             emisor = db.exec(
                 select(Emisor).where(Emisor.empresa_id == empresa_id)
             ).first()
@@ -254,3 +286,4 @@ app.include_router(registro.router)
 app.include_router(usuarios.router)
 app.include_router(debug.router)
 app.include_router(storage_router)
+app.include_router(health_router)
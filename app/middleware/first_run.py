@@ -14,6 +14,9 @@ class FirstRunMiddleware(BaseHTTPMiddleware):
         if request.url.path.startswith("/setup"):
             return await call_next(request)
 
+        if request.url.path.startswith("/health"):
+            return await call_next(request)
+
         with Session(engine) as session:
             users = session.exec(select(User)).first()
 
@@ -0,0 +1,24 @@
+from sqlmodel import SQLModel, Field
+from typing import Optional
+from datetime import datetime
+
+
+class EntradaAlmacenamiento(SQLModel, table=True):
+    """
+    Catálogo de /data: una fila por archivo o carpeta (ruta relativa, "" es
+    la raíz). En carpetas, `tamano` y `archivos` son el total de todo lo que
+    cuelga de ella; en archivos, su tamaño y 1.
+    Lo mantienen los escritores de la app y lo reconcilia un escaneo
+    periódico (app/services/catalogo_almacenamiento.py).
+    """
+    __tablename__ = "almacenamiento_catalogo"
+
+    ruta: str = Field(primary_key=True)
+    padre: Optional[str] = Field(default=None, index=True)
+    es_dir: bool = False
+
+    tamano: int = 0
+    archivos: int = 0
+    mtime: Optional[float] = None
+
+    actualizado_en: datetime = Field(default_factory=datetime.utcnow)
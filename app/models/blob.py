@@ -0,0 +1,32 @@
+from sqlmodel import SQLModel, Field
+from typing import Optional
+from datetime import datetime
+
+
+class Blob(SQLModel, table=True):
+    """
+    Contenido único del almacén (/data/.blobs/ab/<sha256>). `referencias`
+    es el número de rutas lógicas (RutaBlob) que apuntan a él; con 0 lo
+    borra la recogida de basura (app/services/blobs.py).
+    """
+    __tablename__ = "blob"
+
+    sha256: str = Field(primary_key=True)
+    tamano: int = 0
+    referencias: int = Field(default=0, index=True)
+
+    creado_en: datetime = Field(default_factory=datetime.utcnow)
+
+
+class RutaBlob(SQLModel, table=True):
+    """
+    Ruta lógica de /data (relativa, con "/") → blob. En disco la ruta es un
+    enlace duro al blob, así que quien lee por ruta no nota la diferencia.
+    """
+    __tablename__ = "blob_ruta"
+
+    ruta: str = Field(primary_key=True)
+    sha256: str = Field(foreign_key="blob.sha256", index=True)
+    empresa_id: Optional[int] = Field(default=None, index=True)
+
+    actualizado_en: datetime = Field(default_factory=datetime.utcnow)
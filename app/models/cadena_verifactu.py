@@ -0,0 +1,26 @@
+from sqlmodel import SQLModel, Field
+from typing import Optional
+from datetime import datetime
+
+
+class CadenaVerifactu(SQLModel, table=True):
+    """
+    Cabeza de la cadena Veri*Factu por empresa (una fila por empresa).
+    Se bloquea con un UPDATE al inicio de cada validación y se avanza
+    en la MISMA transacción que inserta el RegistroVerifactu:
+    dos validaciones concurrentes nunca pueden bifurcar la cadena.
+    """
+    __tablename__ = "cadena_verifactu"
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    empresa_id: int = Field(foreign_key="empresa.id", unique=True, index=True)
+
+    ultimo_registro_id: Optional[int] = Field(
+        default=None, foreign_key="registroverifactu.id"
+    )
+    ultimo_hash: Optional[str] = None
+
+    # Nº de registros encadenados (= secuencia del último)
+    secuencia: int = 0
+
+    actualizado_en: datetime = Field(default_factory=datetime.utcnow)
@@ -0,0 +1,23 @@
+from sqlmodel import SQLModel, Field
+from typing import Optional
+from datetime import datetime
+
+
+class CheckpointVerifactu(SQLModel, table=True):
+    """
+    Punto de control de la verificación de la cadena Veri*Factu.
+    Afirma que los registros 1..secuencia de la empresa se verificaron y que
+    el de `secuencia` tenía `hash_actual`. Va firmado (HMAC con SECRET_KEY)
+    para que no se pueda "saltar" la verificación insertando filas a mano.
+    """
+    __tablename__ = "checkpoint_verifactu"
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    empresa_id: int = Field(foreign_key="empresa.id", index=True)
+
+    secuencia: int
+    registro_id: int = Field(foreign_key="registroverifactu.id")
+    hash_actual: str
+
+    firma: str
+    creado_en: datetime = Field(default_factory=datetime.utcnow)
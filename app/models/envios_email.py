@@ -1,21 +1,36 @@
 from datetime import datetime
 from typing import Optional
-from sqlmodel import SQLModel, Field, Session
-from app.db.session import engine
+from sqlalchemy import Index
+from sqlmodel import SQLModel, Field
 
 
 class EnviosEmail(SQLModel, table=True):
+    """
+    Email de factura. Es también la cola de salida (outbox):
+    PENDIENTE → ENVIANDO → OK | ERROR. Un ERROR con proximo_intento se
+    reintenta con backoff; sin proximo_intento es definitivo.
+    Ver app/services/email_outbox.py.
+    """
     __tablename__ = "envios_email"
+    __table_args__ = (
+        Index("ix_envios_email_estado_proximo", "estado", "proximo_intento"),
+    )
 
     id: Optional[int] = Field(default=None, primary_key=True)
+    empresa_id: Optional[int] = Field(default=None, foreign_key="empresa.id", index=True)
     factura_id: int = Field(foreign_key="factura.id")
     destinatario: str
     cc: Optional[str] = None
     asunto: str
     cuerpo: Optional[str] = None
     adjunto_pdf: bool = Field(default=True)
-    enviado_en: datetime = Field(default_factory=datetime.utcnow)
-    estado: str = Field(default="OK")
+    pdf_path: Optional[str] = None
+    lote: Optional[str] = Field(default=None, index=True)   # envío masivo
+    creado_en: datetime = Field(default_factory=datetime.utcnow)
+    enviado_en: Optional[datetime] = None
+    estado: str = Field(default="PENDIENTE")
+    intentos: int = Field(default=0)
+    proximo_intento: Optional[datetime] = None
     error: Optional[str] = None
 
 
@@ -28,8 +43,13 @@ def registrar_envio_email(
     adjunto_pdf: bool,
     estado: str = "OK",
     error: Optional[str] = None,
+    empresa_id: Optional[int] = None,
 ):
+    # Import diferido: app.db.shards importa todos los modelos
+    from app.db.shards import sesion_empresa
+
     envio = EnviosEmail(
+        empresa_id=empresa_id,
         factura_id=factura_id,
         destinatario=destinatario,
         cc=cc,
@@ -38,8 +58,9 @@ def registrar_envio_email(
         adjunto_pdf=adjunto_pdf,
         estado=estado,
         error=error,
+        enviado_en=datetime.utcnow() if estado == "OK" else None,
     )
-    with Session(engine) as session:
+    with sesion_empresa(empresa_id) as session:
         session.add(envio)
         session.commit()
         session.refresh(envio)
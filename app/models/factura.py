@@ -1,6 +1,7 @@
 from sqlmodel import SQLModel, Field, Relationship
 from typing import Optional, List
 from datetime import date, datetime
+from sqlalchemy import Index
 
 from app.models.cliente import Cliente
 from app.models.linea_factura import LineaFactura
@@ -43,8 +44,47 @@ class Factura(SQLModel, table=True):
     registros_verifactu: List["RegistroVerifactu"] = Relationship(
         back_populates="factura"
     )
+    desglose_iva: List["FacturaIvaDesglose"] = Relationship(
+        back_populates="factura"
+    )
+
+
+class FacturaIvaDesglose(SQLModel, table=True):
+    """
+    Base y cuota por tipo de IVA de una factura (una fila por tipo).
+    Se escribe al validar; los informes de IVA y el payload Veri*Factu
+    leen de aquí. empresa_id y fecha van copiados para poder resumir un
+    trimestre solo con el índice (empresa, fecha, tipo).
+    """
+    __tablename__ = "factura_iva_desglose"
+
+    __table_args__ = (
+        Index("ix_factura_iva_desglose_empresa_fecha_tipo", "empresa_id", "fecha", "tipo"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+
+    factura_id: int = Field(foreign_key="factura.id", index=True)
+    factura: Optional[Factura] = Relationship(back_populates="desglose_iva")
+
+    empresa_id: int = Field(foreign_key="empresa.id")
+    fecha: date
+
+    tipo: float          # %
+    base: float
+    cuota: float
 
 class RegistroVerifactu(SQLModel, table=True):
+    __table_args__ = (
+        # Una posición de la cadena = un registro (impide bifurcaciones)
+        Index(
+            "ux_registroverifactu_empresa_secuencia",
+            "empresa_id",
+            "secuencia",
+            unique=True,
+        ),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
 
     empresa_id: int = Field(
@@ -62,7 +102,18 @@ class RegistroVerifactu(SQLModel, table=True):
     hash_actual: str
     hash_anterior: Optional[str] = None
 
+    # Posición en la cadena de la empresa (1, 2, 3...)
+    secuencia: Optional[int] = None
+
+    # Formato del hash (ver services/hash_verifactu.py); 1 = histórico JSON
+    version_hash: int = 2
+
     fecha_registro: datetime = Field(default_factory=datetime.utcnow)
 
-    estado_envio: str = Field(default="PENDIENTE")  # PENDIENTE | ENVIADO | ERROR
-    error_envio: Optional[str] = None
\ No newline at end of file
+    estado_envio: str = Field(default="PENDIENTE", index=True)  # PENDIENTE | ENVIADO | ERROR
+    error_envio: Optional[str] = None
+
+    # Outbox de envío (reintentos con backoff)
+    intentos_envio: int = 0
+    proximo_intento: Optional[datetime] = None
+    enviado_en: Optional[datetime] = None
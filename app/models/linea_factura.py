@@ -18,4 +18,7 @@ class LineaFactura(SQLModel, table=True):
     descripcion: str
     cantidad: float = 1.0
     precio_unitario: float = 0.0
+
+    # Tipo de IVA de la línea (%). None → IVA global de la factura
+    iva: Optional[float] = None
     total: float = 0.0
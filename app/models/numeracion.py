@@ -0,0 +1,28 @@
+from sqlmodel import SQLModel, Field
+from typing import Optional
+from datetime import datetime
+from sqlalchemy import UniqueConstraint
+
+
+class ContadorNumeracion(SQLModel, table=True):
+    """
+    Contador de numeración por (empresa, serie, año).
+    Se incrementa SIEMPRE con un único UPDATE ... RETURNING,
+    nunca leyendo y escribiendo desde Python.
+    """
+    __tablename__ = "contador_numeracion"
+
+    __table_args__ = (
+        UniqueConstraint("empresa_id", "serie", "anio", name="uq_contador_numeracion"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    empresa_id: int = Field(foreign_key="empresa.id", index=True)
+
+    serie: str = ""
+    anio: int
+
+    # Último correlativo ENTREGADO (0 = ninguno todavía)
+    ultimo_numero: int = 0
+
+    actualizado_en: datetime = Field(default_factory=datetime.utcnow)
@@ -1,10 +1,13 @@
-from fastapi import APIRouter, Request, Depends, Query
-from fastapi.responses import HTMLResponse
+from fastapi import APIRouter, Request, Depends, Query, HTTPException
+from fastapi.responses import HTMLResponse, JSONResponse
 from sqlmodel import Session, select
 from datetime import datetime, date
-from app.db.session import get_session
+from app.db.session import get_read_session, get_session
 from app.core.templates import templates
 from app.models.auditoria import Auditoria
+from app.routers.usuarios import require_admin
+from app.services.verificador_cadena import verificar_cadena
+from app.services.verifactu_outbox import reencolar_errores, resumen_outbox
 
 router = APIRouter(prefix="/auditoria", tags=["Auditoría"])
 
@@ -18,9 +21,13 @@ def auditoria_list(
     resultado: str | None = Query(None),
     fecha_desde: date | None = Query(None),
     fecha_hasta: date | None = Query(None),
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_read_session),
 ):
-    query = select(Auditoria)
+    empresa_id = request.session.get("empresa_id")
+    if not empresa_id:
+        raise HTTPException(401, "Sesión no iniciada o empresa no seleccionada")
+
+    query = select(Auditoria).where(Auditoria.company_id == empresa_id)
 
     if entidad:
         query = query.where(Auditoria.entidad == entidad)
@@ -61,3 +68,52 @@ def auditoria_list(
             },
         },
     )
+
+
+# ============================================================
+# VERIFICACIÓN DE LA CADENA VERI*FACTU (solo admin)
+# ============================================================
+@router.post("/verifactu/verificar-cadena", response_class=JSONResponse)
+def auditoria_verificar_cadena(
+    request: Request,
+    desde_cero: bool = Query(False),
+):
+    require_admin(request)
+
+    empresa_id = request.session.get("empresa_id")
+    if not empresa_id:
+        raise HTTPException(401, "Sesión no iniciada o empresa no seleccionada")
+
+    return verificar_cadena(empresa_id, desde_cero=desde_cero).dict()
+
+
+# ============================================================
+# COLA DE ENVÍO VERI*FACTU (solo admin)
+# ============================================================
+@router.get("/verifactu/outbox", response_class=JSONResponse)
+def auditoria_verifactu_outbox(
+    request: Request,
+    session: Session = Depends(get_read_session),
+):
+    require_admin(request)
+
+    empresa_id = request.session.get("empresa_id")
+    if not empresa_id:
+        raise HTTPException(401, "Sesión no iniciada o empresa no seleccionada")
+
+    return resumen_outbox(session, empresa_id)
+
+
+@router.post("/verifactu/reencolar", response_class=JSONResponse)
+def auditoria_verifactu_reencolar(
+    request: Request,
+    session: Session = Depends(get_session),
+):
+    """Reintenta los registros en ERROR (cadena detenida tras agotar intentos)."""
+    require_admin(request)
+
+    empresa_id = request.session.get("empresa_id")
+    if not empresa_id:
+        raise HTTPException(401, "Sesión no iniciada o empresa no seleccionada")
+
+    return {"ok": True, "reencolados": reencolar_errores(session, empresa_id)}
@@ -16,6 +16,10 @@ from app.db.session import get_session
 from app.core.templates import templates
 from app.models.emisor import Emisor
 from app.models.factura import Factura
+from app.services.numerador import reiniciar_contadores
+from app.services.blobs import RAIZ, guardar_bytes, soltar_blobs, trasladar_carpeta
+from app.services.catalogo_almacenamiento import olvidar_ruta
+from app.services.resolver_ruta import pdfs_de_empresa
 from cryptography.hazmat.primitives.serialization import pkcs12
 from cryptography.x509.oid import NameOID
 
@@ -179,8 +183,7 @@ async def emisor_upload_logo(
 
     try:
         contenido = await file.read()
-        with open(path, "wb") as f:
-            f.write(contenido)
+        guardar_bytes(path, contenido, empresa_id=empresa_id)
     except Exception as e:
         raise HTTPException(500, f"No se pudo guardar el logo: {e}")
 
@@ -227,6 +230,8 @@ async def emisor_eliminar_logo(
     try:
         if file_path.exists():
             file_path.unlink()
+            soltar_blobs(file_path)
+            olvidar_ruta(file_path)
     except Exception as e:
         print("Error eliminando logo:", e)
 
@@ -297,9 +302,9 @@ async def emisor_upload_certificado(request: Request,
     if not emisor:
         raise HTTPException(404, "Emisor no encontrado")
 
-    path = CERT_DIR / "certificado.pfx"
-    with open(path, "wb") as f:
-        f.write(await file.read())
+    # Uno por empresa (antes certs/certificado.pfx era compartido)
+    path = CERT_DIR / str(empresa_id) / "certificado.pfx"
+    guardar_bytes(path, await file.read(), empresa_id=empresa_id)
 
     emisor.certificado_path = str(path)
     emisor.certificado_password = password
@@ -444,6 +449,16 @@ def guardar_ruta_pdf(
     # ================================
     # GUARDAR EN BD
     # ================================
+    # Los PDF ya generados se van con la carpeta (si no, quedan huérfanos)
+    anterior = (emisor.ruta_facturas or "").strip().replace("\\", "/").split("/")[-1]
+    if anterior and anterior != ruta_pdf:
+        trasladar_carpeta(
+            RAIZ / anterior,
+            RAIZ / ruta_pdf,
+            empresa_id=empresa_id,
+            propios=pdfs_de_empresa(session, empresa_id),
+        )
+
     # USAMOS ruta_facturas como carpeta lógica definitiva
     emisor.ruta_facturas = ruta_pdf
     session.add(emisor)
@@ -493,6 +508,8 @@ def guardar_numeracion(request: Request,
     emisor.siguiente_numero = 1
     emisor.ultimo_anio_numerado = None
 
+    reiniciar_contadores(session, empresa_id, year)
+
     session.commit()
     return RedirectResponse("/configuracion/emisor?tab=numeracion", status_code=303)
 
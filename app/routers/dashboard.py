@@ -5,7 +5,7 @@ from sqlalchemy import extract, func, or_
 from datetime import date, timedelta
 import os
 
-from app.db.session import get_session
+from app.db.session import get_read_session
 from app.models.factura import Factura
 from app.models.cliente import Cliente
 from app.models.emisor import Emisor
@@ -20,7 +20,7 @@ router = APIRouter(tags=["Dashboard"])
 @router.get("/dashboard", response_class=HTMLResponse)
 def dashboard(
     request: Request,
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_read_session),
     cliente_id: str | None = Query(None),
     estado: str | None = Query(None),
     year: str | None = Query(None),
@@ -1,21 +1,34 @@
 # app/routers/debug.py
-from fastapi import APIRouter
-from pathlib import Path
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query
+
+from app.services.catalogo_almacenamiento import RAIZ
+from app.services.explorador import LIMITE_DEFECTO, listar_directorio
 
 router = APIRouter(prefix="/debug", tags=["debug"])
 
 @router.get("/uploads")
-def listar_uploads():
-    base = Path("/data/uploads")
+def listar_uploads(
+    cursor: Optional[str] = Query(None),
+    limite: int = Query(LIMITE_DEFECTO),
+):
+    # Un nivel y por páginas: pide la siguiente con ?cursor=<siguiente>
+    base = RAIZ / "uploads"
     if not base.exists():
-        return {"exists": False, "message": "/data/uploads NO existe"}
+        return {"exists": False, "message": f"{base} NO existe"}
+
+    try:
+        pagina = listar_directorio(base, cursor=cursor, limite=limite, ocultos=True)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
 
-    archivos = []
-    for p in base.rglob("*"):
-        archivos.append(str(p))
+    archivos = [str(base / item["nombre"]) for item in pagina["items"]]
 
     return {
         "exists": True,
         "base": str(base),
-        "items": archivos or "VACÍO"
+        "items": archivos or "VACÍO",
+        "siguiente": pagina["siguiente"],
+        "total": pagina["total"],
     }
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Request, Depends, Form, HTTPException, Query, Body
+from fastapi import APIRouter, Request, Depends, Form, HTTPException, Query, Body, BackgroundTasks
 from fastapi.responses import HTMLResponse, RedirectResponse
 from sqlmodel import Session, select, delete
 from datetime import date
@@ -18,7 +18,7 @@ from app.models.factura import Factura
 from app.services.facturas_pdf import generar_factura_pdf
 from app.services.control_verifactu import verificar_verifactu
 from app.services.control_sistema import validar_fecha_factura, bloquear_edicion_factura, bloquear_borrado_factura
-from app.services.facturas_service import generar_numero_factura, bloquear_numeracion, recalcular_totales  
+from app.services.facturas_service import generar_numero_factura, bloquear_numeracion, recalcular_totales_lote, calcular_totales_facturas, aplicar_totales, guardar_desglose_iva, previsualizar_numeros_factura
 from app.services.decoradores_factura import bloquear_si_factura_inmutable
 from app.services.auditoria_service import auditar
 from app.constants.auditoria import EV_FISCAL, RES_OK, RES_ERROR
@@ -28,9 +28,12 @@ from app.models.auditoria import Auditoria
 from app.services.resumen_fiscal_service import calcular_estado_fiscal
 from app.constants.auditoria import RES_OK, RES_ERROR
 from app.services.verifactu_envio import enviar_a_aeat
-from app.services.email_service import run_async, enviar_email_factura_construido
+from app.services.email_outbox import encolar_email, reencolar_errores, resumen_emails
+from app.services.email_masivo import FiltroEmailMasivo, iniciar_email_masivo, progreso_email_masivo
 from app.utils.session_empresa import get_empresa_id
 from app.services.resolver_ruta import resolver_ruta_pdf_factura
+from app.services.verifactu_qr import QR_MM_MAX, QR_MM_MIN, construir_url_qr, generar_qr_lote
+from app.services.validacion_lote import validar_facturas_lote, procesar_post_validacion_lote
 router = APIRouter(prefix="/facturas", tags=["Facturas"])
 
 # ========= FACTURAS =========
@@ -569,14 +572,8 @@ def factura_preview_validacion(request: Request,
 
     if not emisor:
         raise HTTPException(400, "No hay configuración del emisor para esta empresa")
-    year = fecha.year
 
-    if emisor.ultimo_anio_numerado != year:
-        correlativo = 1
-    else:
-        correlativo = emisor.siguiente_numero or 1
-
-    numero_preview = f"{year}-{correlativo:04d}"
+    numero_preview = previsualizar_numeros_factura(session, emisor, fecha)[0]
 
     return {
         "ok": True,
@@ -733,7 +730,8 @@ def validar_factura(
         select(LineaFactura).where(LineaFactura.factura_id == factura_id)
     ).all()
 
-    recalcular_totales(factura, lineas)
+    totales = recalcular_totales_lote([(factura, lineas)])[0]
+    guardar_desglose_iva(session, factura, totales)
 
     # ============================
     # 6) VeriFactu
@@ -741,6 +739,8 @@ def validar_factura(
     try:
         verificar_verifactu(factura, session)
     except HTTPException as e:
+        # Antes de auditar (hace commit): el número reservado vuelve al contador
+        session.rollback()
         auditar(
             session,
             entidad="FACTURA",
@@ -755,6 +755,7 @@ def validar_factura(
         )
         return {"ok": False, "error": e.detail}
     except Exception as e:
+        session.rollback()
         auditar(
             session,
             entidad="FACTURA",
@@ -784,6 +785,7 @@ def validar_factura(
     try:
         bloquear_numeracion(session, fecha, empresa_id)
     except HTTPException as e:
+        session.rollback()
         auditar(
             session,
             entidad="FACTURA",
@@ -796,9 +798,9 @@ def validar_factura(
             user_agent=get_user_agent(request) if request else None,
             request=request
         )
-        session.rollback()
         return {"ok": False, "error": e.detail}
     except Exception as e:
+        session.rollback()
         auditar(
             session,
             entidad="FACTURA",
@@ -811,7 +813,6 @@ def validar_factura(
             user_agent=get_user_agent(request) if request else None,
             request=request
         )
-        session.rollback()
         raise
 
     session.add(factura)
@@ -867,6 +868,60 @@ def validar_factura(
         "numero": numero
     }
 
+@router.post("/validar-lote")
+def validar_facturas_lote_endpoint(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    data: dict = Body(...),
+    session: Session = Depends(get_session),
+):
+    empresa_id = get_empresa_id(request)
+    if not empresa_id:
+        raise HTTPException(401, "Sesión no iniciada o empresa no seleccionada")
+
+    ids = data.get("ids") or []
+    if not isinstance(ids, list) or not ids:
+        raise HTTPException(400, "Debe indicar al menos una factura")
+
+    try:
+        ids = list(dict.fromkeys(int(i) for i in ids))
+    except (TypeError, ValueError):
+        raise HTTPException(400, "Identificadores de factura no válidos")
+
+    fecha = None
+    if data.get("fecha"):
+        try:
+            fecha = date.fromisoformat(data["fecha"])
+        except (TypeError, ValueError):
+            raise HTTPException(400, "Fecha no válida")
+
+    resultados, validadas, registros = validar_facturas_lote(
+        session,
+        empresa_id=empresa_id,
+        factura_ids=ids,
+        fecha=fecha,
+        mensaje_iva=data.get("mensaje_iva"),
+        request=request,
+    )
+
+    # ============================
+    # AEAT + PDF fuera de la transacción
+    # ============================
+    if validadas:
+        background_tasks.add_task(
+            procesar_post_validacion_lote,
+            empresa_id,
+            validadas,
+            registros,
+        )
+
+    return {
+        "ok": True,
+        "validadas": len(validadas),
+        "errores": len(resultados) - len(validadas),
+        "resultados": [r.dict() for r in resultados],
+    }
+
 @router.get("/min-date")
 def factura_min_date(request: Request, session: Session = Depends(get_session)):
 
@@ -893,13 +948,12 @@ def factura_min_date(request: Request, session: Session = Depends(get_session)):
 @router.get("/next-number")
 def factura_next_number(request: Request,
     fecha: date = Query(default=None),
+    cantidad: int = Query(default=1, ge=1, le=500),
     session: Session = Depends(get_session),
 ):
     if fecha is None:
         fecha = date.today()
 
-    year = fecha.year
-
     empresa_id = get_empresa_id(request)
     if not empresa_id:
         raise HTTPException(401, "Sesión no iniciada o empresa no seleccionada")
@@ -914,44 +968,14 @@ def factura_next_number(request: Request,
         )
 
     # ============================
-    # Última factura VALIDADA del año
-    # ============================
-    ultima = session.exec(
-        select(Factura)
-        .where(Factura.estado == "VALIDADA")
-        .where(Factura.empresa_id == emisor.empresa_id)
-        .where(Factura.numero.like(f"%{year}-%"))
-        .order_by(Factura.numero.desc())
-    ).first()
-
-    if not ultima or not ultima.numero:
-        correlativo = 1
-    else:
-        try:
-            parte_final = ultima.numero.split("-")[-1]
-            solo_numero = re.sub(r"\D", "", parte_final)
-            correlativo = int(solo_numero) + 1
-        except:
-            correlativo = 1
-
-    # ============================
-    # Formatos
+    # Misma plantilla y contador que la validación
     # ============================
-    if emisor.modo_numeracion == "BASICO":
-        numero = f"{year}-{correlativo:04d}"
-
-    elif emisor.modo_numeracion == "SERIE":
-        serie = (emisor.serie_facturacion or "A").upper()
-        numero = f"{serie}-{year}-{correlativo:04d}"
-
-    else:
-        raise HTTPException(
-            400, "Modo de numeración del emisor no válido"
-        )
+    numeros = previsualizar_numeros_factura(session, emisor, fecha, cantidad)
 
     return {
         "ok": True,
-        "numero": numero
+        "numero": numeros[0],
+        "numeros": numeros,
     }
 
 
@@ -1218,29 +1242,27 @@ def factura_anular(
         select(LineaFactura).where(LineaFactura.factura_id == factura.id)
     ).all()
 
-    subtotal = iva_total = 0
+    lineas_rect = []
 
     for l in originales:
         base = l.cantidad * l.precio_unitario
-        cuota = base * iva / 100
-
-        session.add(
-            LineaFactura(
-                factura_id=rect.id,
-                descripcion=f"(Rectific.) {l.descripcion}",
-                cantidad=-l.cantidad,
-                precio_unitario=l.precio_unitario,
-                total=-(base + cuota),
-                concepto_id=l.concepto_id
-            )
+        cuota = base * (l.iva if l.iva is not None else iva) / 100
+
+        linea = LineaFactura(
+            factura_id=rect.id,
+            descripcion=f"(Rectific.) {l.descripcion}",
+            cantidad=-l.cantidad,
+            precio_unitario=l.precio_unitario,
+            iva=l.iva,
+            total=-(base + cuota),
+            concepto_id=l.concepto_id
         )
+        session.add(linea)
+        lineas_rect.append(linea)
 
-        subtotal += -base
-        iva_total += -cuota
-
-    rect.subtotal = round(subtotal, 2)
-    rect.iva_total = round(iva_total, 2)
-    rect.total = round(subtotal + iva_total, 2)
+    totales = calcular_totales_facturas([(rect, lineas_rect)])[0]
+    aplicar_totales(rect, totales)
+    guardar_desglose_iva(session, rect, totales)
 
     session.commit()
 
@@ -1322,29 +1344,27 @@ def factura_rectificar(
         select(LineaFactura).where(LineaFactura.factura_id == factura.id)
     ).all()
 
-    subtotal = iva_total = 0
+    lineas_rect = []
 
     for l in originales:
         base = l.cantidad * l.precio_unitario
-        cuota = base * iva / 100
-
-        session.add(
-            LineaFactura(
-                factura_id=rect.id,
-                descripcion=f"(Rectific.) {l.descripcion}",
-                cantidad=-l.cantidad,
-                precio_unitario=l.precio_unitario,
-                total=-(base + cuota),
-                concepto_id=l.concepto_id
-            )
+        cuota = base * (l.iva if l.iva is not None else iva) / 100
+
+        linea = LineaFactura(
+            factura_id=rect.id,
+            descripcion=f"(Rectific.) {l.descripcion}",
+            cantidad=-l.cantidad,
+            precio_unitario=l.precio_unitario,
+            iva=l.iva,
+            total=-(base + cuota),
+            concepto_id=l.concepto_id
         )
+        session.add(linea)
+        lineas_rect.append(linea)
 
-        subtotal += -base
-        iva_total += -cuota
-
-    rect.subtotal = round(subtotal, 2)
-    rect.iva_total = round(iva_total, 2)
-    rect.total = round(subtotal + iva_total, 2)
+    totales = calcular_totales_facturas([(rect, lineas_rect)])[0]
+    aplicar_totales(rect, totales)
+    guardar_desglose_iva(session, rect, totales)
 
     session.commit()
 
@@ -1412,6 +1432,100 @@ def factura_pre_validar(request: Request,
     }
 
 
+# ===========================
+# QR VERI*FACTU POR LOTES (tickets / recibos)
+# ===========================
+@router.post("/qr/lote")
+def facturas_qr_lote(
+    request: Request,
+    data: dict = Body(...),
+    session: Session = Depends(get_session),
+):
+    empresa_id = get_empresa_id(request)
+    if not empresa_id:
+        raise HTTPException(401, "Sesión no iniciada o empresa no seleccionada")
+
+    ids = data.get("ids") or []
+    if not isinstance(ids, list) or not ids:
+        raise HTTPException(400, "Debe indicar al menos una factura")
+
+    # Ids del JSON: enteros o texto numérico ("12"); nada de true/1.5/null
+    validos = []
+    for valor in ids:
+        if isinstance(valor, bool) or not isinstance(valor, (int, str)):
+            raise HTTPException(400, "Identificadores de factura no válidos")
+        try:
+            validos.append(int(valor))
+        except ValueError:
+            raise HTTPException(400, "Identificadores de factura no válidos")
+    ids = list(dict.fromkeys(validos))
+
+    try:
+        size_mm = float(data.get("size_mm") or 35)
+    except (TypeError, ValueError):
+        raise HTTPException(400, "Tamaño de QR no válido")
+
+    # Rango que admite la AEAT; además, cada tamaño ocupa su hueco en la caché
+    if not QR_MM_MIN <= size_mm <= QR_MM_MAX:
+        raise HTTPException(400, f"El QR debe medir entre {QR_MM_MIN} y {QR_MM_MAX} mm")
+
+    emisor = session.exec(
+        select(Emisor).where(Emisor.empresa_id == empresa_id)
+    ).first()
+
+    if not emisor:
+        raise HTTPException(400, "No hay configuración del emisor para esta empresa")
+
+    config = session.exec(
+        select(ConfiguracionSistema).where(
+            ConfiguracionSistema.empresa_id == empresa_id
+        )
+    ).first()
+
+    if not config:
+        raise HTTPException(400, "No hay configuración del sistema")
+
+    facturas = session.exec(
+        select(Factura)
+        .where(Factura.empresa_id == empresa_id)
+        .where(Factura.id.in_(ids))
+    ).all()
+
+    entorno = "PRUEBAS" if config.verifactu_modo == "TEST" else "PRODUCCION"
+
+    urls = {}
+    resultados = []
+
+    for f in facturas:
+        try:
+            urls[f.id] = construir_url_qr(
+                factura=f,
+                emisor=emisor,
+                config=config,
+                entorno=entorno,
+                es_verifactu=bool(f.verifactu_hash),
+            )
+        except ValueError as e:
+            resultados.append({"id": f.id, "ok": False, "error": str(e)})
+
+    svgs = generar_qr_lote(list(urls.values()), size_mm=size_mm)
+
+    for factura_id, url in urls.items():
+        resultados.append({
+            "id": factura_id,
+            "ok": True,
+            "url": url,
+            "svg": svgs[url],
+        })
+
+    encontrados = {f.id for f in facturas}
+    for factura_id in ids:
+        if factura_id not in encontrados:
+            resultados.append({"id": factura_id, "ok": False, "error": "Factura no encontrada"})
+
+    return {"ok": True, "resultados": resultados}
+
+
 # ========= FIN FACTURAS =========
 
 
@@ -1449,22 +1563,7 @@ async def enviar_factura_email(request: Request,
             cc_list = [c.strip() for c in cc_raw if c.strip()]
 
     # =========================
-    # Guardar registro envío
-    # =========================
-    session.add(
-        EnviosEmail(
-            factura_id=factura_id,
-            destinatario=para,
-            cc=", ".join(cc_list) if cc_list else None,
-            asunto=asunto,
-            cuerpo=cuerpo,
-        )
-    )
-    session.commit()
-
-
-    # =========================
-    # PREPARAR TODO ANTES DEL HILO
+    # PREPARAR ENVÍO
     # =========================
     empresa_id = get_empresa_id(request)
     if not empresa_id:
@@ -1516,27 +1615,96 @@ async def enviar_factura_email(request: Request,
 
 
     # =========================
-    # 🚀 AHORA SÍ THREAD SIN BD
+    # A LA COLA (el outbox lo envía y reintenta)
     # =========================
-    run_async(
-        enviar_email_factura_construido,
-        smtp_config={
-            "host": config.smtp_host,
-            "port": config.smtp_port,
-            "user": config.smtp_user,
-            "password": config.smtp_password,
-            "ssl": config.smtp_ssl,
-            "tls": config.smtp_tls,
-        },
+    envio = encolar_email(
+        session,
+        empresa_id=empresa_id,
+        factura_id=factura_id,
         para=para,
         asunto=asunto,
         cuerpo=cuerpo,
         cc=cc_list,
         pdf_path=pdf_path,
-        remitente=config.smtp_user
     )
 
-    return {"ok": True, "mensaje": "Email en proceso de envío"}
+    return {"ok": True, "mensaje": "Email en cola de envío", "envio_id": envio.id}
+
+
+@router.get("/emails/resumen")
+def emails_resumen(
+    request: Request,
+    session: Session = Depends(get_session),
+):
+    """Estado de la cola de emails de la empresa."""
+    return resumen_emails(session, get_empresa_id(request))
+
+
+@router.post("/emails/reencolar")
+def emails_reencolar(
+    request: Request,
+    session: Session = Depends(get_session),
+):
+    """Reintenta los emails en error definitivo."""
+    return {"ok": True, "reencolados": reencolar_errores(session, get_empresa_id(request))}
+
+
+@router.post("/emails/masivo")
+def emails_masivo(
+    request: Request,
+    data: dict = Body(...),
+):
+    """
+    Envía por email las facturas validadas de un periodo a sus clientes.
+    Body: year, trimestre | desde, hasta; cliente_id; solo_no_enviadas;
+    asunto, cuerpo (marcadores {cliente} {numero} {fecha} {total} {empresa}).
+    """
+    empresa_id = get_empresa_id(request)
+
+    try:
+        filtro = FiltroEmailMasivo(
+            year=int(data["year"]) if data.get("year") else None,
+            trimestre=int(data["trimestre"]) if data.get("trimestre") else None,
+            desde=date.fromisoformat(data["desde"]) if data.get("desde") else None,
+            hasta=date.fromisoformat(data["hasta"]) if data.get("hasta") else None,
+            cliente_id=int(data["cliente_id"]) if data.get("cliente_id") else None,
+            solo_no_enviadas=bool(data.get("solo_no_enviadas", True)),
+        )
+    except (TypeError, ValueError):
+        raise HTTPException(400, "Filtro no válido")
+
+    if filtro.trimestre and filtro.trimestre not in (1, 2, 3, 4):
+        raise HTTPException(400, "Trimestre no válido")
+    if not (filtro.year or filtro.desde or filtro.hasta):
+        raise HTTPException(400, "Debe indicar un periodo")
+
+    try:
+        trabajo = iniciar_email_masivo(
+            empresa_id,
+            filtro,
+            asunto=(data.get("asunto") or "").strip() or None,
+            cuerpo=(data.get("cuerpo") or "").strip() or None,
+        )
+    except ValueError as e:
+        raise HTTPException(409, str(e))
+
+    return {
+        "ok": True,
+        "lote": trabajo.lote,
+        "progreso": f"/facturas/emails/masivo/{trabajo.lote}",
+    }
+
+
+@router.get("/emails/masivo/{lote}")
+def emails_masivo_progreso(
+    request: Request,
+    lote: str,
+    session: Session = Depends(get_session),
+):
+    progreso = progreso_email_masivo(session, get_empresa_id(request), lote)
+    if progreso is None:
+        raise HTTPException(404, "Envío masivo no encontrado")
+    return progreso
 
 
 @router.get("/offline", response_class=HTMLResponse)
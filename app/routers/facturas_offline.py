@@ -7,6 +7,7 @@ from app.db.session import get_session
 from app.models.factura import Factura
 from app.models.linea_factura import LineaFactura
 from app.models.empresa import Empresa   # ajusta si tu modelo se llama distinto
+from app.services.totales import calcular_totales
 from sqlmodel import select
 api_router = APIRouter(prefix="/api/offline", tags=["Offline"])
 
@@ -91,29 +92,31 @@ def sync_offline_factura(
     session.add(factura)
     session.flush()  # Para tener factura.id
 
-    subtotal = 0
-    iva_total = 0
-
-    for l in payload.lineas:
-        base = l.cantidad * l.precio_unitario
-        cuota = base * (l.iva / 100.0)
-
-        subtotal += base
-        iva_total += cuota
+    totales = calcular_totales(
+        facturas=[factura.id] * len(payload.lineas),
+        cantidades=[l.cantidad for l in payload.lineas],
+        precios=[l.precio_unitario for l in payload.lineas],
+        tipos_iva=[l.iva for l in payload.lineas],
+    )[factura.id]
 
+    for l, importe in zip(payload.lineas, totales.lineas_con_iva):
         linea = LineaFactura(
             factura_id=factura.id,
             descripcion=l.descripcion,
             cantidad=l.cantidad,
             precio_unitario=l.precio_unitario,
             iva=l.iva,
-            total=base + cuota,
+            total=float(importe),
         )
         session.add(linea)
 
-    factura.subtotal = subtotal
-    factura.iva_total = iva_total
-    factura.total = subtotal + iva_total
+    # Un único tipo → también como IVA global (lo usa la validación)
+    if len(totales.desglose) == 1:
+        factura.iva_global = float(next(iter(totales.desglose)))
+
+    factura.subtotal = float(totales.subtotal)
+    factura.iva_total = float(totales.iva_total)
+    factura.total = float(totales.total)
 
     session.commit()
     session.refresh(factura)
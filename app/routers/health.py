@@ -0,0 +1,24 @@
+# app/routers/health.py
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from sqlalchemy import text
+
+from app.db.session import engine
+from app.db.sqlite_wal import estado_wal
+
+router = APIRouter(prefix="/health", tags=["Salud"])
+
+
+@router.get("", response_class=JSONResponse)
+def health():
+    return {"ok": True}
+
+
+@router.get("/db", response_class=JSONResponse)
+def health_db():
+    try:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+        return {"ok": True, **estado_wal()}
+    except Exception as e:
+        return JSONResponse({"ok": False, "error": str(e)}, status_code=503)
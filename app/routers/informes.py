@@ -9,10 +9,12 @@ import csv
 from io import StringIO, BytesIO
 from openpyxl import Workbook
 
-from app.db.session import get_session
+from app.db.session import get_read_session
 from app.models.factura import Factura
 from app.models.cliente import Cliente
 from app.models.emisor import Emisor
+from app.services.cache_http import pdf_factura_validada, respuesta_archivo
+from app.services.resumen_iva import periodo_trimestre, resumen_iva
 from reportlab.lib.pagesizes import A4
 from reportlab.pdfgen import canvas
 from reportlab.lib.units import cm
@@ -22,11 +24,18 @@ from sqlalchemy import extract, func, case
 router = APIRouter(prefix="/informes", tags=["Informes"])
 
 
+def _empresa_sesion(request: Request) -> int:
+    empresa_id = request.session.get("empresa_id")
+    if not empresa_id:
+        raise HTTPException(401, "Sesión no iniciada o empresa no seleccionada")
+    return empresa_id
+
+
 
 @router.get("", response_class=HTMLResponse)
 def informes_home(
     request: Request,
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_read_session),
 ):
     return templates.TemplateResponse(
         "informes/index.html",
@@ -49,7 +58,7 @@ def servir_pdf(
     year: int,
     trimestre: str,
     filename: str,
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_read_session),
 ):
     # ============================
     # Multiempresa
@@ -95,10 +104,12 @@ def servir_pdf(
             f"El PDF no existe en el servidor ({ruta}).",
         )
 
-    return FileResponse(
+    return respuesta_archivo(
+        request,
         ruta,
         media_type="application/pdf",
         filename=filename,
+        inmutable=pdf_factura_validada(session, empresa_id, ruta),
     )
 
 
@@ -107,10 +118,15 @@ def servir_pdf(
 # ============================================================
 @router.get("/export/clientes.csv")
 def export_clientes_csv(
-    session: Session = Depends(get_session),
+    request: Request,
+    session: Session = Depends(get_read_session),
 ):
+    empresa_id = _empresa_sesion(request)
+
     clientes = session.exec(
-        select(Cliente).order_by(Cliente.nombre)
+        select(Cliente)
+        .where(Cliente.empresa_id == empresa_id)
+        .order_by(Cliente.nombre)
     ).all()
 
     buffer = StringIO()
@@ -155,8 +171,11 @@ def export_clientes_csv(
 # ============================================================
 @router.get("/export/clientes.xlsx")
 def export_clientes_excel(
-    session: Session = Depends(get_session),
+    request: Request,
+    session: Session = Depends(get_read_session),
 ):
+    empresa_id = _empresa_sesion(request)
+
     wb = Workbook()
     ws = wb.active
     ws.title = "Clientes"
@@ -174,7 +193,9 @@ def export_clientes_excel(
     ])
 
     clientes = session.exec(
-        select(Cliente).order_by(Cliente.nombre)
+        select(Cliente)
+        .where(Cliente.empresa_id == empresa_id)
+        .order_by(Cliente.nombre)
     ).all()
 
     for c in clientes:
@@ -211,12 +232,13 @@ def export_clientes_excel(
 # ============================================================
 @router.get("/export/facturas.csv")
 def export_facturas_csv(
+    request: Request,
     year: int | None = None,
     fecha_desde: date | None = None,
     fecha_hasta: date | None = None,
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_read_session),
 ):
-    query = select(Factura)
+    query = select(Factura).where(Factura.empresa_id == _empresa_sesion(request))
 
     if year:
         query = query.where(
@@ -268,10 +290,15 @@ def export_facturas_csv(
 
 @router.get("/export/clientes.pdf")
 def export_clientes_pdf(
-    session: Session = Depends(get_session),
+    request: Request,
+    session: Session = Depends(get_read_session),
 ):
+    empresa_id = _empresa_sesion(request)
+
     clientes = session.exec(
-        select(Cliente).order_by(Cliente.nombre)
+        select(Cliente)
+        .where(Cliente.empresa_id == empresa_id)
+        .order_by(Cliente.nombre)
     ).all()
 
     buffer = BytesIO()
@@ -325,7 +352,7 @@ def export_facturas_pdf(
     year: int | None = None,
     fecha_desde: date | None = None,
     fecha_hasta: date | None = None,
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_read_session),
 ):
     query = select(Factura).order_by(Factura.fecha)
 
@@ -409,51 +436,19 @@ def iva_trimestral_view(
     request: Request,
     year: int,
     trimestre: int,
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_read_session),
 ):
     if trimestre not in (1, 2, 3, 4):
         raise HTTPException(400, "Trimestre no válido")
 
-    meses = {
-        1: (1, 3),
-        2: (4, 6),
-        3: (7, 9),
-        4: (10, 12),
-    }[trimestre]
+    desde, hasta = periodo_trimestre(year, trimestre)
 
-    datos = session.exec(
-        select(
-            Factura.iva_global,
-            func.count(Factura.id),
-            func.sum(Factura.subtotal),
-            func.sum(Factura.iva_total),
-            func.sum(Factura.total),
-            func.sum(
-                case(
-                    (Factura.estado == "ANULADA", 1),
-                    else_=0
-                )
-            ).label("anuladas")
-        )
-        .where(Factura.estado.in_(("VALIDADA", "ANULADA")))
-        .where(extract("year", Factura.fecha) == year)
-        .where(extract("month", Factura.fecha) >= meses[0])
-        .where(extract("month", Factura.fecha) <= meses[1])
-        .group_by(Factura.iva_global)
-        .order_by(Factura.iva_global)
-    ).all()
-
-    resumen = [
-        {
-            "iva": r[0],
-            "facturas": int(r[1]),
-            "base": float(r[2] or 0),
-            "cuota": float(r[3] or 0),
-            "total": float(r[4] or 0),
-            "anuladas": int(r[5] or 0),
-        }
-        for r in datos
-    ]
+    resumen = resumen_iva(
+        session,
+        empresa_id=_empresa_sesion(request),
+        desde=desde,
+        hasta=hasta,
+    )
 
     total_base = sum(r["base"] for r in resumen)
     total_iva = sum(r["cuota"] for r in resumen)
@@ -479,41 +474,25 @@ def iva_trimestral_view(
 
 @router.get("/iva/trimestral.pdf")
 def iva_trimestral_pdf(
+    request: Request,
     year: int,
     trimestre: int,
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_read_session),
 ):
     if trimestre not in (1, 2, 3, 4):
         raise HTTPException(400, "Trimestre no válido")
 
-    meses = {
-        1: (1, 3),
-        2: (4, 6),
-        3: (7, 9),
-        4: (10, 12),
-    }[trimestre]
+    desde, hasta = periodo_trimestre(year, trimestre)
 
-    rows = session.exec(
-        select(
-            Factura.iva_global,
-            func.count(Factura.id),
-            func.sum(Factura.subtotal),
-            func.sum(Factura.iva_total),
-            func.sum(Factura.total),
-            func.sum(
-                case(
-                    (Factura.estado == "ANULADA", 1),
-                    else_=0
-                )
-            ).label("anuladas")
+    rows = [
+        (r["iva"], r["facturas"], r["base"], r["cuota"], r["total"], r["anuladas"])
+        for r in resumen_iva(
+            session,
+            empresa_id=_empresa_sesion(request),
+            desde=desde,
+            hasta=hasta,
         )
-        .where(Factura.estado.in_(("VALIDADA", "ANULADA")))
-        .where(extract("year", Factura.fecha) == year)
-        .where(extract("month", Factura.fecha) >= meses[0])
-        .where(extract("month", Factura.fecha) <= meses[1])
-        .group_by(Factura.iva_global)
-        .order_by(Factura.iva_global)
-    ).all()
+    ]
 
     tmp = NamedTemporaryFile(delete=False, suffix=".pdf")
     c = canvas.Canvas(tmp.name, pagesize=A4)
@@ -589,7 +568,7 @@ def iva_trimestral_pdf(
 def facturacion_anual_view(
     request: Request,
     year: int,
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_read_session),
 ):
     rows = session.exec(
         select(
@@ -638,7 +617,7 @@ def facturacion_anual_view(
 @router.get("/facturacion/anual.pdf")
 def facturacion_anual_pdf(
     year: int,
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_read_session),
 ):
     rows = session.exec(
         select(
@@ -702,7 +681,7 @@ def facturacion_anual_pdf(
 def ranking_clientes_view(
     request: Request,
     year: int | None = None,
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_read_session),
 ):
     query = (
         select(
@@ -754,7 +733,7 @@ def ranking_clientes_view(
 @router.get("/clientes/ranking.pdf")
 def ranking_clientes_pdf(
     year: int | None = None,
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_read_session),
 ):
     query = (
         select(
@@ -830,7 +809,7 @@ def ranking_clientes_pdf(
 def informe_ranking_clientes(
     request: Request,
     year: int | None = None,
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_read_session),
 ):
     query = (
         select(
@@ -882,7 +861,7 @@ def informe_ranking_clientes(
 @router.get("/clientes-ranking.pdf")
 def informe_ranking_clientes_pdf(
     year: int | None = None,
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_read_session),
 ):
     query = (
         select(
@@ -961,34 +940,17 @@ def informe_ranking_clientes_pdf(
 def informe_iva_view(
     request: Request,
     year: int | None = None,
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_read_session),
 ):
-    query = (
-        select(
-            Factura.iva_global,
-            func.count(Factura.id),
-            func.sum(Factura.subtotal),
-            func.sum(Factura.iva_total),
-            func.sum(Factura.total),
-            func.sum(
-                case(
-                    (Factura.estado == "ANULADA", 1),
-                    else_=0
-                )
-            ).label("anuladas")
-        )
-        .where(Factura.estado.in_(("VALIDADA", "ANULADA")))
-    )
-
-    if year:
-        query = query.where(
-            extract("year", Factura.fecha) == year
+    rows = [
+        (r["iva"], r["facturas"], r["base"], r["cuota"], r["total"], r["anuladas"])
+        for r in resumen_iva(
+            session,
+            empresa_id=_empresa_sesion(request),
+            desde=date(year, 1, 1) if year else None,
+            hasta=date(year + 1, 1, 1) if year else None,
         )
-
-    rows = session.exec(
-        query.group_by(Factura.iva_global)
-             .order_by(Factura.iva_global)
-    ).all()
+    ]
 
     ivas = []
     total_base = total_iva = total_fact = 0
@@ -1021,28 +983,19 @@ def informe_iva_view(
 
 @router.get("/iva.pdf")
 def informe_iva_pdf(
+    request: Request,
     year: int | None = None,
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_read_session),
 ):
-    query = (
-        select(
-            Factura.iva_global,
-            func.sum(Factura.subtotal),
-            func.sum(Factura.iva_total),
-            func.sum(Factura.total),
+    rows = [
+        (r["iva"], r["base"], r["cuota"], r["total"])
+        for r in resumen_iva(
+            session,
+            empresa_id=_empresa_sesion(request),
+            desde=date(year, 1, 1) if year else None,
+            hasta=date(year + 1, 1, 1) if year else None,
         )
-        .where(Factura.estado.in_(("VALIDADA", "ANULADA")))
-    )
-
-    if year:
-        query = query.where(
-            extract("year", Factura.fecha) == year
-        )
-
-    rows = session.exec(
-        query.group_by(Factura.iva_global)
-             .order_by(Factura.iva_global)
-    ).all()
+    ]
 
     tmp = NamedTemporaryFile(delete=False, suffix=".pdf")
     c = canvas.Canvas(tmp.name, pagesize=A4)
@@ -1101,7 +1054,7 @@ def informe_iva_pdf(
 def informe_facturacion_mensual(
     request: Request,
     year: int | None = None,
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_read_session),
 ):
     query = (
         select(
@@ -1156,7 +1109,7 @@ def informe_facturacion_mensual(
 @router.get("/mensual.pdf")
 def informe_facturacion_mensual_pdf(
     year: int | None = None,
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_read_session),
 ):
     query = (
         select(
@@ -4,6 +4,7 @@ from sqlmodel import Session, select
 from datetime import datetime
 
 from app.db.session import get_session
+from app.db.shards import datos_empresa
 from app.core.security import get_password_hash
 from app.core.templates import templates
 
@@ -105,32 +106,33 @@ def registro_submit(
     )
     session.add(user)
 
-    # =============================
-    # CONFIG SISTEMA BÁSICA
-    # =============================
-    config_existing = session.exec(
-        select(ConfiguracionSistema).where(
-            ConfiguracionSistema.empresa_id == empresa.id
-        )
-    ).first()
+    with datos_empresa(session, empresa.id) as datos:
+        # =============================
+        # CONFIG SISTEMA BÁSICA
+        # =============================
+        config_existing = datos.exec(
+            select(ConfiguracionSistema).where(
+                ConfiguracionSistema.empresa_id == empresa.id
+            )
+        ).first()
 
-    if not config_existing:
-        config = ConfiguracionSistema(
-            empresa_id=empresa.id,
-            actualizado_en=datetime.utcnow(),
-        )
-        session.add(config)
+        if not config_existing:
+            config = ConfiguracionSistema(
+                empresa_id=empresa.id,
+                actualizado_en=datetime.utcnow(),
+            )
+            datos.add(config)
 
-    # =============================
-    # CREAR EMISOR BASE
-    # =============================
+        # =============================
+        # CREAR EMISOR BASE
+        # =============================
 
-    emisor = Emisor(
-        empresa_id=empresa.id,
-        nombre=nombre_empresa.strip(),
-        nif=cif,
-    )
-    session.add(emisor)
+        emisor = Emisor(
+            empresa_id=empresa.id,
+            nombre=nombre_empresa.strip(),
+            nif=cif,
+        )
+        datos.add(emisor)
 
     session.commit()
 
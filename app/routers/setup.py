@@ -4,6 +4,7 @@ from fastapi.responses import RedirectResponse
 from sqlmodel import Session, select
 
 from app.db.session import get_session
+from app.db.shards import datos_empresa
 from app.models.user import User
 from app.core.security import get_password_hash
 from app.models.configuracion_sistema import ConfiguracionSistema
@@ -76,35 +77,35 @@ def setup_create(
     # =========================
     empresa_id = empresa.id
 
-    config = session.exec(
-        select(ConfiguracionSistema).where(
-            ConfiguracionSistema.empresa_id == empresa_id
-        )
-    ).first()
-
-    if not config:
-        config = ConfiguracionSistema(
-            empresa_id=empresa_id,
-            actualizado_en=datetime.now(UTC)
-        )
-        session.add(config)
-    # =========================
-    # EMISOR BASE
-    # =========================
-    from app.models.emisor import Emisor
-
-    emisor = session.exec(
-        select(Emisor).where(Emisor.empresa_id == empresa_id)
-    ).first()
-
-    if not emisor:
-        emisor = Emisor(
-            empresa_id=empresa_id,
-            nombre=empresa.nombre,
-            nif=empresa.cif,
-        )
-        session.add(emisor)
-
+    with datos_empresa(session, empresa_id) as datos:
+        config = datos.exec(
+            select(ConfiguracionSistema).where(
+                ConfiguracionSistema.empresa_id == empresa_id
+            )
+        ).first()
+
+        if not config:
+            config = ConfiguracionSistema(
+                empresa_id=empresa_id,
+                actualizado_en=datetime.now(UTC)
+            )
+            datos.add(config)
+        # =========================
+        # EMISOR BASE
+        # =========================
+        from app.models.emisor import Emisor
+
+        emisor = datos.exec(
+            select(Emisor).where(Emisor.empresa_id == empresa_id)
+        ).first()
+
+        if not emisor:
+            emisor = Emisor(
+                empresa_id=empresa_id,
+                nombre=empresa.nombre,
+                nif=empresa.cif,
+            )
+            datos.add(emisor)
 
     session.commit()
     return RedirectResponse("/login", status_code=302)
@@ -1,40 +1,50 @@
 from fastapi import APIRouter, Request, HTTPException, Query, Body
-from fastapi.responses import FileResponse, HTMLResponse, StreamingResponse
+from fastapi.responses import HTMLResponse, StreamingResponse
 from pathlib import Path
+from typing import Optional
 import os
 import shutil
 from app.core.templates import templates
 import mimetypes
 from datetime import datetime
+from urllib.parse import urlencode
+from app.core.config import settings
+from app.db.shards import sesion_empresa
+from app.services.blobs import estado_almacen, mover_blobs, recoger_basura, soltar_blobs
+from app.services.cache_http import pdf_factura_validada, respuesta_archivo
+from app.services.explorador import LIMITE_DEFECTO, listar_directorio
+from app.services.catalogo_almacenamiento import (
+    EXCLUIDAS,
+    listar_catalogo,
+    mover_ruta,
+    olvidar_ruta,
+    uso_almacenamiento,
+)
 
 router = APIRouter(prefix="/storage", tags=["Storage"])
 
-BASE_PATH = Path("/data").resolve()
+BASE_PATH = Path(settings.ALMACENAMIENTO_RAIZ).resolve()
 
 DISK_TOTAL_BYTES = 1024 * 1024 * 1024  # 1 GB
 
 TRASH_DIR = BASE_PATH / ".trash"
+TRASH_REL = ".trash"
 TRASH_DIR.mkdir(parents=True, exist_ok=True)
 
-SYSTEM_NAMES = {".trash"}  # iremos añadiendo más nombres de carpetas del sistema
+BLOBS_REL = ".blobs"   # almacén de blobs (app/services/blobs.py): no se toca desde aquí
+
+SYSTEM_NAMES = {".trash", BLOBS_REL}  # iremos añadiendo más nombres de carpetas del sistema
 
 PROTECTED_ROOTS = {
     ".trash",          # papelera
+    BLOBS_REL,         # contenido de los archivos (enlaces duros desde sus rutas)
     "facturas_pdf",    # donde guardes PDFs
     "certificados",    # certificados
 }
 
 def get_storage_usage() -> dict:
-    used = 0
-    if BASE_PATH.exists():
-        for p in BASE_PATH.rglob("*"):
-            if p.is_file():
-                try:
-                    used += p.stat().st_size
-                except OSError:
-                    continue
-
-    used = min(used, DISK_TOTAL_BYTES)
+    # Sale del catálogo (app/services/catalogo_almacenamiento.py), sin recorrer /data
+    used = min(uso_almacenamiento(), DISK_TOTAL_BYTES)
     free = max(DISK_TOTAL_BYTES - used, 0)
     percent = round(used / DISK_TOTAL_BYTES * 100, 2)
 
@@ -66,28 +76,74 @@ def safe_path(rel_path: str) -> Path:
     if not str(final).startswith(str(BASE_PATH)):
         raise HTTPException(400, "Ruta fuera de almacenamiento permitido")
 
+    if final.relative_to(BASE_PATH).parts[:1] == (BLOBS_REL,):
+        raise HTTPException(403, "Carpeta interna del almacenamiento")
+
     return final
 
-@router.get("")
-def storage_index(request: Request):
-    require_admin(request)
+def _items_catalogo(rel: str) -> list[dict]:
+    """Todo lo que cuelga de `rel`, con rutas relativas a él."""
+    prefijo = len(rel) + 1 if rel else 0
 
-    items = []
+    return [
+        {
+            "nombre": e.ruta.rsplit("/", 1)[-1],
+            "ruta": e.ruta[prefijo:],
+            "tipo": "dir" if e.es_dir else "file",
+            "tamano": None if e.es_dir else e.tamano,
+        }
+        for e in listar_catalogo(rel)
+    ]
 
-    if not BASE_PATH.exists():
-        return {"ok": True, "items": []}
 
-    for p in BASE_PATH.rglob("*"):
-        rel = p.relative_to(BASE_PATH)
+def _pagina(carpeta: Path, **opciones) -> dict:
+    try:
+        return listar_directorio(carpeta, **opciones)
+    except FileNotFoundError:
+        raise HTTPException(404, "Ruta no encontrada")
+    except NotADirectoryError:
+        raise HTTPException(400, "La ruta no es una carpeta")
+    except ValueError as e:      # CursorInvalido u orden desconocido
+        raise HTTPException(400, str(e))
 
-        items.append({
-            "nombre": p.name,
-            "ruta": str(rel),
-            "tipo": "dir" if p.is_dir() else "file",
-            "tamano": p.stat().st_size if p.is_file() else None
-        })
 
-    return {"ok": True, "items": items}
+@router.get("")
+def storage_index(
+    request: Request,
+    path: str = Query(""),
+    orden: str = Query("nombre"),
+    desc: bool = Query(False),
+    cursor: Optional[str] = Query(None),
+    limite: int = Query(LIMITE_DEFECTO),
+    show_hidden: bool = Query(False),
+):
+    """Un nivel de `path`, paginado: pide la siguiente página con `cursor`."""
+    require_admin(request)
+
+    carpeta = safe_path(path)
+    rel = carpeta.relative_to(BASE_PATH).as_posix()
+    rel = "" if rel == "." else rel
+
+    pagina = _pagina(
+        carpeta, orden=orden, desc=desc, cursor=cursor, limite=limite, ocultos=show_hidden
+    )
+
+    return {
+        "ok": True,
+        "path": rel,
+        "items": [
+            {
+                "nombre": item["nombre"],
+                "ruta": f"{rel}/{item['nombre']}" if rel else item["nombre"],
+                "tipo": "dir" if item["es_dir"] else "file",
+                "tamano": item["tamano"],
+                "mtime": item["mtime"],
+            }
+            for item in pagina["items"]
+        ],
+        "siguiente": pagina["siguiente"],
+        "total": pagina["total"],
+    }
 
 
 @router.delete("")
@@ -112,8 +168,14 @@ def storage_delete(request: Request, path: str):
 
 DANGEROUS_EXT = {".exe", ".sh", ".bat", ".ps1", ".cmd", ".bd"}
 
+def _factura_validada(request: Request, ruta: Path) -> bool:
+    empresa_id = request.session.get("empresa_id")
+    with sesion_empresa(empresa_id, lectura=True) as session:
+        return pdf_factura_validada(session, empresa_id, ruta)
+
+
 @router.get("/view")
-def storage_view(path: str = Query(...)):
+def storage_view(request: Request, path: str = Query(...)):
     real_path = safe_path(path)
 
     if not real_path.exists():
@@ -129,15 +191,17 @@ def storage_view(path: str = Query(...)):
     if not mime:
         mime = "application/octet-stream"
 
-    return FileResponse(
+    return respuesta_archivo(
+        request,
         real_path,
         media_type=mime,
         filename=real_path.name,
-        headers={"Content-Disposition": f'inline; filename="{real_path.name}"'}
+        content_disposition_type="inline",
+        inmutable=_factura_validada(request, real_path),
     )
 
 @router.get("/download")
-def storage_download(path: str = Query(...)):
+def storage_download(request: Request, path: str = Query(...)):
     real_path = safe_path(path)
 
     if not real_path.exists():
@@ -146,13 +210,12 @@ def storage_download(path: str = Query(...)):
     if real_path.is_dir():
         raise HTTPException(400, "No se puede descargar una carpeta")
 
-    return FileResponse(
+    return respuesta_archivo(
+        request,
         real_path,
         media_type="application/octet-stream",
         filename=real_path.name,                       # nombre correcto
-        headers={
-            "Content-Disposition": f'attachment; filename="{real_path.name}"'
-        },
+        inmutable=_factura_validada(request, real_path),
     )
 
 @router.get("/trash/ui", response_class=HTMLResponse)
@@ -161,19 +224,16 @@ def storage_trash_ui(request: Request):
 
     path = str(TRASH_DIR)
 
-    if not TRASH_DIR.exists():
-        elementos = []
-    else:
-        elementos = []
-        for p in TRASH_DIR.rglob("*"):
-            rel = p.relative_to(TRASH_DIR)
-            elementos.append({
-                "nombre": p.name,
-                "ruta": str(rel),
-                "tipo": "Carpeta" if p.is_dir() else "Archivo",
-                "tamano": None if p.is_dir() else p.stat().st_size,
-                "es_dir": p.is_dir(),
-            })
+    elementos = [
+        {
+            "nombre": item["nombre"],
+            "ruta": item["ruta"],
+            "tipo": "Carpeta" if item["tipo"] == "dir" else "Archivo",
+            "tamano": item["tamano"],
+            "es_dir": item["tipo"] == "dir",
+        }
+        for item in _items_catalogo(TRASH_REL)
+    ]
 
     breadcrumb = [
         {"nombre": "Almacenamiento", "ruta": "/storage/ui"},
@@ -204,26 +264,22 @@ def move_to_trash(path: Path) -> Path:
     destino = TRASH_DIR / rel
     destino.parent.mkdir(parents=True, exist_ok=True)
 
-    shutil.move(str(path), str(destino))
+    _mover(path, destino)
     return destino
 
 
+def _mover(origen: Path, destino: Path):
+    shutil.move(str(origen), str(destino))
+    mover_ruta(origen, destino)
+    mover_blobs(origen, destino)
+
+
 
 @router.get("/trash")
 def storage_trash(request: Request):
     require_admin(request)
 
-    items = []
-    if TRASH_DIR.exists():
-        for p in TRASH_DIR.rglob("*"):
-            rel = p.relative_to(TRASH_DIR)
-            items.append({
-                "nombre": p.name,
-                "ruta": str(rel),
-                "tipo": "dir" if p.is_dir() else "file",
-                "tamano": p.stat().st_size if p.is_file() else None
-            })
-    return {"ok": True, "items": items}
+    return {"ok": True, "items": _items_catalogo(TRASH_REL)}
 
 
 @router.post("/trash/restore")
@@ -239,7 +295,7 @@ def storage_trash_restore(request: Request, path: str = Query(...)):
 
     dest = BASE_PATH / path
     dest.parent.mkdir(parents=True, exist_ok=True)
-    shutil.move(str(src), str(dest))
+    _mover(src, dest)
 
     return {"ok": True, "restored": path}
 
@@ -263,7 +319,7 @@ def storage_trash_batch_restore(request: Request, payload: dict = Body(...)):
 
         dest = BASE_PATH / rel
         dest.parent.mkdir(parents=True, exist_ok=True)
-        shutil.move(str(src), str(dest))
+        _mover(src, dest)
         restored.append(rel)
 
     return {"ok": True, "restored": restored}
@@ -317,9 +373,13 @@ def storage_trash_batch_delete(request: Request, payload: dict = Body(...)):
             shutil.rmtree(target)
         else:
             target.unlink()
+        olvidar_ruta(target)
+        soltar_blobs(target)
 
         deleted += 1
 
+    recoger_basura()
+
     return {"ok": True, "deleted": deleted}
 
 @router.delete("/trash/empty")
@@ -329,56 +389,94 @@ def storage_trash_empty(request: Request):
     if not TRASH_DIR.exists():
         return {"ok": True, "deleted": 0}
 
-    count = 0
-    for p in TRASH_DIR.rglob("*"):
-        if p.is_file():
-            p.unlink()
-            count += 1
-    # opcional: limpiar carpetas vacías
-    for p in sorted(TRASH_DIR.rglob("*"), reverse=True):
-        if p.is_dir():
-            try:
-                p.rmdir()
-            except OSError:
-                pass
+    # El recuento sale del catálogo; se borra por entradas de primer nivel
+    count = sum(1 for e in listar_catalogo(TRASH_REL) if not e.es_dir)
+
+    with os.scandir(TRASH_DIR) as entradas:
+        hijos = [Path(e.path) for e in entradas]
+
+    for p in hijos:
+        try:
+            if p.is_dir() and not p.is_symlink():
+                shutil.rmtree(p)
+            else:
+                p.unlink()
+        except OSError:
+            pass
+
+    olvidar_ruta(*hijos)
+    soltar_blobs(*hijos)
+    recoger_basura()
 
     return {"ok": True, "deleted": count}
 
-@router.get("/ui", response_class=HTMLResponse)
-def storage_explorer(
-    request: Request,
-    path: str = Query("/data"),
-    show_hidden: bool = Query(False),
-):
-    base = "/data"
 
-    # Seguridad: impedir salir de /data
-    path = os.path.normpath(path)
-    if not path.startswith(base):
-        path = base
+@router.get("/blobs")
+def storage_blobs(request: Request):
+    require_admin(request)
+
+    return {"ok": True, **estado_almacen()}
 
-    if not os.path.exists(path):
-        raise HTTPException(404, "Ruta no encontrada")
 
-    elementos = []
+@router.post("/blobs/gc")
+def storage_blobs_gc(request: Request):
+    require_admin(request)
 
-    for nombre in os.listdir(path):
-        ruta = os.path.join(path, nombre)
-        es_dir = os.path.isdir(ruta)
+    return {"ok": True, **recoger_basura()}
+
+def _carpeta_explorer(path: str) -> Path:
+    # El explorador trabaja con rutas "/data/..."
+    path = os.path.normpath(path).replace("\\", "/").strip("/")
+    return safe_path("" if path == "data" else path)
 
-        # Ocultar elementos del sistema/ocultos
-        if not show_hidden:
-            if nombre.startswith(".") or nombre in SYSTEM_NAMES:
-                continue
 
-        elementos.append({
-            "nombre": nombre,
-            "ruta": ruta.replace("\\", "/"),
-            "tipo": "Carpeta" if es_dir else "Archivo",
-            "tamano": None if es_dir else os.path.getsize(ruta),
-            "es_dir": es_dir,
+def _filas_explorer(carpeta: Path, orden: str, desc: bool, cursor: str | None, show_hidden: bool) -> dict:
+    """Una página de filas para storage/_filas.html y la URL de la siguiente."""
+    rel = carpeta.relative_to(BASE_PATH).as_posix()
+    ruta = "/data" if rel == "." else f"/data/{rel}"
+
+    pagina = _pagina(carpeta, orden=orden, desc=desc, cursor=cursor, ocultos=show_hidden)
+
+    elementos = [
+        {
+            "nombre": item["nombre"],
+            "ruta": f"{ruta}/{item['nombre']}",
+            "tipo": "Carpeta" if item["es_dir"] else "Archivo",
+            "tamano": item["tamano"],
+            "es_dir": item["es_dir"],
+            "modificado": (
+                datetime.fromtimestamp(item["mtime"]).strftime("%d/%m/%Y %H:%M")
+                if item["mtime"] else None
+            ),
+        }
+        for item in pagina["items"]
+    ]
+
+    siguiente = None
+    if pagina["siguiente"]:
+        siguiente = "/storage/ui/filas?" + urlencode({
+            "path": ruta,
+            "orden": orden,
+            "desc": desc,
+            "show_hidden": show_hidden,
+            "cursor": pagina["siguiente"],
         })
 
+    return {"ruta": ruta, "elementos": elementos, "siguiente": siguiente, "total": pagina["total"]}
+
+
+@router.get("/ui", response_class=HTMLResponse)
+def storage_explorer(
+    request: Request,
+    path: str = Query("/data"),
+    show_hidden: bool = Query(False),
+    orden: str = Query("nombre"),
+    desc: bool = Query(False),
+):
+    # Solo la primera página; el resto llega por htmx (/ui/filas) al hacer scroll
+    filas = _filas_explorer(_carpeta_explorer(path), orden, desc, None, show_hidden)
+    path = filas["ruta"]
+
     # Breadcrumb igual que antes...
     partes = path.split("/")
     breadcrumb = []
@@ -396,18 +494,53 @@ def storage_explorer(
         {
             "request": request,
             "path": path,
-            "elementos": elementos,
+            "elementos": filas["elementos"],
+            "siguiente": filas["siguiente"],
+            "total": filas["total"],
             "breadcrumb": breadcrumb,
             "show_hidden": show_hidden,
+            "orden": orden,
+            "desc": desc,
             "usage": usage,
         }
     )
 
-import zipfile
-from io import BytesIO
+
+@router.get("/ui/filas", response_class=HTMLResponse)
+def storage_explorer_filas(
+    request: Request,
+    path: str = Query("/data"),
+    show_hidden: bool = Query(False),
+    orden: str = Query("nombre"),
+    desc: bool = Query(False),
+    cursor: Optional[str] = Query(None),
+):
+    filas = _filas_explorer(_carpeta_explorer(path), orden, desc, cursor, show_hidden)
+
+    return templates.TemplateResponse(
+        "storage/_filas.html",
+        {
+            "request": request,
+            "elementos": filas["elementos"],
+            "siguiente": filas["siguiente"],
+        }
+    )
+
+from app.services.zip_stream import zip_stream
 
 FACTURAS_DIR = BASE_PATH / "facturas_pdf"
 
+
+def _zip_response(archivos, filename: str) -> StreamingResponse:
+    # Sin Content-Length: se envía por trozos mientras se lee del disco
+    return StreamingResponse(
+        zip_stream(archivos),
+        media_type="application/zip",
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}"'
+        },
+    )
+
 @router.get("/zip/facturas")
 def storage_zip_facturas(
     request: Request,
@@ -419,23 +552,13 @@ def storage_zip_facturas(
     if not year_dir.exists():
         raise HTTPException(404, "No hay PDFs para ese año")
 
-    mem_file = BytesIO()
-    with zipfile.ZipFile(mem_file, mode="w", compression=zipfile.ZIP_DEFLATED) as zf:
-        for p in year_dir.rglob("*.pdf"):
-            arcname = p.relative_to(FACTURAS_DIR)
-            zf.write(p, arcname=str(arcname))
-
-    mem_file.seek(0)
-    filename = f"facturas_{year}.zip"
-
-    return StreamingResponse(
-        mem_file,
-        media_type="application/zip",
-        headers={
-            "Content-Disposition": f'attachment; filename="{filename}"'
-        },
+    archivos = (
+        (p, str(p.relative_to(FACTURAS_DIR)))
+        for p in year_dir.rglob("*.pdf")
     )
 
+    return _zip_response(archivos, f"facturas_{year}.zip")
+
 @router.post("/batch/zip")
 def storage_batch_zip(request: Request, payload: dict = Body(...)):
     require_admin(request)
@@ -444,31 +567,26 @@ def storage_batch_zip(request: Request, payload: dict = Body(...)):
     if not isinstance(paths, list) or not paths:
         raise HTTPException(400, "Debe indicar al menos una ruta")
 
-    mem_file = BytesIO()
-
-    with zipfile.ZipFile(mem_file, mode="w", compression=zipfile.ZIP_DEFLATED) as zf:
-        for raw in paths:
-            base = safe_path(raw)
+    # Validar antes de empezar a enviar: luego ya no se puede responder 400
+    bases = [safe_path(raw) for raw in paths]
 
+    def archivos():
+        for base in bases:
             if not base.exists():
                 continue
 
             if base.is_dir():
-                for p in base.rglob("*"):
-                    if p.is_file():
-                        arcname = p.relative_to(BASE_PATH)
-                        zf.write(p, arcname=str(arcname))
+                for carpeta, subdirs, ficheros in os.walk(base):
+                    # Pidiendo la raíz, el almacén de blobs no entra (como
+                    # en el backup): sus archivos ya van por sus rutas
+                    if carpeta == str(BASE_PATH):
+                        subdirs[:] = [d for d in subdirs if d not in EXCLUIDAS]
+                    for nombre in ficheros:
+                        p = Path(carpeta) / nombre
+                        yield p, str(p.relative_to(BASE_PATH))
             else:
-                arcname = base.relative_to(BASE_PATH)
-                zf.write(base, arcname=str(arcname))
+                yield base, str(base.relative_to(BASE_PATH))
 
-    mem_file.seek(0)
     filename = f"backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
 
-    return StreamingResponse(
-        mem_file,
-        media_type="application/zip",
-        headers={
-            "Content-Disposition": f'attachment; filename="{filename}"'
-        },
-    )
+    return _zip_response(archivos(), filename)
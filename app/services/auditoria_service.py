@@ -22,10 +22,12 @@ def auditar(
     empresa_id: int | None = None,
     payload: dict | None = None,
     nivel_evento: str = "INFO",   # << NUEVO
+    commit: bool = True,
 ):
     """
     Registra un evento de auditoría de forma segura.
     NUNCA debe romper la ejecución del sistema.
+    commit=False → solo se añade a la sesión (se confirma con la operación).
     """
 
     try:
@@ -76,9 +78,13 @@ def auditar(
         )
 
         session.add(evento)
-        session.commit()
+        if commit:
+            session.commit()
 
     except Exception:
+        if not commit:
+            # No deshacer la transacción del llamador
+            return
         try:
             session.rollback()
         except:
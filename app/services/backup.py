@@ -0,0 +1,495 @@
+# app/services/backup.py
+from __future__ import annotations
+
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import stat
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+from app.core.config import settings
+from app.core.logger import logger
+from app.db.session import engine, es_sqlite
+from app.db.shards import empresas_con_shard, ruta_shard
+from app.services.blobs import ruta_blob
+from app.services.catalogo_almacenamiento import EXCLUIDAS
+
+
+# ============================================================
+# BACKUP INCREMENTAL (BD + /data)
+# ============================================================
+# En BACKUP_DIR:
+#   objetos/ab/abcdef…      contenido por SHA-256 (cada versión una vez)
+#   manifiestos/<fecha>.json.gz
+#                           ruta → sha256/tamaño/mtime de cada archivo y
+#                           de cada instantánea de BD
+#
+# Cada backup:
+#   1. BD SQLite (principal y de empresa) con la API de backup online:
+#      copia consistente aunque haya escrituras (en WAL no las bloquea).
+#      Va antes que los archivos: todo PDF al que apunte la BD ya existe.
+#   2. /data (ALMACENAMIENTO_RAIZ), sin los ficheros de BD ni -wal/-shm
+#      ni el almacén de blobs (.blobs): cada ruta lógica es un enlace duro
+#      a su blob y el contenido ya va por ella; al restaurar se rehace el
+#      almacén (un blob por contenido y las rutas enlazadas a él).
+#      Archivo con el mismo tamaño y mtime que en el manifiesto anterior →
+#      se reutiliza su hash sin leerlo; el resto se copia por bloques
+#      calculando el hash, y si el objeto ya existe la copia se descarta.
+#
+#   python -m app.services.backup crear
+#   python -m app.services.backup listar
+#   python -m app.services.backup verificar [manifiesto] [--rapido]
+#   python -m app.services.backup restaurar <manifiesto|ultimo> <carpeta>
+
+BLOQUE = 1024 * 1024
+_SUFIJOS_SQLITE = ("-wal", "-shm", "-journal")
+_TMP_CADUCA = 24 * 3600
+
+
+def _carpeta_backup(destino=None) -> Path:
+    return Path(destino or settings.BACKUP_DIR).resolve()
+
+
+def _ruta_objeto(destino: Path, sha: str) -> Path:
+    return destino / "objetos" / sha[:2] / sha
+
+
+def _preparar(destino: Path) -> Path:
+    tmp = destino / "objetos" / "tmp"
+    tmp.mkdir(parents=True, exist_ok=True)
+    (destino / "manifiestos").mkdir(parents=True, exist_ok=True)
+
+    # Restos de backups interrumpidos
+    limite = time.time() - _TMP_CADUCA
+    for f in tmp.iterdir():
+        try:
+            if f.stat().st_mtime < limite:
+                f.unlink()
+        except OSError:
+            pass
+
+    return tmp
+
+
+# ============================================================
+# OBJETOS
+# ============================================================
+
+def _hash(ruta: Path) -> str:
+    sha = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        while bloque := f.read(BLOQUE):
+            sha.update(bloque)
+    return sha.hexdigest()
+
+
+def _colocar(destino: Path, tmp: Path, sha: str) -> bool:
+    """Mueve `tmp` a su objeto. False si ya existía (tmp se borra)."""
+    final = _ruta_objeto(destino, sha)
+    if final.exists():
+        tmp.unlink()
+        return False
+
+    final.parent.mkdir(exist_ok=True)
+    os.replace(tmp, final)
+    return True
+
+
+def _guardar_objeto(destino: Path, origen: Path) -> tuple[str, int, bool]:
+    """Copia `origen` a objetos/ en una pasada (hash + escritura)."""
+    fd, tmp = tempfile.mkstemp(dir=destino / "objetos" / "tmp")
+    tmp = Path(tmp)
+    sha = hashlib.sha256()
+    tamano = 0
+
+    try:
+        with open(origen, "rb") as f, os.fdopen(fd, "wb") as out:
+            while bloque := f.read(BLOQUE):
+                sha.update(bloque)
+                out.write(bloque)
+                tamano += len(bloque)
+            out.flush()
+            os.fsync(out.fileno())
+
+        digest = sha.hexdigest()
+        return digest, tamano, _colocar(destino, tmp, digest)
+
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+# ============================================================
+# BASES DE DATOS
+# ============================================================
+
+def bases_de_datos() -> list[Path]:
+    """Ficheros SQLite de la app: principal y, con DB_SHARDING, los de empresa."""
+    rutas = []
+    if es_sqlite(settings.DATABASE_URL) and engine.url.database:
+        rutas.append(Path(engine.url.database).resolve())
+    rutas += [ruta_shard(e).resolve() for e in empresas_con_shard()]
+    return [r for r in rutas if r.is_file()]
+
+
+def _instantanea(destino: Path, bd: Path) -> tuple[str, int, bool]:
+    fd, tmp = tempfile.mkstemp(dir=destino / "objetos" / "tmp", suffix=".db")
+    os.close(fd)
+    tmp = Path(tmp)
+
+    try:
+        origen = sqlite3.connect(str(bd))
+        copia = sqlite3.connect(str(tmp))
+        try:
+            origen.backup(copia)
+        finally:
+            copia.close()
+            origen.close()
+
+        sha = _hash(tmp)
+        return sha, tmp.stat().st_size, _colocar(destino, tmp, sha)
+
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+# ============================================================
+# CREAR
+# ============================================================
+
+def _recorrer(raiz: Path, excluir: set[Path]):
+    for carpeta, dirs, ficheros in os.walk(raiz):
+        base = Path(carpeta)
+        dirs[:] = [d for d in dirs if base / d not in excluir]
+
+        for nombre in ficheros:
+            ruta = base / nombre
+            if ruta in excluir or nombre.endswith(_SUFIJOS_SQLITE):
+                continue
+            try:
+                st = ruta.lstat()
+            except OSError:
+                continue
+            if stat.S_ISREG(st.st_mode):
+                yield ruta, st
+
+
+def _escribir_manifiesto(destino: Path, manifiesto: dict):
+    final = destino / "manifiestos" / f"{manifiesto['nombre']}.json.gz"
+    tmp = final.with_suffix(".tmp")
+
+    with open(tmp, "wb") as f:
+        with gzip.GzipFile(fileobj=f, mode="wb") as gz:
+            gz.write(json.dumps(manifiesto, ensure_ascii=False).encode("utf-8"))
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.replace(tmp, final)
+
+
+def crear_backup(destino=None) -> dict:
+    destino = _carpeta_backup(destino)
+    _preparar(destino)
+    raiz = Path(settings.ALMACENAMIENTO_RAIZ).resolve()
+    inicio = time.monotonic()
+
+    try:
+        anterior = cargar_manifiesto(destino=destino)
+    except FileNotFoundError:
+        anterior = None
+    previos = anterior["archivos"] if anterior else {}
+
+    manifiesto = {
+        "version": 1,
+        "nombre": datetime.utcnow().strftime("%Y%m%dT%H%M%S%f"),
+        "anterior": anterior["nombre"] if anterior else None,
+        "raiz": str(raiz),
+        "bases_datos": {},
+        "archivos": {},
+    }
+    resumen = {"archivos": 0, "copiados": 0, "objetos_nuevos": 0, "bytes_total": 0, "bytes_copiados": 0}
+
+    # 1) Instantáneas de BD
+    bds = bases_de_datos()
+    for bd in bds:
+        sha, tamano, nuevo = _instantanea(destino, bd)
+        manifiesto["bases_datos"][str(bd)] = {"sha256": sha, "tamano": tamano}
+        resumen["objetos_nuevos"] += nuevo
+
+    # 2) Archivos: sin cambios → hash del manifiesto anterior
+    pendientes = []
+    for ruta, st in _recorrer(raiz, {destino, *bds, *(raiz / c for c in EXCLUIDAS)}):
+        rel = ruta.relative_to(raiz).as_posix()
+        previo = previos.get(rel)
+
+        if (
+            previo
+            and previo["tamano"] == st.st_size
+            and previo["mtime"] == st.st_mtime_ns
+            and _ruta_objeto(destino, previo["sha256"]).exists()
+        ):
+            manifiesto["archivos"][rel] = previo
+        else:
+            pendientes.append((rel, ruta, st.st_mtime_ns))
+
+    def copiar(item):
+        rel, ruta, mtime = item
+        try:
+            sha, tamano, nuevo = _guardar_objeto(destino, ruta)
+        except FileNotFoundError:
+            return rel, None, False     # borrado mientras tanto
+        return rel, {"sha256": sha, "tamano": tamano, "mtime": mtime}, nuevo
+
+    with ThreadPoolExecutor(max_workers=max(1, settings.BACKUP_WORKERS)) as pool:
+        for rel, entrada, nuevo in pool.map(copiar, pendientes):
+            if entrada is None:
+                continue
+            manifiesto["archivos"][rel] = entrada
+            resumen["copiados"] += 1
+            resumen["bytes_copiados"] += entrada["tamano"]
+            resumen["objetos_nuevos"] += nuevo
+
+    resumen["archivos"] = len(manifiesto["archivos"])
+    resumen["bytes_total"] = sum(e["tamano"] for e in manifiesto["archivos"].values())
+
+    _escribir_manifiesto(destino, manifiesto)
+
+    resumen.update(
+        manifiesto=manifiesto["nombre"],
+        bases_datos=len(manifiesto["bases_datos"]),
+        segundos=round(time.monotonic() - inicio, 2),
+    )
+    logger.info(f"[BACKUP] {resumen}")
+    return resumen
+
+
+# ============================================================
+# MANIFIESTOS
+# ============================================================
+
+def listar_manifiestos(destino=None) -> list[str]:
+    carpeta = _carpeta_backup(destino) / "manifiestos"
+    if not carpeta.is_dir():
+        return []
+    return sorted(f.name[:-len(".json.gz")] for f in carpeta.glob("*.json.gz"))
+
+
+def cargar_manifiesto(nombre: str | None = None, destino=None) -> dict:
+    """`nombre` None o "ultimo" → el más reciente. FileNotFoundError si no hay."""
+    destino = _carpeta_backup(destino)
+
+    if not nombre or nombre == "ultimo":
+        nombres = listar_manifiestos(destino)
+        if not nombres:
+            raise FileNotFoundError(f"No hay backups en {destino}")
+        nombre = nombres[-1]
+
+    with gzip.open(destino / "manifiestos" / f"{nombre}.json.gz", "rb") as f:
+        return json.loads(f.read())
+
+
+# ============================================================
+# VERIFICAR
+# ============================================================
+
+def verificar_backup(nombre: str | None = None, destino=None, *, completo: bool = True) -> dict:
+    """
+    Cada objeto del manifiesto existe y tiene su tamaño. Con `completo`
+    además se recalcula el SHA-256 y las BD pasan PRAGMA integrity_check.
+    """
+    destino = _carpeta_backup(destino)
+    manifiesto = cargar_manifiesto(nombre, destino)
+
+    objetos = {}
+    for rel, e in manifiesto["archivos"].items():
+        objetos.setdefault(e["sha256"], (rel, e["tamano"], False))
+    for ruta, e in manifiesto["bases_datos"].items():
+        objetos[e["sha256"]] = (ruta, e["tamano"], True)
+
+    errores = []
+    for sha, (ruta, tamano, es_bd) in objetos.items():
+        obj = _ruta_objeto(destino, sha)
+
+        if not obj.is_file():
+            errores.append({"ruta": ruta, "error": "objeto inexistente"})
+            continue
+        if obj.stat().st_size != tamano:
+            errores.append({"ruta": ruta, "error": "tamaño distinto"})
+            continue
+        if not completo:
+            continue
+        if _hash(obj) != sha:
+            errores.append({"ruta": ruta, "error": "hash distinto"})
+            continue
+
+        if es_bd:
+            conn = sqlite3.connect(f"file:{obj}?mode=ro&immutable=1", uri=True)
+            try:
+                resultado = conn.execute("PRAGMA integrity_check").fetchone()[0]
+            finally:
+                conn.close()
+            if resultado != "ok":
+                errores.append({"ruta": ruta, "error": f"integrity_check: {resultado}"})
+
+    return {
+        "manifiesto": manifiesto["nombre"],
+        "archivos": len(manifiesto["archivos"]),
+        "bases_datos": len(manifiesto["bases_datos"]),
+        "objetos": len(objetos),
+        "completo": completo,
+        "ok": not errores,
+        "errores": errores,
+    }
+
+
+# ============================================================
+# RESTAURAR
+# ============================================================
+
+def _copiar_objeto(destino: Path, sha: str, final: Path, mtime_ns: int | None = None):
+    final.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=final.parent, prefix=".restaurando-")
+
+    try:
+        with open(_ruta_objeto(destino, sha), "rb") as f, os.fdopen(fd, "wb") as out:
+            while bloque := f.read(BLOQUE):
+                out.write(bloque)
+        os.replace(tmp, final)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+    if mtime_ns is not None:
+        os.utime(final, ns=(mtime_ns, mtime_ns))
+
+
+def _enlazar(blob: Path, final: Path):
+    final.parent.mkdir(parents=True, exist_ok=True)
+    tmp = final.with_name(f".restaurando-{final.name}")
+    tmp.unlink(missing_ok=True)
+
+    try:
+        os.link(blob, tmp)
+    except OSError:
+        # Sin enlaces duros: copia (el almacén ya no deduplica esa ruta)
+        shutil.copy2(blob, tmp)
+    os.replace(tmp, final)
+
+
+def _rutas_en_almacen(bd: Path) -> set[tuple[str, str]]:
+    """(ruta, sha256) de blob_ruta; vacío si la BD no tiene esa tabla."""
+    conexion = sqlite3.connect(f"file:{bd}?mode=ro", uri=True)
+    try:
+        return set(conexion.execute("SELECT ruta, sha256 FROM blob_ruta"))
+    except sqlite3.DatabaseError:
+        return set()
+    finally:
+        conexion.close()
+
+
+def restaurar_backup(
+    nombre: str | None,
+    carpeta,
+    destino=None,
+    *,
+    forzar: bool = False,
+) -> dict:
+    """
+    Vuelca el manifiesto en `carpeta` (vacía salvo `forzar`). Las BD que
+    estaban dentro de la raíz vuelven a su ruta relativa; las de fuera, a
+    `carpeta/_bases_datos/`. Restaurar sobre la raíz en uso exige `forzar`
+    y la app parada.
+    """
+    destino = _carpeta_backup(destino)
+    manifiesto = cargar_manifiesto(nombre, destino)
+    carpeta = Path(carpeta).resolve()
+
+    if not forzar:
+        if carpeta == Path(settings.ALMACENAMIENTO_RAIZ).resolve():
+            raise ValueError("Restaurar sobre el almacenamiento en uso requiere forzar")
+        if carpeta.exists() and any(carpeta.iterdir()):
+            raise ValueError(f"La carpeta {carpeta} no está vacía")
+
+    raiz = Path(manifiesto["raiz"])
+
+    # BD primero: dicen qué rutas estaban en el almacén de blobs
+    almacen: set[tuple[str, str]] = set()
+    for ruta, e in manifiesto["bases_datos"].items():
+        ruta = Path(ruta)
+        try:
+            final = carpeta / ruta.relative_to(raiz)
+        except ValueError:
+            final = carpeta / "_bases_datos" / ruta.name
+
+        # Un -wal antiguo se aplicaría sobre la BD restaurada
+        for sufijo in _SUFIJOS_SQLITE:
+            Path(f"{final}{sufijo}").unlink(missing_ok=True)
+
+        _copiar_objeto(destino, e["sha256"], final)
+        almacen |= _rutas_en_almacen(final)
+
+    # Almacén de blobs: cada contenido una vez (el SHA-256 del objeto es el
+    # del blob) y enlazadas a él solo las rutas que lo estaban en blob_ruta.
+    # El resto se copia: dos archivos sueltos iguales (p.ej. vacíos) no
+    # deben acabar compartiendo inodo
+    for rel, e in manifiesto["archivos"].items():
+        if rel.split("/", 1)[0] in EXCLUIDAS:
+            continue    # manifiestos antiguos: el almacén se rehace aquí
+        if (rel, e["sha256"]) not in almacen:
+            _copiar_objeto(destino, e["sha256"], carpeta / rel, e["mtime"])
+            continue
+        blob = ruta_blob(e["sha256"], carpeta)
+        if not blob.exists():
+            _copiar_objeto(destino, e["sha256"], blob, e["mtime"])
+        _enlazar(blob, carpeta / rel)
+
+    return {
+        "manifiesto": manifiesto["nombre"],
+        "carpeta": str(carpeta),
+        "archivos": len(manifiesto["archivos"]),
+        "bases_datos": len(manifiesto["bases_datos"]),
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Backup incremental de BD y /data")
+    parser.add_argument("--destino", help=f"Carpeta de backups (por defecto {settings.BACKUP_DIR})")
+    sub = parser.add_subparsers(dest="orden", required=True)
+
+    sub.add_parser("crear", help="Nuevo backup (incremental respecto al último)")
+    sub.add_parser("listar", help="Manifiestos existentes")
+
+    p_verificar = sub.add_parser("verificar", help="Comprobar los objetos de un manifiesto")
+    p_verificar.add_argument("manifiesto", nargs="?", default="ultimo")
+    p_verificar.add_argument("--rapido", action="store_true", help="Solo existencia y tamaño")
+
+    p_restaurar = sub.add_parser("restaurar", help="Volcar un manifiesto en una carpeta")
+    p_restaurar.add_argument("manifiesto")
+    p_restaurar.add_argument("carpeta")
+    p_restaurar.add_argument("--forzar", action="store_true")
+
+    args = parser.parse_args()
+
+    if args.orden == "crear":
+        salida = crear_backup(args.destino)
+    elif args.orden == "listar":
+        salida = listar_manifiestos(args.destino)
+    elif args.orden == "verificar":
+        salida = verificar_backup(args.manifiesto, args.destino, completo=not args.rapido)
+    else:
+        salida = restaurar_backup(args.manifiesto, args.carpeta, args.destino, forzar=args.forzar)
+
+    print(json.dumps(salida, indent=2, ensure_ascii=False))
+
+    if args.orden == "verificar" and not salida["ok"]:
+        raise SystemExit(1)
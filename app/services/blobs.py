@@ -0,0 +1,525 @@
+# app/services/blobs.py
+from __future__ import annotations
+
+import hashlib
+import os
+import shutil
+import threading
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+from sqlalchemy import and_, delete, func, literal, or_, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.types import String
+from sqlmodel import Session, select
+
+from app.core.logger import logger
+from app.db.session import engine
+from app.models.blob import Blob, RutaBlob
+from app.services.catalogo_almacenamiento import (
+    EXCLUIDAS,
+    RAIZ,
+    registrar_ruta,
+    relativa,
+)
+
+
+# ============================================================
+# ALMACÉN DE BLOBS POR CONTENIDO (/data/.blobs)
+# ============================================================
+# Logos, certificados y PDF de facturas se guardan una sola vez por
+# contenido, en .blobs/ab/<sha256>, y cada ruta lógica de /data
+# (facturas/2026/T1/Factura_A-1.pdf, uploads/3/logo.png...) es un enlace
+# duro a su blob:
+#   - quien lee por ruta (StaticFiles, /storage, email, ZIP) no cambia
+#   - regenerar un PDF idéntico no ocupa más disco
+#   - tablas blob / blob_ruta (BD principal): ruta lógica → sha256 y
+#     número de referencias de cada blob
+#   - la papelera mueve rutas lógicas (mover_blobs); sus blobs siguen
+#     referenciados hasta que se vacía (soltar_blobs) y recoger_basura() borra
+#     los que se quedan sin referencias
+#
+# Los escritores NO abren la ruta lógica en escritura (modificaría el blob
+# compartido): escriben en temporal() y llaman a guardar().
+#
+#   tmp = temporal(ruta_pdf)
+#   canvas.Canvas(str(tmp)) ... .save()
+#   guardar(tmp, ruta_pdf, empresa_id=...)
+
+CARPETA = RAIZ / ".blobs"
+TEMPORALES = CARPETA / "tmp"
+TEMPORAL_MAX_EDAD = 24 * 3600      # temporales huérfanos (caídas a medio escribir)
+
+_BLOQUE = 1024 * 1024
+
+# Colocar/enlazar un blob y recoger basura no se cruzan
+_lock = threading.Lock()
+
+
+def ruta_blob(sha256: str, raiz=None) -> Path:
+    """Blob de `sha256` en el almacén de RAIZ (u otra raíz: restauraciones)."""
+    carpeta = CARPETA if raiz is None else Path(raiz) / CARPETA.name
+    return carpeta / sha256[:2] / sha256
+
+
+def _en_almacen(rel: str | None) -> bool:
+    return bool(rel) and rel.split("/", 1)[0] not in EXCLUIDAS
+
+
+def _hash(ruta) -> tuple[str, int]:
+    sha = hashlib.sha256()
+    tamano = 0
+    with open(ruta, "rb") as f:
+        while bloque := f.read(_BLOQUE):
+            sha.update(bloque)
+            tamano += len(bloque)
+    return sha.hexdigest(), tamano
+
+
+def _mismo_archivo(a: Path, b: Path) -> bool:
+    try:
+        return os.path.samefile(a, b)
+    except OSError:
+        return False
+
+
+def _bajo(rel: str):
+    """`rel` y todo lo que cuelga de él (rango sobre la PK, sin LIKE)."""
+    return or_(
+        RutaBlob.ruta == rel,
+        and_(RutaBlob.ruta >= rel + "/", RutaBlob.ruta < rel + "0"),
+    )
+
+
+# ============================================================
+# DISCO
+# ============================================================
+
+def _enlazar_disco(blob: Path, destino: Path):
+    """Deja `destino` como enlace duro a `blob` (reemplazo atómico)."""
+    if _mismo_archivo(blob, destino):
+        return
+
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    enlace = destino.with_name(f".{destino.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        os.link(blob, enlace)
+    except OSError:
+        # Sin enlaces duros (otro sistema de archivos, Windows en red...): copia
+        shutil.copyfile(blob, enlace)
+
+    try:
+        os.replace(enlace, destino)
+    except OSError:
+        enlace.unlink(missing_ok=True)
+        raise
+
+
+def temporal(destino) -> Path:
+    """Dónde escribir un archivo antes de guardar() en `destino`."""
+    destino = Path(destino)
+
+    if not _en_almacen(relativa(destino)):
+        destino.parent.mkdir(parents=True, exist_ok=True)
+        return destino.with_name(f".{destino.name}.{uuid.uuid4().hex}.tmp")
+
+    # Mismo sistema de archivos que los blobs: guardar() solo renombra
+    TEMPORALES.mkdir(parents=True, exist_ok=True)
+    return TEMPORALES / f"{uuid.uuid4().hex}{destino.suffix}"
+
+
+# ============================================================
+# REFERENCIAS (BD)
+# ============================================================
+
+def _insert(session: Session):
+    if session.get_bind().dialect.name == "postgresql":
+        return postgresql.insert(Blob)
+    return sqlite.insert(Blob)
+
+
+def _sumar_referencias(session: Session, sha256: str, n: int):
+    session.exec(
+        update(Blob)
+        .where(Blob.sha256 == sha256)
+        .values(referencias=Blob.referencias + n)
+    )
+
+
+def _enlazar_bd(session: Session, rel: str, sha256: str, tamano: int, empresa_id: int | None):
+    session.exec(
+        _insert(session)
+        .values(sha256=sha256, tamano=tamano, referencias=0, creado_en=datetime.utcnow())
+        .on_conflict_do_nothing()
+    )
+
+    actual = session.get(RutaBlob, rel)
+    if actual is None:
+        session.add(RutaBlob(ruta=rel, sha256=sha256, empresa_id=empresa_id))
+        _sumar_referencias(session, sha256, 1)
+        return
+
+    if actual.sha256 != sha256:
+        _sumar_referencias(session, actual.sha256, -1)
+        _sumar_referencias(session, sha256, 1)
+        actual.sha256 = sha256
+
+    if empresa_id is not None:
+        actual.empresa_id = empresa_id
+    actual.actualizado_en = datetime.utcnow()
+
+
+def _soltar_bd(session: Session, rel: str) -> int:
+    filas = session.exec(
+        select(RutaBlob.sha256, func.count())
+        .where(_bajo(rel))
+        .group_by(RutaBlob.sha256)
+    ).all()
+
+    if not filas:
+        return 0
+
+    session.exec(delete(RutaBlob).where(_bajo(rel)))
+    for sha256, n in filas:
+        _sumar_referencias(session, sha256, -n)
+
+    return sum(n for _, n in filas)
+
+
+def _registrar_referencia(rel: str, sha256: str, tamano: int, empresa_id: int | None):
+    try:
+        with Session(engine) as session:
+            _enlazar_bd(session, rel, sha256, tamano, empresa_id)
+            session.commit()
+    except Exception as e:
+        # El blob sigue enlazado (st_nlink > 1): la recogida de basura no lo toca
+        logger.warning(f"[BLOBS] Referencia no guardada para {rel}: {e}")
+
+
+# ============================================================
+# API PARA LOS ESCRITORES
+# ============================================================
+
+def guardar(origen, destino, *, empresa_id: int | None = None) -> str | None:
+    """
+    Mete `origen` (escrito en temporal()) en el almacén y deja `destino`
+    enlazado a su blob. Devuelve el sha256; None si `destino` queda fuera
+    de /data (instalaciones locales antiguas), donde solo se mueve.
+    """
+    origen, destino = Path(origen), Path(destino)
+    rel = relativa(destino)
+
+    if not _en_almacen(rel):
+        destino.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(origen, destino)
+        registrar_ruta(destino)
+        return None
+
+    sha256, tamano = _hash(origen)
+    blob = ruta_blob(sha256)
+
+    with _lock:
+        if blob.exists():
+            origen.unlink()
+        else:
+            blob.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(origen, blob)
+        _enlazar_disco(blob, destino)
+
+    _registrar_referencia(rel, sha256, tamano, empresa_id)
+    registrar_ruta(destino)
+    return sha256
+
+
+def guardar_bytes(destino, datos: bytes, *, empresa_id: int | None = None) -> str | None:
+    tmp = temporal(destino)
+    try:
+        tmp.write_bytes(datos)
+        return guardar(tmp, destino, empresa_id=empresa_id)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+def soltar_blobs(*rutas):
+    """Tras borrar rutas lógicas (archivos o carpetas): sus blobs pierden la referencia."""
+    try:
+        with Session(engine) as session:
+            for ruta in rutas:
+                rel = relativa(ruta)
+                if _en_almacen(rel):
+                    _soltar_bd(session, rel)
+            session.commit()
+    except Exception as e:
+        logger.warning(f"[BLOBS] Referencias no soltadas: {e}")
+
+
+def mover_blobs(origen, destino):
+    """Tras un shutil.move dentro de /data (papelera): las rutas lógicas cambian de sitio."""
+    o, d = relativa(origen), relativa(destino)
+    if not _en_almacen(o) or not _en_almacen(d) or o == d:
+        return
+
+    try:
+        with Session(engine) as session:
+            # Lo que hubiera en destino se ha sobrescrito
+            _soltar_bd(session, d)
+            session.exec(
+                update(RutaBlob)
+                .where(_bajo(o))
+                .values(
+                    ruta=literal(d, String) + func.substr(RutaBlob.ruta, len(o) + 1),
+                    actualizado_en=datetime.utcnow(),
+                )
+            )
+            session.commit()
+    except Exception as e:
+        logger.warning(f"[BLOBS] Rutas no movidas {o} → {d}: {e}")
+
+
+def _adoptar(ruta: Path, rel: str, empresa_id: int | None) -> bool:
+    """Mete en el almacén un archivo escrito por fuera. True si ya había un blob igual."""
+    sha256, tamano = _hash(ruta)
+    blob = ruta_blob(sha256)
+
+    with _lock:
+        duplicado = blob.exists()
+        if duplicado:
+            _enlazar_disco(blob, ruta)
+        else:
+            blob.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                os.link(ruta, blob)
+            except OSError:
+                shutil.copyfile(ruta, blob)
+
+    _registrar_referencia(rel, sha256, tamano, empresa_id)
+    return duplicado
+
+
+def adoptar(carpeta=None, *, empresa_id: int | None = None) -> dict:
+    """Incorpora al almacén los archivos de `carpeta` (por defecto, todo /data) que aún no están."""
+    carpeta = Path(carpeta) if carpeta else RAIZ
+    base = relativa(carpeta)
+    if base is None:
+        return {"adoptados": 0, "duplicados": 0}
+
+    with Session(engine) as session:
+        consulta = select(RutaBlob.ruta)
+        if base:
+            consulta = consulta.where(_bajo(base))
+        conocidas = set(session.exec(consulta).all())
+
+    adoptados = duplicados = 0
+    for raiz, carpetas, nombres in os.walk(carpeta):
+        if Path(raiz) == RAIZ:
+            carpetas[:] = [c for c in carpetas if c not in EXCLUIDAS]
+
+        for nombre in nombres:
+            ruta = Path(raiz) / nombre
+            rel = relativa(ruta)
+            if not _en_almacen(rel) or rel in conocidas or ruta.is_symlink():
+                continue
+            try:
+                duplicados += _adoptar(ruta, rel, empresa_id)
+                adoptados += 1
+            except OSError as e:
+                logger.warning(f"[BLOBS] No se pudo adoptar {rel}: {e}")
+
+    return {"adoptados": adoptados, "duplicados": duplicados}
+
+
+def trasladar_carpeta(
+    origen,
+    destino,
+    *,
+    empresa_id: int | None = None,
+    propios: set[str] | None = None,
+) -> dict:
+    """
+    Mueve a `destino` los archivos de la empresa que hay bajo `origen`
+    (cambio de ruta_facturas). `origen` puede ser compartido ("facturas"):
+    solo se mueven los registrados a nombre de la empresa y, de los que no
+    tienen dueño, los de `propios` (subrutas relativas a `origen`, p. ej.
+    resolver_ruta.pdfs_de_empresa), que se adoptan para ella. El resto se
+    queda donde está. Si en destino ya existe el mismo contenido, el de
+    origen se suelta.
+    """
+    origen, destino = Path(origen), Path(destino)
+    o, d = relativa(origen), relativa(destino)
+    resultado = {"movidos": 0, "duplicados": 0, "conflictos": 0}
+
+    if empresa_id is None or not _en_almacen(o) or not _en_almacen(d) or o == d or not origen.is_dir():
+        return resultado
+
+    with Session(engine) as session:
+        duenos = dict(
+            session.exec(select(RutaBlob.ruta, RutaBlob.empresa_id).where(_bajo(o))).all()
+        )
+
+    for raiz, _, nombres in os.walk(origen):
+        for nombre in nombres:
+            src = Path(raiz) / nombre
+            rel = relativa(src)
+
+            sub = src.relative_to(origen)
+
+            if duenos.get(rel) is not None:
+                if duenos[rel] != empresa_id:
+                    continue
+            elif sub.as_posix() in (propios or ()):
+                # Sin dueño (o fuera del almacén) pero es un PDF suyo
+                _adoptar(src, rel, empresa_id)
+            else:
+                continue
+
+            dst = destino / sub
+            if dst.exists():
+                if _mismo_archivo(src, dst) or _hash(src)[0] == _hash(dst)[0]:
+                    src.unlink()
+                    soltar_blobs(src)
+                    resultado["duplicados"] += 1
+                else:
+                    resultado["conflictos"] += 1
+                continue
+
+            dst.parent.mkdir(parents=True, exist_ok=True)
+            os.rename(src, dst)
+            mover_blobs(src, dst)
+            resultado["movidos"] += 1
+
+    # Carpetas vacías que quedan en origen
+    for raiz, _, _ in os.walk(origen, topdown=False):
+        try:
+            os.rmdir(raiz)
+        except OSError:
+            pass
+
+    registrar_ruta(origen, destino)
+    return resultado
+
+
+# ============================================================
+# RECOGIDA DE BASURA
+# ============================================================
+
+def recoger_basura() -> dict:
+    """
+    - quita las rutas lógicas cuyo archivo ya no existe (borrado por fuera)
+    - recalcula las referencias de cada blob
+    - borra los blobs sin referencias que ya no enlaza ningún archivo
+      (st_nlink == 1): lo que está en la papelera sigue referenciado
+    - borra temporales de más de TEMPORAL_MAX_EDAD
+    """
+    resultado = {"rutas_huerfanas": 0, "blobs_borrados": 0, "bytes_liberados": 0, "temporales": 0}
+
+    with _lock, Session(engine) as session:
+        huerfanas = [
+            rel for rel in session.exec(select(RutaBlob.ruta)).all()
+            if not (RAIZ / rel).exists()
+        ]
+        for rel in huerfanas:
+            session.exec(delete(RutaBlob).where(RutaBlob.ruta == rel))
+        resultado["rutas_huerfanas"] = len(huerfanas)
+
+        session.exec(
+            update(Blob).values(
+                referencias=select(func.count())
+                .select_from(RutaBlob)
+                .where(RutaBlob.sha256 == Blob.sha256)
+                .scalar_subquery()
+            )
+        )
+
+        for blob in session.exec(select(Blob).where(Blob.referencias <= 0)).all():
+            ruta = ruta_blob(blob.sha256)
+            try:
+                st = ruta.stat()
+            except FileNotFoundError:
+                session.delete(blob)
+                continue
+
+            if st.st_nlink > 1:
+                continue
+
+            ruta.unlink()
+            session.delete(blob)
+            resultado["blobs_borrados"] += 1
+            resultado["bytes_liberados"] += st.st_size
+
+        session.commit()
+
+        limite = time.time() - TEMPORAL_MAX_EDAD
+        if TEMPORALES.is_dir():
+            with os.scandir(TEMPORALES) as entradas:
+                for e in entradas:
+                    try:
+                        if e.stat().st_mtime < limite:
+                            os.unlink(e.path)
+                            resultado["temporales"] += 1
+                    except OSError:
+                        pass
+
+    if resultado["blobs_borrados"]:
+        logger.info(
+            f"[BLOBS] {resultado['blobs_borrados']} blobs borrados "
+            f"({resultado['bytes_liberados']} bytes)"
+        )
+    return resultado
+
+
+def estado_almacen() -> dict:
+    with Session(engine) as session:
+        blobs, bytes_reales = session.exec(
+            select(func.count(), func.coalesce(func.sum(Blob.tamano), 0))
+        ).one()
+        rutas, bytes_logicos = session.exec(
+            select(func.count(), func.coalesce(func.sum(Blob.tamano), 0))
+            .select_from(RutaBlob)
+            .join(Blob, Blob.sha256 == RutaBlob.sha256)
+        ).one()
+        sin_referencias = session.exec(
+            select(func.count()).select_from(Blob).where(Blob.referencias <= 0)
+        ).one()
+
+    return {
+        "blobs": blobs,
+        "rutas": rutas,
+        "bytes_reales": bytes_reales,
+        "bytes_logicos": bytes_logicos,
+        "bytes_ahorrados": bytes_logicos - bytes_reales,
+        "sin_referencias": sin_referencias,
+    }
+
+
+# ============================================================
+# CLI
+# ============================================================
+# python -m app.services.blobs adoptar [--carpeta RUTA] [--empresa ID]
+# python -m app.services.blobs gc
+# python -m app.services.blobs estado
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Almacén de blobs de /data")
+    sub = parser.add_subparsers(dest="orden", required=True)
+
+    p_adoptar = sub.add_parser("adoptar", help="Incorporar archivos existentes")
+    p_adoptar.add_argument("--carpeta", help="Solo esta carpeta (por defecto, toda la raíz)")
+    p_adoptar.add_argument("--empresa", type=int, help="Empresa a la que pertenecen")
+    sub.add_parser("gc", help="Borrar blobs sin referencias")
+    sub.add_parser("estado", help="Blobs, rutas y espacio ahorrado")
+
+    args = parser.parse_args()
+
+    if args.orden == "adoptar":
+        salida = adoptar(args.carpeta, empresa_id=args.empresa)
+    elif args.orden == "gc":
+        salida = recoger_basura()
+    else:
+        salida = estado_almacen()
+
+    print(json.dumps(salida, indent=2, ensure_ascii=False))
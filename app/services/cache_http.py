@@ -0,0 +1,190 @@
+# app/services/cache_http.py
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+import stat
+import threading
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+
+from fastapi import Request
+from fastapi.staticfiles import StaticFiles
+from sqlmodel import Session, select
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+
+from app.models.factura import Factura
+
+
+# ============================================================
+# CACHÉ HTTP DE ARCHIVOS (ETag fuerte, 304, Range, Cache-Control)
+# ============================================================
+# - ETag fuerte = SHA-256 del contenido. Se calcula una vez por versión del
+#   archivo (ruta, tamaño, mtime) y se guarda en un LRU en memoria.
+# - If-None-Match / If-Modified-Since → 304 sin cuerpo.
+# - Range / If-Range los resuelve FileResponse con nuestro ETag.
+# - Cache-Control según el tipo de archivo:
+#     factura VALIDADA (inmutable)  private, max-age=1 año, immutable
+#     PDF / resto                   private, no-cache (revalida → 304)
+#     imágenes (logo)               private, max-age=1 h
+#
+#   return respuesta_archivo(request, ruta, media_type="application/pdf")
+#   app.mount("/pdf", ArchivosEstaticos(directory=...))
+
+ETAG_CACHE_MAX = 4096
+
+CACHE_INMUTABLE = "private, max-age=31536000, immutable"
+CACHE_REVALIDAR = "private, no-cache"
+CACHE_IMAGEN = "private, max-age=3600"
+
+_IMAGENES = {".png", ".jpg", ".jpeg", ".gif", ".webp", ".svg", ".ico"}
+
+_PATRON_PDF_FACTURA = re.compile(r"^Factura_(.+)\.pdf$")
+
+_etags: "OrderedDict[tuple[str, int, int], str]" = OrderedDict()
+_validadas: "OrderedDict[tuple[str, str], bool]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def _recordar(cache: OrderedDict, clave, valor):
+    with _lock:
+        cache[clave] = valor
+        cache.move_to_end(clave)
+        while len(cache) > ETAG_CACHE_MAX:
+            cache.popitem(last=False)
+
+
+def etag_archivo(ruta, st: os.stat_result | None = None) -> str:
+    st = st or os.stat(ruta)
+    clave = (str(ruta), st.st_size, st.st_mtime_ns)
+
+    with _lock:
+        etag = _etags.get(clave)
+        if etag:
+            _etags.move_to_end(clave)
+            return etag
+
+    sha = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        while bloque := f.read(1024 * 1024):
+            sha.update(bloque)
+    etag = f'"{sha.hexdigest()[:32]}"'
+
+    _recordar(_etags, clave, etag)
+    return etag
+
+
+def pdf_factura_validada(session: Session, empresa_id: int | None, ruta) -> bool:
+    """
+    ¿Es `ruta` el PDF (Factura_<numero>.pdf) de una factura VALIDADA de la
+    empresa? Se recuerda por versión del archivo: una factura validada ya
+    no cambia, y un PDF regenerado trae otro ETag.
+    """
+    m = _PATRON_PDF_FACTURA.match(Path(ruta).name)
+    if not m or not empresa_id:
+        return False
+
+    clave = (str(ruta), etag_archivo(ruta))
+    with _lock:
+        if clave in _validadas:
+            return _validadas[clave]
+
+    # El nombre lleva el número con "/" cambiado por "-"
+    numero = m.group(1)
+    validada = session.exec(
+        select(Factura.id)
+        .where(Factura.empresa_id == empresa_id)
+        .where(Factura.estado == "VALIDADA")
+        .where(Factura.numero.in_({numero, numero.replace("-", "/")}))
+    ).first() is not None
+
+    _recordar(_validadas, clave, validada)
+    return validada
+
+
+def politica_cache(ruta, *, inmutable: bool = False) -> str:
+    if inmutable:
+        return CACHE_INMUTABLE
+    if Path(ruta).suffix.lower() in _IMAGENES:
+        return CACHE_IMAGEN
+    return CACHE_REVALIDAR
+
+
+def no_modificado(cabeceras: Headers, etag: str, mtime: float) -> bool:
+    """RFC 9110 §13.2.2: If-None-Match manda; If-Modified-Since solo sin él."""
+    if_none_match = cabeceras.get("if-none-match")
+    if if_none_match:
+        if if_none_match.strip() == "*":
+            return True
+        return etag in [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+
+    if_modified_since = cabeceras.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+
+    return False
+
+
+def _cabeceras(ruta, st: os.stat_result, inmutable: bool) -> dict:
+    return {
+        "etag": etag_archivo(ruta, st),
+        "last-modified": formatdate(st.st_mtime, usegmt=True),
+        "cache-control": politica_cache(ruta, inmutable=inmutable),
+    }
+
+
+def respuesta_archivo(
+    request: Request,
+    ruta,
+    *,
+    media_type: str | None = None,
+    filename: str | None = None,
+    content_disposition_type: str = "attachment",
+    inmutable: bool = False,
+    headers: dict | None = None,
+) -> Response:
+    """FileResponse con ETag fuerte, 304 y Cache-Control."""
+    st = os.stat(ruta)
+    cabeceras = _cabeceras(ruta, st, inmutable)
+
+    if no_modificado(request.headers, cabeceras["etag"], st.st_mtime):
+        return Response(status_code=304, headers=cabeceras)
+
+    return FileResponse(
+        ruta,
+        media_type=media_type,
+        filename=filename,
+        stat_result=st,
+        content_disposition_type=content_disposition_type,
+        headers={**(headers or {}), **cabeceras},
+    )
+
+
+class ArchivosEstaticos(StaticFiles):
+    """StaticFiles con el mismo ETag fuerte y Cache-Control que respuesta_archivo."""
+
+    def lookup_path(self, path: str):
+        # Corre en el threadpool: el hash se calcula aquí y no en el event loop
+        full_path, stat_result = super().lookup_path(path)
+        if stat_result and stat.S_ISREG(stat_result.st_mode):
+            etag_archivo(full_path, stat_result)
+        return full_path, stat_result
+
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200) -> Response:
+        cabeceras = _cabeceras(full_path, stat_result, inmutable=False)
+
+        if no_modificado(Headers(scope=scope), cabeceras["etag"], stat_result.st_mtime):
+            return Response(status_code=304, headers=cabeceras)
+
+        return FileResponse(
+            full_path,
+            status_code=status_code,
+            stat_result=stat_result,
+            headers=cabeceras,
+        )
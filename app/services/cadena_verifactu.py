@@ -0,0 +1,150 @@
+# app/services/cadena_verifactu.py
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import datetime
+
+from sqlalchemy import func, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import Session, select
+
+from app.models.cadena_verifactu import CadenaVerifactu
+from app.models.factura import RegistroVerifactu
+
+
+# ============================================================
+# CABEZA DE CADENA POR EMPRESA
+# ============================================================
+# Uso (siempre dentro de la transacción de la validación):
+#
+#   cabeza = bloquear_cadena(session, empresa_id)     # serializa
+#   registro = construir_registro_verifactu(..., hash_anterior=cabeza.hash,
+#                                           secuencia=cabeza.secuencia + 1)
+#   session.add(registro)
+#   avanzar_cadena(session, empresa_id, registro)     # misma transacción
+#   session.commit()
+
+@dataclass(frozen=True)
+class EstadoCadena:
+    hash: str | None
+    secuencia: int
+    ultimo_registro_id: int | None
+
+
+def _asegurar_cabeza(session: Session, empresa_id: int):
+    existe = session.exec(
+        select(CadenaVerifactu.id).where(CadenaVerifactu.empresa_id == empresa_id)
+    ).first()
+
+    if existe:
+        return
+
+    # Arranque desde la historia existente (BD anterior a la tabla)
+    ultimo = session.exec(
+        select(RegistroVerifactu)
+        .where(RegistroVerifactu.empresa_id == empresa_id)
+        .order_by(RegistroVerifactu.secuencia.desc())
+    ).first()
+
+    secuencia = 0
+    if ultimo:
+        secuencia = ultimo.secuencia or session.exec(
+            select(func.count(RegistroVerifactu.id))
+            .where(RegistroVerifactu.empresa_id == empresa_id)
+        ).one()
+
+    valores = {
+        "empresa_id": empresa_id,
+        "ultimo_registro_id": ultimo.id if ultimo else None,
+        "ultimo_hash": ultimo.hash_actual if ultimo else None,
+        "secuencia": secuencia,
+        "actualizado_en": datetime.utcnow(),
+    }
+
+    dialecto = session.get_bind().dialect.name
+
+    if dialecto == "postgresql":
+        stmt = postgresql.insert(CadenaVerifactu).values(**valores)
+    else:
+        stmt = sqlite.insert(CadenaVerifactu).values(**valores)
+
+    session.exec(stmt.on_conflict_do_nothing())
+
+
+def bloquear_cadena(session: Session, empresa_id: int) -> EstadoCadena:
+    """
+    Lee la cabeza con un UPDATE ... RETURNING: toma el bloqueo de escritura
+    de la fila (PostgreSQL) o de la BD (SQLite) hasta el commit, así que las
+    validaciones concurrentes de la misma empresa se encadenan en serie.
+    NO hace commit.
+    """
+    _asegurar_cabeza(session, empresa_id)
+
+    fila = session.exec(
+        update(CadenaVerifactu)
+        .where(CadenaVerifactu.empresa_id == empresa_id)
+        .values(actualizado_en=datetime.utcnow())
+        .returning(
+            CadenaVerifactu.ultimo_hash,
+            CadenaVerifactu.secuencia,
+            CadenaVerifactu.ultimo_registro_id,
+        )
+    ).one()
+
+    return EstadoCadena(
+        hash=fila.ultimo_hash,
+        secuencia=fila.secuencia,
+        ultimo_registro_id=fila.ultimo_registro_id,
+    )
+
+
+def avanzar_cadena(
+    session: Session,
+    empresa_id: int,
+    registro: RegistroVerifactu,
+):
+    """
+    Mueve la cabeza al último registro encadenado (mismo commit que el
+    INSERT del registro). Hace flush para conocer registro.id.
+    """
+    session.flush()
+
+    session.exec(
+        update(CadenaVerifactu)
+        .where(CadenaVerifactu.empresa_id == empresa_id)
+        .values(
+            ultimo_registro_id=registro.id,
+            ultimo_hash=registro.hash_actual,
+            secuencia=registro.secuencia,
+            actualizado_en=datetime.utcnow(),
+        )
+    )
+
+
+def estado_cadena(session: Session, empresa_id: int) -> EstadoCadena:
+    """Lectura O(1) sin bloqueo (informativa)."""
+    cabeza = session.exec(
+        select(CadenaVerifactu).where(CadenaVerifactu.empresa_id == empresa_id)
+    ).first()
+
+    if not cabeza:
+        ultimo = session.exec(
+            select(RegistroVerifactu)
+            .where(RegistroVerifactu.empresa_id == empresa_id)
+            .order_by(RegistroVerifactu.secuencia.desc())
+        ).first()
+
+        if not ultimo:
+            return EstadoCadena(hash=None, secuencia=0, ultimo_registro_id=None)
+
+        return EstadoCadena(
+            hash=ultimo.hash_actual,
+            secuencia=ultimo.secuencia or 0,
+            ultimo_registro_id=ultimo.id,
+        )
+
+    return EstadoCadena(
+        hash=cabeza.ultimo_hash,
+        secuencia=cabeza.secuencia,
+        ultimo_registro_id=cabeza.ultimo_registro_id,
+    )
@@ -0,0 +1,411 @@
+# app/services/catalogo_almacenamiento.py
+from __future__ import annotations
+
+import os
+import posixpath
+import stat
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+from sqlalchemy import and_, delete, or_, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import Session, select
+
+from app.core.config import settings
+from app.core.logger import logger
+from app.db.session import engine
+from app.models.almacenamiento import EntradaAlmacenamiento
+
+
+# ============================================================
+# CATÁLOGO DE ALMACENAMIENTO (/data)
+# ============================================================
+# Uso de disco y listados salen de la tabla almacenamiento_catalogo en vez
+# de recorrer /data con rglob + stat en cada petición:
+#   - los escritores de la app (PDF de facturas, logo, certificado,
+#     papelera) avisan con registrar_ruta / olvidar_ruta / mover_ruta, que
+#     actualizan la fila y suman/restan en las carpetas antecesoras
+#   - un escaneo periódico (os.scandir, ALMACENAMIENTO_ESCANEO_INTERVALO)
+#     reconcilia lo que cambia por fuera: BD SQLite, copias manuales...
+#     y corrige cualquier desajuste de los avisos
+# Un aviso que falla, o que se cruza con un escaneo en curso, solo deja un
+# desajuste hasta el siguiente escaneo.
+
+RAIZ = Path(settings.ALMACENAMIENTO_RAIZ).resolve()
+
+# Almacén de blobs (app/services/blobs.py): su contenido ya cuenta por las
+# rutas lógicas que lo enlazan
+EXCLUIDAS = {".blobs"}
+
+_FILAS_POR_SENTENCIA = 500
+
+_lock_escaneo = threading.Lock()
+_parar = threading.Event()
+_hilo: threading.Thread | None = None
+
+
+def relativa(ruta) -> str | None:
+    """Ruta relativa a RAIZ con "/" ("" = la raíz). None si queda fuera."""
+    try:
+        rel = Path(ruta).resolve().relative_to(RAIZ).as_posix()
+    except ValueError:
+        return None
+    return "" if rel == "." else rel
+
+
+def _padre(rel: str) -> str | None:
+    return None if rel == "" else posixpath.dirname(rel)
+
+
+def _ancestros(rel: str) -> list[str]:
+    ancestros = []
+    while rel:
+        rel = posixpath.dirname(rel)
+        ancestros.append(rel)
+    return ancestros
+
+
+def _bajo(rel: str):
+    """`rel` y todo lo que cuelga de él (rango sobre la PK, sin LIKE)."""
+    return or_(
+        EntradaAlmacenamiento.ruta == rel,
+        and_(
+            EntradaAlmacenamiento.ruta >= rel + "/",
+            EntradaAlmacenamiento.ruta < rel + "0",     # "0" = chr(ord("/") + 1)
+        ),
+    )
+
+
+# ============================================================
+# DISCO
+# ============================================================
+
+def _recorrer(base: str):
+    """(rel, es_dir, tamano, mtime) de todo lo que hay bajo `base`."""
+    inicio = len(str(RAIZ).rstrip(os.sep)) + 1
+    pendientes = [base]
+
+    while pendientes:
+        carpeta = pendientes.pop()
+        try:
+            entradas = os.scandir(carpeta)
+        except OSError:
+            continue
+
+        with entradas:
+            for e in entradas:
+                try:
+                    es_dir = e.is_dir(follow_symlinks=False)
+                    st = e.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+
+                rel = e.path[inicio:].replace(os.sep, "/")
+                if rel in EXCLUIDAS:
+                    continue
+
+                if es_dir:
+                    pendientes.append(e.path)
+
+                yield rel, es_dir, 0 if es_dir else st.st_size, st.st_mtime
+
+
+def _filas(entradas: list[tuple], base: str) -> list[dict]:
+    """Filas del catálogo con los totales de cada carpeta (hasta `base`)."""
+    totales = {rel: [0, 0] for rel, es_dir, _, _ in entradas if es_dir}
+
+    for rel, es_dir, tamano, _ in entradas:
+        if es_dir:
+            continue
+        carpeta = rel
+        while carpeta != base:
+            carpeta = posixpath.dirname(carpeta)
+            if carpeta in totales:
+                totales[carpeta][0] += tamano
+                totales[carpeta][1] += 1
+
+    ahora = datetime.utcnow()
+    return [
+        {
+            "ruta": rel,
+            "padre": _padre(rel),
+            "es_dir": es_dir,
+            "tamano": totales[rel][0] if es_dir else tamano,
+            "archivos": totales[rel][1] if es_dir else 1,
+            "mtime": mtime,
+            "actualizado_en": ahora,
+        }
+        for rel, es_dir, tamano, mtime in entradas
+    ]
+
+
+# ============================================================
+# ESCRITURA EN EL CATÁLOGO
+# ============================================================
+
+def _insert(session: Session):
+    if session.get_bind().dialect.name == "postgresql":
+        return postgresql.insert(EntradaAlmacenamiento)
+    return sqlite.insert(EntradaAlmacenamiento)
+
+
+def _guardar(session: Session, filas: list[dict]):
+    for i in range(0, len(filas), _FILAS_POR_SENTENCIA):
+        stmt = _insert(session).values(filas[i:i + _FILAS_POR_SENTENCIA])
+        session.exec(
+            stmt.on_conflict_do_update(
+                index_elements=["ruta"],
+                set_={
+                    c: stmt.excluded[c]
+                    for c in ("padre", "es_dir", "tamano", "archivos", "mtime", "actualizado_en")
+                },
+            )
+        )
+
+
+def _mtime(rel: str) -> float | None:
+    try:
+        return os.stat(RAIZ / rel).st_mtime
+    except OSError:
+        return None
+
+
+def _sumar_en_ancestros(session: Session, rel: str, tamano: int, archivos: int):
+    ancestros = _ancestros(rel)
+    if not ancestros:
+        return
+
+    # Carpetas que el catálogo aún no conoce (creadas por mkdir)
+    ahora = datetime.utcnow()
+    session.exec(
+        _insert(session)
+        .values([
+            {
+                "ruta": a,
+                "padre": _padre(a),
+                "es_dir": True,
+                "tamano": 0,
+                "archivos": 0,
+                "mtime": _mtime(a),
+                "actualizado_en": ahora,
+            }
+            for a in ancestros
+        ])
+        .on_conflict_do_nothing()
+    )
+
+    # Crear/borrar una entrada cambia el mtime de su carpeta
+    session.exec(
+        update(EntradaAlmacenamiento)
+        .where(EntradaAlmacenamiento.ruta == ancestros[0])
+        .values(mtime=_mtime(ancestros[0]))
+    )
+
+    if tamano or archivos:
+        session.exec(
+            update(EntradaAlmacenamiento)
+            .where(EntradaAlmacenamiento.ruta.in_(ancestros))
+            .values(
+                tamano=EntradaAlmacenamiento.tamano + tamano,
+                archivos=EntradaAlmacenamiento.archivos + archivos,
+                actualizado_en=ahora,
+            )
+        )
+
+
+def _olvidar(session: Session, rel: str):
+    actual = session.exec(
+        select(EntradaAlmacenamiento.tamano, EntradaAlmacenamiento.archivos)
+        .where(EntradaAlmacenamiento.ruta == rel)
+    ).first()
+
+    if actual is None:
+        return
+
+    session.exec(delete(EntradaAlmacenamiento).where(_bajo(rel)))
+    _sumar_en_ancestros(session, rel, -actual[0], -actual[1])
+
+
+def _registrar(session: Session, rel: str):
+    _olvidar(session, rel)
+
+    # _recorrer calcula las rutas relativas cortando el prefijo de RAIZ
+    ruta = str(RAIZ / rel)
+    try:
+        st = os.stat(ruta, follow_symlinks=False)
+    except OSError:
+        return
+
+    es_dir = stat.S_ISDIR(st.st_mode)
+    entradas = [(rel, es_dir, 0 if es_dir else st.st_size, st.st_mtime)]
+    if es_dir:
+        entradas += list(_recorrer(ruta))
+
+    filas = _filas(entradas, rel)
+    _guardar(session, filas)
+    _sumar_en_ancestros(session, rel, filas[0]["tamano"], filas[0]["archivos"])
+
+
+def _aplicar(operaciones):
+    try:
+        with Session(engine) as session:
+            for operacion, ruta in operaciones:
+                rel = relativa(ruta)
+                # La raíz solo la toca el escaneo
+                if not rel or rel.split("/", 1)[0] in EXCLUIDAS:
+                    continue
+                if operacion == "registrar":
+                    _registrar(session, rel)
+                else:
+                    _olvidar(session, rel)
+            session.commit()
+    except Exception as e:
+        logger.warning(f"[ALMACENAMIENTO] Catálogo no actualizado: {e}")
+
+
+def registrar_ruta(*rutas):
+    """Tras crear o reescribir archivos/carpetas en /data."""
+    _aplicar([("registrar", r) for r in rutas])
+
+
+def olvidar_ruta(*rutas):
+    """Tras borrar archivos/carpetas de /data."""
+    _aplicar([("olvidar", r) for r in rutas])
+
+
+def mover_ruta(origen, destino):
+    """Tras un shutil.move dentro de /data (papelera)."""
+    _aplicar([("olvidar", origen), ("registrar", destino)])
+
+
+# ============================================================
+# ESCANEO (reconciliación)
+# ============================================================
+
+def escanear_almacenamiento() -> dict:
+    """Recorre RAIZ y deja el catálogo igual que el disco. Solo escribe diferencias."""
+    with _lock_escaneo:
+        inicio = time.monotonic()
+
+        if RAIZ.is_dir():
+            entradas = [("", True, 0, RAIZ.stat().st_mtime)]
+            entradas += list(_recorrer(str(RAIZ)))
+        else:
+            entradas = []
+
+        disco = {f["ruta"]: f for f in _filas(entradas, "")}
+
+        with Session(engine) as session:
+            catalogo = {
+                ruta: (es_dir, tamano, archivos, mtime)
+                for ruta, es_dir, tamano, archivos, mtime in session.exec(
+                    select(
+                        EntradaAlmacenamiento.ruta,
+                        EntradaAlmacenamiento.es_dir,
+                        EntradaAlmacenamiento.tamano,
+                        EntradaAlmacenamiento.archivos,
+                        EntradaAlmacenamiento.mtime,
+                    )
+                ).all()
+            }
+
+            cambios = [
+                f for ruta, f in disco.items()
+                if catalogo.get(ruta) != (f["es_dir"], f["tamano"], f["archivos"], f["mtime"])
+            ]
+            sobran = [ruta for ruta in catalogo if ruta not in disco]
+
+            _guardar(session, cambios)
+            for i in range(0, len(sobran), _FILAS_POR_SENTENCIA):
+                session.exec(
+                    delete(EntradaAlmacenamiento).where(
+                        EntradaAlmacenamiento.ruta.in_(sobran[i:i + _FILAS_POR_SENTENCIA])
+                    )
+                )
+            session.commit()
+
+        resultado = {
+            "entradas": len(disco),
+            "actualizadas": len(cambios),
+            "eliminadas": len(sobran),
+            "segundos": round(time.monotonic() - inicio, 2),
+        }
+
+    if cambios or sobran:
+        logger.info(f"[ALMACENAMIENTO] Catálogo reconciliado: {resultado}")
+
+    return resultado
+
+
+# ============================================================
+# CONSULTAS
+# ============================================================
+
+def uso_almacenamiento() -> int:
+    """Bytes ocupados bajo RAIZ según el catálogo."""
+    with Session(engine) as session:
+        usado = session.exec(
+            select(EntradaAlmacenamiento.tamano).where(EntradaAlmacenamiento.ruta == "")
+        ).first()
+
+    if usado is None:
+        # Catálogo vacío (primer arranque): un escaneo síncrono
+        escanear_almacenamiento()
+        with Session(engine) as session:
+            usado = session.exec(
+                select(EntradaAlmacenamiento.tamano).where(EntradaAlmacenamiento.ruta == "")
+            ).first()
+
+    return usado or 0
+
+
+def listar_catalogo(rel: str = "", *, recursivo: bool = True) -> list[EntradaAlmacenamiento]:
+    """Entradas bajo `rel` (sin incluirla), ordenadas por ruta."""
+    query = select(EntradaAlmacenamiento)
+
+    if not recursivo:
+        query = query.where(EntradaAlmacenamiento.padre == rel)
+    elif rel:
+        query = query.where(
+            EntradaAlmacenamiento.ruta >= rel + "/",
+            EntradaAlmacenamiento.ruta < rel + "0",
+        )
+    else:
+        query = query.where(EntradaAlmacenamiento.ruta != "")
+
+    with Session(engine) as session:
+        return list(session.exec(query.order_by(EntradaAlmacenamiento.ruta)).all())
+
+
+# ============================================================
+# CICLO DE VIDA DEL ESCANEO
+# ============================================================
+
+def _bucle():
+    while True:
+        try:
+            escanear_almacenamiento()
+        except Exception as e:
+            logger.warning(f"[ALMACENAMIENTO] Escaneo fallido: {e}")
+
+        if _parar.wait(settings.ALMACENAMIENTO_ESCANEO_INTERVALO):
+            return
+
+
+def iniciar_catalogo_almacenamiento():
+    global _hilo
+
+    if settings.ALMACENAMIENTO_ESCANEO_INTERVALO <= 0:
+        return
+    if _hilo and _hilo.is_alive():
+        return
+
+    _parar.clear()
+    _hilo = threading.Thread(target=_bucle, name="almacenamiento-escaneo", daemon=True)
+    _hilo.start()
+
+
+def detener_catalogo_almacenamiento():
+    _parar.set()
@@ -1,13 +1,13 @@
 from fastapi import HTTPException, Request
 from sqlmodel import Session, select
 from datetime import datetime
-import json
-from hashlib import sha256
 
 from app.models.configuracion_sistema import ConfiguracionSistema
 from app.models.factura import Factura, RegistroVerifactu
 from app.models.emisor import Emisor
-from app.services.verifactu_envio import enviar_a_aeat
+from app.services.hash_verifactu import HASH_VERSION_ACTUAL, hash_registro
+from app.services.cadena_verifactu import avanzar_cadena, bloquear_cadena, estado_cadena
+from app.services.verifactu_outbox import despertar_outbox
 
 
 # ============================================================
@@ -74,50 +74,82 @@ def verificar_verifactu(factura: Factura, session: Session):
     if not emisor or not emisor.nif:
         raise HTTPException(500, "No hay NIF de emisor configurado.")
 
-    fecha_generacion = datetime.utcnow()
+    # Bloquea la cabeza de la cadena hasta el commit (sin bifurcaciones)
+    cabeza = bloquear_cadena(session, empresa_id)
 
-    hash_anterior = obtener_hash_anterior(session, empresa_id)
+    registro = construir_registro_verifactu(
+        factura=factura,
+        nif_emisor=emisor.nif,
+        hash_anterior=cabeza.hash,
+        secuencia=cabeza.secuencia + 1,
+    )
+    nuevo_hash = registro.hash_actual
+    fecha_generacion = registro.fecha_registro
+
+    session.add(registro)
+    avanzar_cadena(session, empresa_id, registro)
+
+    config.verifactu_ultimo_hash = nuevo_hash
+    config.verifactu_ultimo_envio = fecha_generacion
+
+    session.add(factura)
+    session.add(config)
+    session.commit()
+
+    # El envío a AEAT lo hace el outbox en segundo plano (queda PENDIENTE)
+    despertar_outbox()
+
+
+def verifactu_habilitado(config: ConfiguracionSistema | None) -> bool:
+    return bool(
+        config
+        and config.verifactu_activo
+        and config.verifactu_modo != "OFF"
+    )
+
+
+# ============================================================
+# REGISTRO (sin commit ni envío)
+# ============================================================
+
+def construir_registro_verifactu(
+    factura: Factura,
+    nif_emisor: str,
+    hash_anterior: str | None,
+    fecha_generacion: datetime | None = None,
+    secuencia: int | None = None,
+) -> RegistroVerifactu:
+    """
+    Calcula el hash encadenado, crea el RegistroVerifactu (PENDIENTE)
+    y sella la factura. No añade a sesión ni hace commit: permite
+    encadenar varias facturas en memoria (validación por lotes).
+    """
+    fecha_generacion = fecha_generacion or datetime.utcnow()
 
     nuevo_hash = generar_hash_verifactu(
         factura=factura,
-        nif_emisor=emisor.nif,
+        nif_emisor=nif_emisor,
         fecha_generacion=fecha_generacion,
         hash_anterior=hash_anterior,
     )
 
-    registro = RegistroVerifactu(
+    factura.verifactu_hash = nuevo_hash
+    factura.verifactu_fecha_generacion = fecha_generacion
+
+    return RegistroVerifactu(
         factura_id=factura.id,
         numero_factura=factura.numero,
         fecha_factura=factura.fecha,
         total_factura=factura.total,
         hash_actual=nuevo_hash,
         hash_anterior=hash_anterior,
+        secuencia=secuencia,
+        version_hash=HASH_VERSION_ACTUAL,
         fecha_registro=fecha_generacion,
         estado_envio="PENDIENTE",
-        empresa_id=empresa_id,
-    )
-
-    session.add(registro)
-
-    # Envío real / mock
-    enviar_a_aeat(
-        factura=factura,
-        emisor=emisor,
-        registro=registro,
-        config=config,
-        session=session,
+        empresa_id=factura.empresa_id,
     )
 
-    factura.verifactu_hash = nuevo_hash
-    factura.verifactu_fecha_generacion = fecha_generacion
-
-    config.verifactu_ultimo_hash = nuevo_hash
-    config.verifactu_ultimo_envio = fecha_generacion
-
-    session.add(factura)
-    session.add(config)
-    session.commit()
-
 
 # ============================================================
 # HASH
@@ -128,6 +160,7 @@ def generar_hash_verifactu(
     nif_emisor: str,
     fecha_generacion: datetime,
     hash_anterior: str | None,
+    version: int = HASH_VERSION_ACTUAL,
 ) -> str:
 
     if not factura.numero:
@@ -136,29 +169,15 @@ def generar_hash_verifactu(
     if not factura.fecha:
         raise ValueError("No se puede generar hash sin fecha.")
 
-    payload_hash = {
-        "emisor": {
-            "nif": nif_emisor.strip().upper(),
-        },
-        "factura": {
-            "numero": factura.numero.strip(),
-            "fecha": factura.fecha.isoformat()[:10],
-            "total": float(factura.total or 0.0),
-        },
-        "registro": {
-            "fecha_registro_utc": fecha_generacion.isoformat(),
-            "hash_anterior": hash_anterior or "",
-        },
-    }
-
-    canonico = json.dumps(
-        payload_hash,
-        ensure_ascii=False,
-        sort_keys=True,
-        separators=(",", ":")
-    ).encode("utf-8")
-
-    return sha256(canonico).hexdigest()
+    return hash_registro(
+        version,
+        nif_emisor=nif_emisor,
+        numero=factura.numero,
+        fecha=factura.fecha,
+        total=factura.total,
+        fecha_registro=fecha_generacion,
+        hash_anterior=hash_anterior,
+    )
 
 
 # ============================================================
@@ -166,10 +185,5 @@ def generar_hash_verifactu(
 # ============================================================
 
 def obtener_hash_anterior(session: Session, empresa_id: int) -> str | None:
-    ultimo = session.exec(
-        select(RegistroVerifactu)
-        .where(RegistroVerifactu.empresa_id == empresa_id)
-        .order_by(RegistroVerifactu.fecha_registro.desc())
-    ).first()
-
-    return ultimo.hash_actual if ultimo else None
+    """Hash del último registro de la empresa (cabeza de la cadena, O(1))."""
+    return estado_cadena(session, empresa_id).hash
@@ -0,0 +1,335 @@
+# app/services/email_masivo.py
+from __future__ import annotations
+
+import re
+import threading
+import uuid
+from dataclasses import asdict, dataclass, field
+from datetime import date, datetime
+from html import escape
+
+from sqlalchemy import exists, func
+from sqlmodel import Session, select
+
+from app.core.config import settings
+from app.core.logger import logger
+from app.db.shards import sesion_empresa
+from app.models.cliente import Cliente
+from app.models.configuracion_sistema import ConfiguracionSistema
+from app.models.emisor import Emisor
+from app.models.envios_email import EnviosEmail
+from app.models.factura import Factura
+from app.services.email_outbox import despertar_email_outbox, encolar_email
+from app.services.facturas_pdf import generar_factura_pdf
+from app.services.resolver_ruta import resolver_ruta_pdf_factura
+from app.services.resumen_iva import periodo_trimestre
+
+
+# ============================================================
+# ENVÍO MASIVO DE FACTURAS (mail-merge)
+# ============================================================
+# Un trabajo por petición, en un hilo:
+#   1. selecciona las facturas VALIDADAS del filtro (periodo, cliente)
+#   2. reutiliza el PDF del disco; si no existe lo genera
+#   3. rellena asunto/cuerpo por cliente ({cliente}, {numero}, ...)
+#   4. deja cada email en el outbox con el mismo `lote`
+# El envío (reintentos, ritmo por servidor SMTP_MAX_POR_MINUTO) es cosa
+# del outbox. El progreso sale de envios_email por lote, así que sobrevive
+# a un reinicio; los datos de la preparación solo viven en memoria.
+
+ASUNTO_DEFECTO = "Factura {numero}"
+CUERPO_DEFECTO = (
+    "<p>Estimado/a {cliente}:</p>"
+    "<p>Le adjuntamos la factura {numero} de fecha {fecha} "
+    "por importe de {total} €.</p>"
+    "<p>Un saludo,<br>{empresa}</p>"
+)
+
+_COMMIT_CADA = 50
+
+
+@dataclass
+class FiltroEmailMasivo:
+    year: int | None = None
+    trimestre: int | None = None
+    desde: date | None = None
+    hasta: date | None = None          # incluido
+    cliente_id: int | None = None
+    solo_no_enviadas: bool = True
+
+
+@dataclass
+class TrabajoEmailMasivo:
+    lote: str
+    empresa_id: int
+    estado: str = "PREPARANDO"         # PREPARANDO | EN_COLA | ERROR
+    total: int = 0
+    preparadas: int = 0
+    pdfs_generados: int = 0
+    omitidas: list[dict] = field(default_factory=list)
+    error: str | None = None
+    iniciado_en: datetime = field(default_factory=datetime.utcnow)
+    preparado_en: datetime | None = None
+
+
+_trabajos: dict[str, TrabajoEmailMasivo] = {}
+_lock = threading.Lock()
+
+
+# Solo {nombre}: sin atributos, índices ni especificadores de formato
+# ({cliente.__class__}, {total:>999999}), que str.format sí evaluaría
+_MARCADOR = re.compile(r"\{(\w+)\}")
+
+
+def rellenar(plantilla: str, campos: dict, *, html: bool = False) -> str:
+    """
+    Sustituye cada {campo} conocido por su valor (escapado si `html`).
+    Marcadores desconocidos y llaves sueltas se dejan tal cual.
+    """
+    def valor(m: re.Match) -> str:
+        if m.group(1) not in campos:
+            return m.group(0)
+        texto = str(campos[m.group(1)])
+        return escape(texto) if html else texto
+
+    return _MARCADOR.sub(valor, plantilla)
+
+
+def _campos(factura: Factura, emisor: Emisor | None) -> dict:
+    cliente = factura.cliente
+    return {
+        "cliente": cliente.nombre if cliente else "",
+        "numero": factura.numero or "",
+        "fecha": factura.fecha.strftime("%d/%m/%Y") if factura.fecha else "",
+        "total": f"{factura.total or 0:.2f}".replace(".", ","),
+        "empresa": (emisor.nombre if emisor else "") or "",
+    }
+
+
+# ============================================================
+# SELECCIÓN
+# ============================================================
+
+def seleccionar_facturas(
+    session: Session,
+    empresa_id: int,
+    filtro: FiltroEmailMasivo,
+) -> list[Factura]:
+    query = (
+        select(Factura)
+        .where(Factura.empresa_id == empresa_id)
+        .where(Factura.estado == "VALIDADA")
+    )
+
+    if filtro.year and filtro.trimestre:
+        desde, hasta = periodo_trimestre(filtro.year, filtro.trimestre)
+        query = query.where(Factura.fecha >= desde, Factura.fecha < hasta)
+    elif filtro.year:
+        query = query.where(
+            Factura.fecha >= date(filtro.year, 1, 1),
+            Factura.fecha < date(filtro.year + 1, 1, 1),
+        )
+
+    if filtro.desde:
+        query = query.where(Factura.fecha >= filtro.desde)
+    if filtro.hasta:
+        query = query.where(Factura.fecha <= filtro.hasta)
+    if filtro.cliente_id:
+        query = query.where(Factura.cliente_id == filtro.cliente_id)
+
+    if filtro.solo_no_enviadas:
+        query = query.where(
+            ~exists()
+            .where(EnviosEmail.factura_id == Factura.id)
+            .where(EnviosEmail.estado.in_(("PENDIENTE", "ENVIANDO", "OK")))
+        )
+
+    return list(session.exec(query.order_by(Factura.fecha, Factura.id)).all())
+
+
+# ============================================================
+# PREPARACIÓN (hilo del trabajo)
+# ============================================================
+
+def _pdf(factura: Factura, emisor: Emisor, config, trabajo: TrabajoEmailMasivo) -> str:
+    _, ruta = resolver_ruta_pdf_factura(factura, emisor)
+
+    if not ruta.is_file():
+        generar_factura_pdf(
+            factura=factura,
+            lineas=factura.lineas,
+            emisor=emisor,
+            config=config,
+            incluir_mensaje_iva=True,
+        )
+        trabajo.pdfs_generados += 1
+
+    return str(ruta)
+
+
+def _preparar(
+    trabajo: TrabajoEmailMasivo,
+    filtro: FiltroEmailMasivo,
+    asunto: str,
+    cuerpo: str,
+):
+    empresa_id = trabajo.empresa_id
+
+    try:
+        with sesion_empresa(empresa_id) as session:
+            emisor = session.exec(
+                select(Emisor).where(Emisor.empresa_id == empresa_id)
+            ).first()
+            config = session.exec(
+                select(ConfiguracionSistema).where(
+                    ConfiguracionSistema.empresa_id == empresa_id
+                )
+            ).first()
+
+            if not emisor or not config:
+                raise RuntimeError("Falta la configuración del emisor o del sistema")
+
+            facturas = seleccionar_facturas(session, empresa_id, filtro)
+            trabajo.total = len(facturas)
+
+            for factura in facturas:
+                cliente: Cliente | None = factura.cliente
+                email = (cliente.email or "").strip() if cliente else ""
+
+                if not email:
+                    trabajo.omitidas.append({
+                        "factura_id": factura.id,
+                        "numero": factura.numero,
+                        "motivo": "Cliente sin email",
+                    })
+                    continue
+
+                try:
+                    pdf_path = _pdf(factura, emisor, config, trabajo)
+                except Exception as e:
+                    trabajo.omitidas.append({
+                        "factura_id": factura.id,
+                        "numero": factura.numero,
+                        "motivo": f"PDF no generado: {e}",
+                    })
+                    continue
+
+                campos = _campos(factura, emisor)
+
+                encolar_email(
+                    session,
+                    empresa_id=empresa_id,
+                    factura_id=factura.id,
+                    para=email,
+                    asunto=rellenar(asunto, campos),
+                    cuerpo=rellenar(cuerpo, campos, html=True),
+                    pdf_path=pdf_path,
+                    lote=trabajo.lote,
+                    commit=False,
+                )
+                trabajo.preparadas += 1
+
+                # El outbox empieza a enviar mientras se preparan los demás
+                if trabajo.preparadas % _COMMIT_CADA == 0:
+                    session.commit()
+                    despertar_email_outbox()
+
+            session.commit()
+
+        trabajo.estado = "EN_COLA"
+
+    except Exception as e:
+        trabajo.estado = "ERROR"
+        trabajo.error = str(e)
+        logger.error(f"[EMAIL] Envío masivo {trabajo.lote} fallido: {e}")
+
+    finally:
+        trabajo.preparado_en = datetime.utcnow()
+        despertar_email_outbox()
+
+
+def iniciar_email_masivo(
+    empresa_id: int,
+    filtro: FiltroEmailMasivo,
+    *,
+    asunto: str | None = None,
+    cuerpo: str | None = None,
+) -> TrabajoEmailMasivo:
+    """Arranca el trabajo (uno a la vez por empresa). ValueError si ya hay uno."""
+    with _lock:
+        for t in _trabajos.values():
+            if t.empresa_id == empresa_id and t.estado == "PREPARANDO":
+                raise ValueError(f"Ya hay un envío masivo en preparación ({t.lote})")
+
+        trabajo = TrabajoEmailMasivo(lote=uuid.uuid4().hex, empresa_id=empresa_id)
+        _trabajos[trabajo.lote] = trabajo
+
+        # Solo se guardan los más recientes
+        for lote in list(_trabajos)[:-settings.EMAIL_MASIVO_HISTORIAL]:
+            if _trabajos[lote].estado != "PREPARANDO":
+                del _trabajos[lote]
+
+    threading.Thread(
+        target=_preparar,
+        args=(trabajo, filtro, asunto or ASUNTO_DEFECTO, cuerpo or CUERPO_DEFECTO),
+        name=f"email-masivo-{trabajo.lote[:8]}",
+        daemon=True,
+    ).start()
+
+    return trabajo
+
+
+# ============================================================
+# PROGRESO
+# ============================================================
+
+def progreso_email_masivo(session: Session, empresa_id: int, lote: str) -> dict | None:
+    filas = session.exec(
+        select(EnviosEmail.estado, func.count())
+        .where(EnviosEmail.empresa_id == empresa_id)
+        .where(EnviosEmail.lote == lote)
+        .group_by(EnviosEmail.estado)
+    ).all()
+    estados = {estado: total for estado, total in filas}
+
+    # ERROR con proximo_intento: el outbox aún lo reintentará
+    reintentando = session.exec(
+        select(func.count())
+        .select_from(EnviosEmail)
+        .where(EnviosEmail.empresa_id == empresa_id)
+        .where(EnviosEmail.lote == lote)
+        .where(EnviosEmail.estado == "ERROR")
+        .where(EnviosEmail.proximo_intento.is_not(None))
+    ).one()
+
+    trabajo = _trabajos.get(lote)
+    if trabajo and trabajo.empresa_id != empresa_id:
+        trabajo = None
+
+    if not trabajo and not estados:
+        return None
+
+    en_cola = sum(estados.values())
+    enviados = estados.get("OK", 0)
+
+    resultado = {
+        "lote": lote,
+        "estado": trabajo.estado if trabajo else "EN_COLA",
+        "envios": estados,
+        "en_cola": en_cola,
+        "enviados": enviados,
+        "reintentando": reintentando,
+        "terminado": (
+            (not trabajo or trabajo.estado != "PREPARANDO")
+            and estados.get("PENDIENTE", 0) + estados.get("ENVIANDO", 0) + reintentando == 0
+        ),
+    }
+
+    if trabajo:
+        datos = asdict(trabajo)
+        datos.pop("lote")
+        datos.pop("empresa_id")
+        datos.pop("estado")
+        resultado.update(datos)
+
+    return resultado
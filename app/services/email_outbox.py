@@ -0,0 +1,379 @@
+# app/services/email_outbox.py
+from __future__ import annotations
+
+import smtplib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, func, or_, update
+from sqlmodel import Session, select
+
+from app.core.config import settings
+from app.core.logger import logger
+from app.db.shards import bds_de_empresas, sesion_empresa
+from app.models.configuracion_sistema import ConfiguracionSistema
+from app.models.envios_email import EnviosEmail
+from app.services.email_service import construir_mensaje_factura
+from app.services.email_stream import CabeceraInvalida, MensajeStream
+from app.services.smtp_service import ErrorConexionSMTP, conexion_smtp
+
+
+# ============================================================
+# OUTBOX DE EMAILS DE FACTURA
+# ============================================================
+# El endpoint solo graba el EnviosEmail en PENDIENTE (con la ruta del PDF
+# ya generado) y hace commit. Este worker los envía en segundo plano:
+#   - PENDIENTE → ENVIANDO (reserva con lease) → OK | ERROR
+#   - ERROR temporal: reintento con backoff exponencial (intentos /
+#     proximo_intento); rechazo 5xx del servidor o EMAIL_MAX_INTENTOS
+#     agotados: ERROR definitivo (proximo_intento NULL)
+#   - N empresas en paralelo (EMAIL_OUTBOX_WORKERS); conexiones SMTP del
+#     pool (smtp_service.conexion_smtp), reutilizadas entre pasadas
+#   - un ENVIANDO cuyo lease caduca (proceso caído a mitad) se vuelve a
+#     enviar: entrega "al menos una vez"
+
+_despertar = threading.Event()
+_parar = threading.Event()
+_hilo: threading.Thread | None = None
+
+
+def calcular_backoff(intentos: int) -> timedelta:
+    segundos = settings.EMAIL_BACKOFF_BASE * (2 ** max(intentos - 1, 0))
+    return timedelta(seconds=min(segundos, settings.EMAIL_BACKOFF_MAX))
+
+
+def _disponible(ahora: datetime):
+    return or_(
+        EnviosEmail.estado == "PENDIENTE",
+        and_(
+            EnviosEmail.estado.in_(("ERROR", "ENVIANDO")),
+            EnviosEmail.proximo_intento.is_not(None),
+            EnviosEmail.proximo_intento <= ahora,
+        ),
+    )
+
+
+# ============================================================
+# ENCOLAR
+# ============================================================
+
+def encolar_email(
+    session: Session,
+    *,
+    empresa_id: int,
+    factura_id: int,
+    para: str,
+    asunto: str,
+    cuerpo: str | None,
+    cc: list[str] | None = None,
+    pdf_path: str | None = None,
+    lote: str | None = None,
+    commit: bool = True,
+) -> EnviosEmail:
+    envio = EnviosEmail(
+        empresa_id=empresa_id,
+        factura_id=factura_id,
+        destinatario=para,
+        cc=", ".join(cc) if cc else None,
+        asunto=asunto,
+        cuerpo=cuerpo,
+        adjunto_pdf=bool(pdf_path),
+        pdf_path=pdf_path,
+        lote=lote,
+        estado="PENDIENTE",
+    )
+    session.add(envio)
+
+    if commit:
+        session.commit()
+        session.refresh(envio)
+        despertar_email_outbox()
+
+    return envio
+
+
+# ============================================================
+# ENVÍO
+# ============================================================
+
+def _empresas_con_pendientes(session: Session, ahora: datetime) -> list[int]:
+    return list(
+        session.exec(
+            select(EnviosEmail.empresa_id)
+            .where(EnviosEmail.empresa_id.is_not(None))
+            .where(_disponible(ahora))
+            .distinct()
+        ).all()
+    )
+
+
+def _empresas_pendientes() -> list[int]:
+    ahora = datetime.utcnow()
+    empresas = []
+    for bd in bds_de_empresas():
+        with sesion_empresa(bd) as session:
+            empresas.extend(_empresas_con_pendientes(session, ahora))
+    return empresas
+
+
+def _reservar(session: Session, empresa_id: int, limite: int) -> list[EnviosEmail]:
+    """
+    Marca como ENVIANDO (con lease) los siguientes envíos de la empresa.
+    El UPDATE repite la condición: si otro proceso se adelantó, esas filas
+    no vuelven en el RETURNING.
+    """
+    ahora = datetime.utcnow()
+    lease = ahora + timedelta(seconds=settings.EMAIL_LEASE_SEGUNDOS)
+
+    ids = session.exec(
+        select(EnviosEmail.id)
+        .where(EnviosEmail.empresa_id == empresa_id)
+        .where(_disponible(ahora))
+        .order_by(EnviosEmail.id)
+        .limit(limite)
+    ).all()
+
+    if not ids:
+        return []
+
+    reservados = session.exec(
+        update(EnviosEmail)
+        .where(EnviosEmail.id.in_(ids))
+        .where(_disponible(ahora))
+        .values(estado="ENVIANDO", proximo_intento=lease)
+        .returning(EnviosEmail.id)
+    ).scalars().all()
+    session.commit()
+
+    if not reservados:
+        return []
+
+    return list(
+        session.exec(
+            select(EnviosEmail)
+            .where(EnviosEmail.id.in_(reservados))
+            .order_by(EnviosEmail.id)
+        ).all()
+    )
+
+
+def _es_definitivo(error: Exception) -> bool:
+    """Rechazo permanente (5xx), PDF inexistente o dirección no válida: reintentar no sirve."""
+    if isinstance(error, (smtplib.SMTPRecipientsRefused, FileNotFoundError, CabeceraInvalida)):
+        return True
+    return isinstance(error, smtplib.SMTPResponseException) and error.smtp_code >= 500
+
+
+def _marcar_error(envio: EnviosEmail, error: Exception):
+    envio.intentos += 1
+    envio.error = str(error)[:500]
+    envio.estado = "ERROR"
+    envio.proximo_intento = (
+        datetime.utcnow() + calcular_backoff(envio.intentos)
+        if envio.intentos < settings.EMAIL_MAX_INTENTOS and not _es_definitivo(error)
+        else None
+    )
+
+
+def _destinatarios(envio: EnviosEmail) -> list[str]:
+    cc = [c.strip() for c in (envio.cc or "").split(",") if c.strip()]
+    return [envio.destinatario] + cc
+
+
+def _mensaje(envio: EnviosEmail, remitente: str) -> MensajeStream:
+    return construir_mensaje_factura(
+        remitente=remitente,
+        para=envio.destinatario,
+        asunto=envio.asunto,
+        cuerpo=envio.cuerpo or "",
+        cc=_destinatarios(envio)[1:],
+        pdf_path=envio.pdf_path,
+    )
+
+
+def _aplazar(envios: list[EnviosEmail], causa: EnviosEmail):
+    """Devuelve a la cola, sin gastar intento, con el mismo plazo que `causa`."""
+    for envio in envios:
+        envio.estado = "ERROR"
+        envio.error = causa.error
+        envio.proximo_intento = causa.proximo_intento or (
+            datetime.utcnow() + calcular_backoff(1)
+        )
+
+
+def procesar_empresa(empresa_id: int, limite: int | None = None) -> int:
+    """Envía los emails pendientes de una empresa. Devuelve cuántos salieron."""
+    enviados = 0
+
+    with sesion_empresa(empresa_id) as session:
+        config = session.exec(
+            select(ConfiguracionSistema).where(
+                ConfiguracionSistema.empresa_id == empresa_id
+            )
+        ).first()
+
+        # Sin SMTP los envíos esperan en PENDIENTE
+        if not config or not config.smtp_host:
+            return 0
+
+        limite = limite or settings.EMAIL_OUTBOX_LOTE
+        if settings.SMTP_MAX_POR_MINUTO > 0:
+            # Con ritmo limitado, que el lote quepa en medio lease
+            limite = min(
+                limite,
+                max(1, settings.SMTP_MAX_POR_MINUTO * settings.EMAIL_LEASE_SEGUNDOS // 120),
+            )
+
+        envios = _reservar(session, empresa_id, limite)
+        remitente = config.smtp_from or config.smtp_user or settings.EMAIL_FROM
+
+        with conexion_smtp(config) as smtp:
+            for i, envio in enumerate(envios):
+                try:
+                    mensaje = _mensaje(envio, remitente)
+                except Exception as e:
+                    # Fallo al construir (PDF borrado...): la conexión sigue bien
+                    _marcar_error(envio, e)
+                    logger.warning(f"[EMAIL] No se pudo construir id={envio.id}: {envio.error}")
+                    session.add(envio)
+                    session.commit()
+                    continue
+
+                try:
+                    smtp.sendmail(remitente, _destinatarios(envio), mensaje)
+
+                    envio.estado = "OK"
+                    envio.error = None
+                    envio.proximo_intento = None
+                    envio.enviado_en = datetime.utcnow()
+                    enviados += 1
+
+                except ErrorConexionSMTP as e:
+                    # Servidor caído: el resto del lote espera lo mismo que este
+                    _marcar_error(envio, e)
+                    logger.warning(f"[EMAIL] SMTP no disponible empresa={empresa_id}: {e}")
+                    _aplazar(envios[i + 1:], envio)
+                    session.add_all(envios[i:])
+                    session.commit()
+                    break
+
+                except Exception as e:
+                    _marcar_error(envio, e)
+                    logger.warning(
+                        f"[EMAIL] Envío fallido id={envio.id} "
+                        f"intento={envio.intentos}: {envio.error}"
+                    )
+
+                session.add(envio)
+                session.commit()
+
+    return enviados
+
+
+def procesar_email_outbox() -> int:
+    """Un barrido completo: todas las empresas con emails pendientes."""
+    empresas = _empresas_pendientes()
+
+    if not empresas:
+        return 0
+
+    workers = max(1, min(settings.EMAIL_OUTBOX_WORKERS, len(empresas)))
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="email") as pool:
+        return sum(pool.map(procesar_empresa, empresas))
+
+
+# ============================================================
+# CICLO DE VIDA DEL WORKER
+# ============================================================
+
+def _bucle():
+    while not _parar.is_set():
+        try:
+            procesar_email_outbox()
+        except Exception as e:
+            logger.error(f"[EMAIL] Error en outbox: {e}")
+
+        _despertar.wait(settings.EMAIL_OUTBOX_INTERVALO)
+        _despertar.clear()
+
+
+def despertar_email_outbox():
+    """Llamar tras commitear envíos nuevos: envío inmediato."""
+    _despertar.set()
+
+
+def iniciar_email_outbox():
+    global _hilo
+
+    if not settings.EMAIL_OUTBOX_ACTIVO:
+        return
+    if _hilo and _hilo.is_alive():
+        return
+
+    _parar.clear()
+    _hilo = threading.Thread(target=_bucle, name="email-outbox", daemon=True)
+    _hilo.start()
+
+
+def detener_email_outbox(timeout: float = 10.0):
+    _parar.set()
+    _despertar.set()
+    if _hilo:
+        _hilo.join(timeout)
+
+
+# ============================================================
+# ADMINISTRACIÓN
+# ============================================================
+
+def reencolar_errores(session: Session, empresa_id: int) -> int:
+    """Vuelve a PENDIENTE los envíos en ERROR definitivo."""
+    registros = session.exec(
+        select(EnviosEmail)
+        .where(EnviosEmail.empresa_id == empresa_id)
+        .where(EnviosEmail.estado == "ERROR")
+        .where(EnviosEmail.proximo_intento.is_(None))
+    ).all()
+
+    for envio in registros:
+        envio.estado = "PENDIENTE"
+        envio.intentos = 0
+        session.add(envio)
+
+    session.commit()
+    despertar_email_outbox()
+    return len(registros)
+
+
+def resumen_emails(session: Session, empresa_id: int) -> dict:
+    filas = session.exec(
+        select(EnviosEmail.estado, func.count())
+        .where(EnviosEmail.empresa_id == empresa_id)
+        .group_by(EnviosEmail.estado)
+    ).all()
+
+    pendiente_desde = session.exec(
+        select(func.min(EnviosEmail.creado_en))
+        .where(EnviosEmail.empresa_id == empresa_id)
+        .where(EnviosEmail.estado.in_(("PENDIENTE", "ENVIANDO")))
+    ).one()
+
+    ultimo_envio = session.exec(
+        select(func.max(EnviosEmail.enviado_en))
+        .where(EnviosEmail.empresa_id == empresa_id)
+    ).one()
+
+    return {
+        "estados": {estado: total for estado, total in filas},
+        "reintentando": session.exec(
+            select(func.count())
+            .select_from(EnviosEmail)
+            .where(EnviosEmail.empresa_id == empresa_id)
+            .where(EnviosEmail.estado == "ERROR")
+            .where(EnviosEmail.proximo_intento.is_not(None))
+        ).one(),
+        "pendiente_desde": pendiente_desde,
+        "ultimo_envio": ultimo_envio,
+    }
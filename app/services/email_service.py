@@ -3,18 +3,18 @@ import smtplib
 import socket
 import threading
 import ssl
+from types import SimpleNamespace
 
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from email.mime.application import MIMEApplication
 from sqlmodel import select
 from fastapi import Request
-from sqlmodel import Session
-from app.db.session import engine
+from app.db.shards import bds_de_empresas, sesion_empresa
 from app.models.configuracion_sistema import ConfiguracionSistema
 from app.models.emisor import Emisor
 from app.services.facturas_pdf import generar_factura_pdf
-from app.services.smtp_service import smtp_connect
+from app.services.email_stream import MensajeStream
+from app.services.smtp_service import conexion_smtp
 
 
 # =========================
@@ -30,19 +30,25 @@ def _load_smtp_config(empresa_id: int | None = None):
     """
     from app.models.empresa import Empresa
 
-    with Session(engine) as db:
-        if empresa_id:
+    if empresa_id:
+        with sesion_empresa(empresa_id) as db:
             return db.exec(
                 select(ConfiguracionSistema)
                 .where(ConfiguracionSistema.empresa_id == empresa_id)
             ).first()
 
-        # fallback: primera empresa con smtp configurado
-        return db.exec(
-            select(ConfiguracionSistema)
-            .where(ConfiguracionSistema.smtp_enabled == True)
-            .order_by(ConfiguracionSistema.empresa_id)
-        ).first()
+    # fallback: primera empresa con smtp configurado
+    for bd in bds_de_empresas():
+        with sesion_empresa(bd) as db:
+            config = db.exec(
+                select(ConfiguracionSistema)
+                .where(ConfiguracionSistema.smtp_enabled == True)
+                .order_by(ConfiguracionSistema.empresa_id)
+            ).first()
+        if config:
+            return config
+
+    return None
 
 
 # =========================
@@ -77,14 +83,8 @@ def send_email(
 
     recipients = [to_email] + cc_list
 
-    server = smtp_connect(cfg)
-    try:
-        server.sendmail(sender, recipients, msg.as_string())
-    finally:
-        try:
-            server.quit()
-        except:
-            pass
+    with conexion_smtp(cfg) as smtp:
+        smtp.sendmail(sender, recipients, msg.as_string())
 
 
 # =========================
@@ -131,8 +131,10 @@ def enviar_email_factura(request: Request,
 ):
     from app.models.factura import Factura
 
+    empresa_id = request.session["empresa_id"]
+
     # -------- Abrir sesión independiente --------
-    with Session(engine) as session:
+    with sesion_empresa(empresa_id) as session:
         factura = session.get(Factura, factura_id)
         if not factura:
             raise Exception("Factura no encontrada")
@@ -140,8 +142,6 @@ def enviar_email_factura(request: Request,
         session.refresh(factura)
         _ = factura.lineas
 
-        empresa_id = request.session["empresa_id"]
-
         config = session.exec(
             select(ConfiguracionSistema)
             .where(ConfiguracionSistema.empresa_id == empresa_id)
@@ -221,16 +221,10 @@ def enviar_email_factura(request: Request,
 
 
     # -------- SMTP --------
-    server = smtp_connect(config)
     send_to = [para] + cc_list
 
-    try:
-        server.sendmail(config.smtp_user, send_to, msg.as_string())
-    finally:
-        try:
-            server.quit()
-        except:
-            pass
+    with conexion_smtp(config) as smtp:
+        smtp.sendmail(config.smtp_user, send_to, msg.as_string())
 
 
 # =========================
@@ -259,6 +253,29 @@ def run_async(fn, *args, **kwargs):
     t.start()
 
 
+def construir_mensaje_factura(
+    *,
+    remitente: str,
+    para: str,
+    asunto: str,
+    cuerpo: str,
+    cc: list[str] | None = None,
+    pdf_path: str | None = None,
+) -> MensajeStream:
+    """
+    El PDF no se carga en memoria: se codifica desde el disco al enviar
+    (ver app/services/email_stream.py). FileNotFoundError si no existe.
+    """
+    return MensajeStream(
+        remitente=remitente,
+        para=para,
+        asunto=asunto,
+        cuerpo_html=cuerpo,
+        cc=cc,
+        adjuntos=[pdf_path] if pdf_path else None,
+    )
+
+
 def enviar_email_factura_construido(
     smtp_config,
     para: str,
@@ -268,56 +285,24 @@ def enviar_email_factura_construido(
     pdf_path: str | None,
     remitente: str
 ):
-    import smtplib
-    from email.mime.multipart import MIMEMultipart
-    from email.mime.text import MIMEText
-    from email.mime.application import MIMEApplication
-    import ssl
-
-    msg = MIMEMultipart()
-    msg["From"] = remitente
-    msg["To"] = para
-    msg["Subject"] = asunto
-
-    if cc:
-        msg["Cc"] = ", ".join(cc)
-
-    msg.attach(MIMEText(cuerpo, "html", "utf-8"))
-
-    if pdf_path:
-        with open(pdf_path, "rb") as f:
-            part = MIMEApplication(f.read(), _subtype="pdf")
-            part.add_header("Content-Disposition", "attachment", filename=os.path.basename(pdf_path))
-            msg.attach(part)
-
-    context = ssl.create_default_context()
-
-    if smtp_config["ssl"]:
-        server = smtplib.SMTP_SSL(
-            smtp_config["host"],
-            smtp_config["port"],
-            context=context,
-            timeout=25
-        )
-    else:
-        server = smtplib.SMTP(
-            smtp_config["host"],
-            smtp_config["port"],
-            timeout=25
-        )
-        server.ehlo()
-        if smtp_config["tls"]:
-            server.starttls(context=context)
-
-    if smtp_config["user"]:
-        server.login(smtp_config["user"], smtp_config["password"])
+    msg = construir_mensaje_factura(
+        remitente=remitente,
+        para=para,
+        asunto=asunto,
+        cuerpo=cuerpo,
+        cc=cc,
+        pdf_path=pdf_path,
+    )
 
+    config = SimpleNamespace(
+        smtp_host=smtp_config["host"],
+        smtp_port=smtp_config["port"],
+        smtp_user=smtp_config["user"],
+        smtp_password=smtp_config["password"],
+        smtp_ssl=smtp_config["ssl"],
+        smtp_tls=smtp_config["tls"],
+    )
     recipients = [para] + (cc or [])
 
-    try:
-        server.sendmail(remitente, recipients, msg.as_string())
-    finally:
-        try:
-            server.quit()
-        except:
-            pass
+    with conexion_smtp(config) as smtp:
+        smtp.sendmail(remitente, recipients, msg)
@@ -0,0 +1,189 @@
+# app/services/email_stream.py
+from __future__ import annotations
+
+import base64
+import os
+import re
+import smtplib
+from email.header import Header
+from email.mime.text import MIMEText
+from email.utils import encode_rfc2231, formataddr, formatdate, getaddresses, make_msgid
+from typing import Iterator
+
+
+# ============================================================
+# MENSAJES CON ADJUNTOS EN STREAMING
+# ============================================================
+# MIMEApplication(f.read()) + msg.as_string() copia cada PDF varias veces
+# (bytes, base64, texto del mensaje completo). Aquí solo las cabeceras y
+# el cuerpo HTML están en memoria; cada adjunto se lee del disco en
+# bloques y se codifica en base64 al vuelo, directamente hacia el socket
+# SMTP durante el DATA:
+#
+#   msg = MensajeStream(remitente=..., para=..., asunto=..., cuerpo_html=...,
+#                       adjuntos=["/data/.../Factura_A-1.pdf"])
+#   enviar_stream(server, remitente, destinatarios, msg)
+#
+# Memoria por mensaje: un bloque de lectura (BLOQUE) y su base64.
+
+# Múltiplo de 57 bytes → líneas base64 completas de 76 caracteres
+BLOQUE = 57 * 1024
+_CRLF = b"\r\n"
+
+
+def _crlf(datos: bytes) -> bytes:
+    return re.sub(rb"\r?\n", _CRLF, datos)
+
+
+def _dot_stuffing(datos: bytes) -> bytes:
+    # Líneas que empiezan por "." se duplican (RFC 5321 §4.5.2)
+    return re.sub(rb"(?m)^\.", b"..", datos)
+
+
+def _cabecera(nombre: str, valor: str) -> bytes:
+    valor = Header(valor, "utf-8").encode(linesep="\r\n")
+    return f"{nombre}: {valor}".encode("ascii") + _CRLF
+
+
+class CabeceraInvalida(ValueError):
+    """Dirección con saltos de línea: permitiría añadir cabeceras (Bcc...)."""
+
+
+def _direcciones(nombre: str, direcciones: list[str]) -> bytes:
+    # formataddr codifica el nombre visible no ASCII (RFC 2047)
+    for direccion in direcciones:
+        if "\r" in direccion or "\n" in direccion:
+            raise CabeceraInvalida(f"{nombre} no válido: {direccion!r}")
+
+    try:
+        valor = ", ".join(formataddr(par, "utf-8") for par in getaddresses(direcciones))
+    except UnicodeEncodeError:
+        # La dirección (no el nombre) tiene que ser ASCII
+        raise CabeceraInvalida(f"{nombre} no válido: {', '.join(direcciones)!r}")
+
+    return f"{nombre}: {valor}".encode() + _CRLF
+
+
+def _nombre_adjunto(ruta: str) -> str:
+    nombre = os.path.basename(ruta)
+    try:
+        nombre.encode("ascii")
+        return f'filename="{nombre}"'
+    except UnicodeEncodeError:
+        return f"filename*={encode_rfc2231(nombre, 'utf-8')}"
+
+
+class MensajeStream:
+    """multipart/mixed: cuerpo HTML + adjuntos PDF leídos del disco."""
+
+    def __init__(
+        self,
+        *,
+        remitente: str,
+        para: str,
+        asunto: str,
+        cuerpo_html: str,
+        cc: list[str] | None = None,
+        adjuntos: list[str] | None = None,
+    ):
+        self.adjuntos = [a for a in (adjuntos or []) if a]
+
+        for ruta in self.adjuntos:
+            if not os.path.isfile(ruta):
+                raise FileNotFoundError(f"No se encontró el adjunto: {ruta}")
+
+        self._frontera = f"=_{make_msgid(domain='factura')[1:-1]}"
+
+        cabeceras = [
+            _direcciones("From", [remitente]),
+            _direcciones("To", [para]),
+        ]
+        if cc:
+            cabeceras.append(_direcciones("Cc", cc))
+        cabeceras += [
+            _cabecera("Subject", asunto),
+            f"Date: {formatdate(localtime=True)}".encode() + _CRLF,
+            f"Message-ID: {make_msgid()}".encode() + _CRLF,
+            b"MIME-Version: 1.0" + _CRLF,
+            f'Content-Type: multipart/mixed; boundary="{self._frontera}"'.encode() + _CRLF,
+            _CRLF,
+        ]
+        self._cabeceras = b"".join(cabeceras)
+
+        html = MIMEText(cuerpo_html, "html", "utf-8")
+        del html["MIME-Version"]
+        self._html = _crlf(html.as_bytes())
+
+    def _inicio_parte(self) -> bytes:
+        return f"--{self._frontera}".encode() + _CRLF
+
+    def bloques(self) -> Iterator[bytes]:
+        """Mensaje completo en trozos, con CRLF y dot-stuffing aplicados."""
+        yield _dot_stuffing(self._cabeceras)
+
+        yield self._inicio_parte()
+        yield _dot_stuffing(self._html) + _CRLF
+
+        for ruta in self.adjuntos:
+            yield self._inicio_parte()
+            yield (
+                f"Content-Type: application/pdf\r\n"
+                f"Content-Transfer-Encoding: base64\r\n"
+                f"Content-Disposition: attachment; {_nombre_adjunto(ruta)}\r\n"
+                f"\r\n"
+            ).encode()
+
+            # El alfabeto base64 no contiene "." → sin dot-stuffing
+            with open(ruta, "rb") as f:
+                while bloque := f.read(BLOQUE):
+                    yield base64.encodebytes(bloque).replace(b"\n", _CRLF)
+
+        yield f"--{self._frontera}--".encode() + _CRLF
+
+    def as_bytes(self) -> bytes:
+        """Mensaje entero en memoria (depuración; sin dot-stuffing)."""
+        return re.sub(rb"(?m)^\.\.", b".", b"".join(self.bloques()))
+
+
+def enviar_stream(
+    server: smtplib.SMTP,
+    remitente: str,
+    destinatarios: list[str],
+    mensaje: MensajeStream,
+) -> dict:
+    """
+    Equivalente a server.sendmail() escribiendo el DATA por bloques.
+    Mismas excepciones y mismo valor de retorno (destinatarios rechazados).
+    """
+    server.ehlo_or_helo_if_needed()
+
+    code, resp = server.mail(remitente)
+    if code != 250:
+        server.rset()
+        raise smtplib.SMTPSenderRefused(code, resp, remitente)
+
+    rechazados = {}
+    for destino in destinatarios:
+        code, resp = server.rcpt(destino)
+        if code not in (250, 251):
+            rechazados[destino] = (code, resp)
+
+    if len(rechazados) == len(destinatarios):
+        server.rset()
+        raise smtplib.SMTPRecipientsRefused(rechazados)
+
+    code, resp = server.docmd("data")
+    if code != 354:
+        server.rset()
+        raise smtplib.SMTPDataError(code, resp)
+
+    for bloque in mensaje.bloques():
+        server.send(bloque)
+    server.send(b"." + _CRLF)
+
+    code, resp = server.getreply()
+    if code != 250:
+        server.rset()
+        raise smtplib.SMTPDataError(code, resp)
+
+    return rechazados
@@ -0,0 +1,204 @@
+# app/services/explorador.py
+from __future__ import annotations
+
+import base64
+import json
+import os
+import threading
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from pathlib import Path
+
+from app.services.catalogo_almacenamiento import EXCLUIDAS, RAIZ
+
+
+# ============================================================
+# LISTADO PAGINADO DE CARPETAS (explorador de /storage)
+# ============================================================
+# Un solo nivel cada vez, con os.scandir, ordenado por nombre / tamaño /
+# fecha (carpetas primero) y paginado con cursores opacos:
+#   - el listado ordenado de cada carpeta se guarda en un LRU por
+#     (carpeta, mtime de la carpeta, orden): crear, borrar o reemplazar
+#     (os.replace, blobs.guardar) cambia el mtime y lo invalida
+#   - el cursor lleva la clave del último elemento (keyset) y cada página
+#     sale con bisect: no se desplaza si entran o salen archivos
+#   - ordenando por nombre no se hace stat de toda la carpeta, solo de
+#     los elementos de la página
+#
+#   pagina = listar_directorio(RAIZ / "facturas", orden="tamano", desc=True)
+#   listar_directorio(..., cursor=pagina["siguiente"])
+
+ORDENES = ("nombre", "tamano", "mtime")
+
+LIMITE_DEFECTO = 100
+LIMITE_MAX = 500
+LISTADO_CACHE_MAX = 16          # carpetas ordenadas en memoria
+
+_CARPETAS, _ARCHIVOS = 0, 1
+
+_listados: "OrderedDict[tuple, tuple]" = OrderedDict()
+_lock = threading.Lock()
+
+
+class CursorInvalido(ValueError):
+    pass
+
+
+def _valor(orden: str, nombre: str, es_dir: bool, st: os.stat_result | None):
+    if orden == "nombre":
+        return nombre.casefold()
+    if orden == "tamano":
+        return 0 if es_dir else st.st_size
+    return st.st_mtime_ns
+
+
+def _leer(carpeta: str, orden: str, ocultos: bool, excluir: frozenset) -> tuple:
+    """
+    Claves (valor, nombre) ordenadas de carpetas y de archivos, y el stat
+    de cada nombre (vacío ordenando por nombre).
+    """
+    carpetas, archivos = [], []
+    stats = {}
+    con_stat = orden != "nombre"
+
+    with os.scandir(carpeta) as entradas:
+        for e in entradas:
+            nombre = e.name
+            if nombre in excluir or (not ocultos and nombre[0] == "."):
+                continue
+            try:
+                es_dir = e.is_dir()
+                st = e.stat() if con_stat else None
+            except OSError:
+                continue
+
+            if con_stat:
+                stats[nombre] = st
+            (carpetas if es_dir else archivos).append((_valor(orden, nombre, es_dir, st), nombre))
+
+    carpetas.sort()
+    archivos.sort()
+    return (carpetas, archivos), stats
+
+
+def _listado(carpeta: Path, orden: str, ocultos: bool) -> tuple:
+    st = os.stat(carpeta)
+    clave = (str(carpeta), st.st_mtime_ns, orden, ocultos)
+
+    with _lock:
+        listado = _listados.get(clave)
+        if listado is not None:
+            _listados.move_to_end(clave)
+            return listado
+
+    # El almacén de blobs no se enseña nunca
+    excluir = frozenset(EXCLUIDAS) if carpeta == RAIZ else frozenset()
+    listado = _leer(str(carpeta), orden, ocultos, excluir)
+
+    with _lock:
+        _listados[clave] = listado
+        while len(_listados) > LISTADO_CACHE_MAX:
+            _listados.popitem(last=False)
+    return listado
+
+
+def _cifrar(orden: str, desc: bool, grupo: int, clave: tuple) -> str:
+    crudo = json.dumps([orden, int(desc), grupo, *clave], separators=(",", ":"))
+    return base64.urlsafe_b64encode(crudo.encode()).decode().rstrip("=")
+
+
+def _descifrar(cursor: str, orden: str, desc: bool) -> tuple[int, tuple]:
+    try:
+        crudo = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        c_orden, c_desc, grupo, valor, nombre = json.loads(crudo)
+    except (ValueError, TypeError):
+        raise CursorInvalido("Cursor no válido")
+
+    if c_orden != orden or bool(c_desc) != desc or grupo not in (_CARPETAS, _ARCHIVOS):
+        raise CursorInvalido("El cursor es de otro orden")
+    if not isinstance(nombre, str) or isinstance(valor, bool) or (
+        not isinstance(valor, str) if orden == "nombre" else not isinstance(valor, int)
+    ):
+        raise CursorInvalido("Cursor no válido")
+
+    return grupo, (valor, nombre)
+
+
+def _item(carpeta: Path, nombre: str, st: os.stat_result | None, es_dir: bool) -> dict:
+    if st is None:
+        try:
+            st = os.stat(carpeta / nombre)
+        except OSError:
+            st = None
+
+    return {
+        "nombre": nombre,
+        "es_dir": es_dir,
+        "tamano": None if es_dir or st is None else st.st_size,
+        "mtime": st.st_mtime if st else None,
+    }
+
+
+def listar_directorio(
+    carpeta,
+    *,
+    orden: str = "nombre",
+    desc: bool = False,
+    cursor: str | None = None,
+    limite: int = LIMITE_DEFECTO,
+    ocultos: bool = False,
+) -> dict:
+    """
+    Una página de `carpeta`: {"items", "siguiente", "total"}. `siguiente`
+    es el cursor de la página siguiente (None si no hay más).
+    Lanza FileNotFoundError / NotADirectoryError / CursorInvalido.
+    """
+    if orden not in ORDENES:
+        raise ValueError(f"Orden no válido: {orden}")
+
+    carpeta = Path(carpeta)
+    limite = max(1, min(int(limite), LIMITE_MAX))
+    grupos, stats = _listado(carpeta, orden, ocultos)
+    inicio = _descifrar(cursor, orden, desc) if cursor else None
+
+    # Uno de más para saber si hay página siguiente
+    posiciones: list[tuple[int, int]] = []
+    primer_grupo = inicio[0] if inicio else _CARPETAS
+
+    for grupo in range(primer_grupo, _ARCHIVOS + 1):
+        claves = grupos[grupo]
+        falta = limite + 1 - len(posiciones)
+        desde_cursor = inicio is not None and grupo == primer_grupo
+
+        try:
+            if desc:
+                fin = bisect_left(claves, inicio[1]) if desde_cursor else len(claves)
+                indices = range(fin - 1, max(fin - 1 - falta, -1), -1)
+            else:
+                ini = bisect_right(claves, inicio[1]) if desde_cursor else 0
+                indices = range(ini, min(ini + falta, len(claves)))
+        except TypeError:
+            raise CursorInvalido("Cursor no válido")
+
+        posiciones += [(grupo, i) for i in indices]
+        if len(posiciones) > limite:
+            break
+
+    hay_mas = len(posiciones) > limite
+    posiciones = posiciones[:limite]
+
+    items = []
+    for grupo, i in posiciones:
+        nombre = grupos[grupo][i][1]
+        items.append(_item(carpeta, nombre, stats.get(nombre), grupo == _CARPETAS))
+
+    siguiente = None
+    if hay_mas:
+        grupo, i = posiciones[-1]
+        siguiente = _cifrar(orden, desc, grupo, grupos[grupo][i])
+
+    return {
+        "items": items,
+        "siguiente": siguiente,
+        "total": len(grupos[_CARPETAS]) + len(grupos[_ARCHIVOS]),
+    }
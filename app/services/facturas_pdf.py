@@ -5,13 +5,12 @@ import textwrap
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.utils import simpleSplit
-from reportlab.graphics.barcode.qr import QrCodeWidget
-from reportlab.graphics.shapes import Drawing
 from reportlab.lib.units import mm
 
-from app.services.verifactu_qr import construir_url_qr
+from app.services.verifactu_qr import construir_url_qr, obtener_drawing_qr
 from app.models.configuracion_sistema import ConfiguracionSistema
 from app.services.resolver_ruta import resolver_ruta_pdf_factura
+from app.services.blobs import guardar, temporal
 import os
 
 def generar_factura_pdf(
@@ -44,7 +43,11 @@ def generar_factura_pdf(
     # Asegurar carpeta (aunque ya lo hace el resolver, pero es seguro)
     destino.mkdir(parents=True, exist_ok=True)
 
-    c = canvas.Canvas(str(ruta_pdf), pagesize=A4)
+    # Se escribe aparte y se guarda en el almacén de blobs (app/services/blobs.py).
+    # invariant: sin fecha ni ID aleatorio → regenerar la misma factura da los
+    # mismos bytes y reutiliza el blob
+    tmp_pdf = temporal(ruta_pdf)
+    c = canvas.Canvas(str(tmp_pdf), pagesize=A4, invariant=1)
 
     # =============================
     # Crear PDF
@@ -388,8 +391,11 @@ def generar_factura_pdf(
             c.drawString(margen_x, y_legal, linea)
             y_legal -= 12
 
-    c.save()
-
+    try:
+        c.save()
+        guardar(tmp_pdf, ruta_pdf, empresa_id=factura.empresa_id)
+    finally:
+        tmp_pdf.unlink(missing_ok=True)
 
     return ruta_pdf, os.path.basename(ruta_pdf)
 
@@ -397,17 +403,7 @@ def dibujar_qr(c, url: str, x: float, y: float, size_mm: float = 35):
     """
     Dibuja un QR conforme a ISO/IEC 18004.
     Tamaño recomendado AEAT: 30–40 mm.
+    El dibujo sale de la caché por URL (no se recodifica en cada render).
     """
-    qr = QrCodeWidget(url)
-    bounds = qr.getBounds()
-    w = bounds[2] - bounds[0]
-    h = bounds[3] - bounds[1]
-
-    size = size_mm * mm
-    d = Drawing(
-        size,
-        size,
-        transform=[size / w, 0, 0, size / h, 0, 0],
-    )
-    d.add(qr)
+    d = obtener_drawing_qr(url, size_mm)
     d.drawOn(c, x, y)
@@ -1,15 +1,18 @@
 from datetime import date
+from decimal import Decimal
+from sqlalchemy import delete
 from sqlmodel import Session, select
 from fastapi import HTTPException
-from app.models.factura import Factura
+from app.models.factura import Factura, FacturaIvaDesglose
 from app.models.emisor import Emisor
 from app.models.linea_factura import LineaFactura
 from app.models.emisor import Emisor
-import re
+from app.services.numerador import reservar_numeros, siguiente_numero_previsto
+from app.services.plantilla_numeracion import plantilla_emisor
+from app.services.totales import TotalesFactura, calcular_totales, totales_vacios
 
 
-def generar_numero_factura(session: Session, fecha: date, empresa_id: int) -> str:
-    
+def _get_emisor(session: Session, empresa_id: int) -> Emisor:
     emisor = session.exec(
         select(Emisor).where(Emisor.empresa_id == empresa_id)
     ).first()
@@ -17,50 +20,73 @@ def generar_numero_factura(session: Session, fecha: date, empresa_id: int) -> st
     if not emisor:
         raise HTTPException(400, "No hay emisor configurado para esta empresa")
 
-    year = fecha.year
+    return emisor
 
-    # Reiniciar correlativo si cambia de año
-    if emisor.ultimo_anio_numerado != year:
-        emisor.siguiente_numero = 1
-        emisor.ultimo_anio_numerado = year
-        session.add(emisor)
-        session.commit()
 
-    correlativo = emisor.siguiente_numero or 1
-    plantilla = (emisor.numeracion_plantilla or "{YEAR}-{NUM:04d}").strip()
-
-    # ===============================
-    # {NUM:0Nd}
-    # ===============================
-    def repl_num(match):
-        formato = match.group(1)      # ej: 04
-        ancho = int(formato)
-        return f"{correlativo:0{ancho}d}"
-
-    numero = re.sub(r"\{NUM:(0\d+)d\}", repl_num, plantilla)
-
-    # ===============================
-    # Otros placeholders
-    # ===============================
-    numero = numero.replace("{NUM}", str(correlativo))
-    numero = numero.replace("{SERIE}", (emisor.serie_facturacion or "").strip())
-    numero = numero.replace("{YEAR}", str(year))
-    numero = numero.replace("{MONTH}", f"{fecha.month:02d}")
-
-    # Limpieza final → si queda algo raro, lo quitamos
-    numero = re.sub(r"\{.*?\}", "", numero).strip()
-
-    # ===============================
-    # Incrementar correlativo REAL
-    # ===============================
-    emisor.siguiente_numero = correlativo + 1
-    session.add(emisor)
-    session.commit()
+def generar_numero_factura(session: Session, fecha: date, empresa_id: int) -> str:
+    return generar_numeros_factura(session, fecha, empresa_id, 1)[0]
+
+
+def generar_numeros_factura(
+    session: Session,
+    fecha: date,
+    empresa_id: int,
+    cantidad: int,
+) -> list[str]:
+    """
+    Reserva `cantidad` números consecutivos (un solo UPDATE ... RETURNING)
+    y los formatea con la plantilla compilada del emisor.
+    Sin commits intermedios: se confirman junto con las facturas.
+    """
+    emisor = _get_emisor(session, empresa_id)
+
+    correlativos = reservar_numeros(session, emisor, fecha.year, cantidad)
+
+    return plantilla_emisor(emisor).formatear_lote(
+        correlativos, fecha, emisor.serie_facturacion
+    )
+
+
+def numerar_facturas_lote(
+    session: Session,
+    emisor: Emisor,
+    facturas: list[Factura],
+) -> None:
+    """
+    Asigna número a varias facturas YA ordenadas cronológicamente.
+    Un único bloque contiguo por año (una reserva por año, no por factura).
+    """
+    plantilla = plantilla_emisor(emisor)
+
+    por_anio: dict[int, list[Factura]] = {}
+    for f in facturas:
+        por_anio.setdefault(f.fecha.year, []).append(f)
+
+    for anio, grupo in por_anio.items():
+        correlativos = reservar_numeros(session, emisor, anio, len(grupo))
+
+        for f, n in zip(grupo, correlativos):
+            f.numero = plantilla.formatear(n, f.fecha, emisor.serie_facturacion)
+
+
+def previsualizar_numeros_factura(
+    session: Session,
+    emisor: Emisor,
+    fecha: date,
+    cantidad: int = 1,
+) -> list[str]:
+    """
+    Números que se asignarían a las próximas `cantidad` facturas.
+    Solo lee el contador; no reserva nada.
+    """
+    primero = siguiente_numero_previsto(session, emisor, fecha.year)
 
-    return numero
+    return plantilla_emisor(emisor).formatear_lote(
+        range(primero, primero + cantidad), fecha, emisor.serie_facturacion
+    )
 
 
-def bloquear_numeracion(session: Session, fecha: date, empresa_id: int):
+def bloquear_numeracion(session: Session, fecha: date, empresa_id: int, commit: bool = True):
     """
     Se ejecuta automáticamente al validar la primera factura del año.
     Bloquea el modo de numeración hasta el año siguiente.
@@ -84,25 +110,89 @@ def bloquear_numeracion(session: Session, fecha: date, empresa_id: int):
     emisor.anio_numeracion_bloqueada = year
 
     session.add(emisor)
-    session.commit()
+    if commit:
+        session.commit()
 
 
 def recalcular_totales(factura: Factura, lineas: list[LineaFactura]):
-    subtotal = 0.0
+    recalcular_totales_lote([(factura, lineas)])
+    return factura
 
-    for l in lineas:
-        base = l.cantidad * l.precio_unitario
-        subtotal += base
-        l.total = base
 
-    factura.subtotal = round(subtotal, 2)
+def _tipo_linea(factura: Factura, linea: LineaFactura) -> float:
+    return linea.iva if linea.iva is not None else (factura.iva_global or 0)
 
-    iva_percent = factura.iva_global or 0.0
-    factura.iva_total = round(subtotal * (iva_percent / 100), 2)
 
-    factura.total = round(factura.subtotal + factura.iva_total, 2)
+def calcular_totales_facturas(
+    facturas: list[tuple[Factura, list[LineaFactura]]],
+) -> list[TotalesFactura]:
+    """
+    Totales de muchas facturas en una sola pasada del motor
+    (services/totales.py, decimal exacto), sin modificar nada. Cada línea
+    va a su tipo de IVA o, si no tiene, al IVA global de la factura.
+    """
+    columnas = {"facturas": [], "cantidades": [], "precios": [], "tipos_iva": []}
+
+    for i, (factura, lineas) in enumerate(facturas):
+        for l in lineas:
+            columnas["facturas"].append(i)
+            columnas["cantidades"].append(l.cantidad)
+            columnas["precios"].append(l.precio_unitario)
+            columnas["tipos_iva"].append(_tipo_linea(factura, l))
+
+    resultado = calcular_totales(**columnas)
+
+    return [resultado.get(i) or totales_vacios() for i in range(len(facturas))]
+
+
+def aplicar_totales(factura: Factura, totales: TotalesFactura):
+    factura.subtotal = float(totales.subtotal)
+    factura.iva_total = float(totales.iva_total)
+    factura.total = float(totales.total)
+
+
+def recalcular_totales_lote(
+    facturas: list[tuple[Factura, list[LineaFactura]]],
+) -> list[TotalesFactura]:
+    """
+    Recalcula y asigna los totales (factura y líneas) de muchas facturas.
+    Devuelve los totales (con desglose por tipo) en el mismo orden.
+    """
+    salida = calcular_totales_facturas(facturas)
+
+    for (factura, lineas), totales in zip(facturas, salida):
+        for l, importe in zip(lineas, totales.lineas):
+            l.total = float(importe)
+        aplicar_totales(factura, totales)
+
+    return salida
+
+
+def guardar_desglose_iva(
+    session: Session,
+    factura: Factura,
+    totales: TotalesFactura,
+):
+    """
+    Sustituye el desglose de IVA de la factura (una fila por tipo).
+    No hace commit: se confirma con la validación.
+    """
+    session.exec(
+        delete(FacturaIvaDesglose).where(FacturaIvaDesglose.factura_id == factura.id)
+    )
+
+    desglose = totales.desglose or {Decimal(str(factura.iva_global or 0)): (Decimal(0), Decimal(0))}
+
+    for tipo, (base, cuota) in desglose.items():
+        session.add(FacturaIvaDesglose(
+            factura_id=factura.id,
+            empresa_id=factura.empresa_id,
+            fecha=factura.fecha,
+            tipo=float(tipo),
+            base=float(base),
+            cuota=float(cuota),
+        ))
 
-    return factura
 
 def generar_mensaje_rectificativa(factura, emisor):
     """
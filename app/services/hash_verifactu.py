@@ -0,0 +1,113 @@
+# app/services/hash_verifactu.py
+from __future__ import annotations
+
+import json
+from datetime import date, datetime
+from decimal import Decimal, ROUND_HALF_UP
+from hashlib import sha256
+
+
+# ============================================================
+# HASH CANÓNICO DE REGISTROS VERI*FACTU
+# ============================================================
+# v1 (histórico): dict anidado + json.dumps(sort_keys=True); el total es un
+#     float de Python, así que su repr puede no coincidir con el importe
+#     impreso (24.0 / 0.30000000000000004...). Se conserva SOLO para
+#     verificar registros antiguos.
+#
+# v2 (actual): campos en orden fijo, separados por \x1f, escritos uno a uno
+#     en el objeto sha256 (sin dicts ni JSON intermedios). Importes como
+#     Decimal con 2 decimales (ROUND_HALF_UP), igual que en la factura.
+#
+#     "VF2" US nif US numero US fecha US total US fecha_registro US hash_anterior
+
+HASH_VERSION_ACTUAL = 2
+
+_SEP = b"\x1f"
+_CENTIMOS = Decimal("0.01")
+
+
+def importe_canonico(valor) -> str:
+    """Importe con 2 decimales exactos: 24.3 → '24.30', 0.1+0.2 → '0.30'."""
+    if valor is None:
+        valor = 0
+    if not isinstance(valor, Decimal):
+        valor = Decimal(str(valor))
+    return str(valor.quantize(_CENTIMOS, rounding=ROUND_HALF_UP))
+
+
+def _texto(valor: str) -> bytes:
+    # El separador no puede aparecer dentro de un campo
+    return valor.replace("\x1f", "").encode("utf-8")
+
+
+def hash_registro_v2(
+    *,
+    nif_emisor: str,
+    numero: str,
+    fecha: date,
+    total,
+    fecha_registro: datetime,
+    hash_anterior: str | None,
+) -> str:
+    h = sha256(b"VF2")
+
+    for campo in (
+        _texto(nif_emisor.strip().upper()),
+        _texto(numero.strip()),
+        fecha.isoformat()[:10].encode(),
+        importe_canonico(total).encode(),
+        fecha_registro.isoformat().encode(),
+        (hash_anterior or "").encode(),
+    ):
+        h.update(_SEP)
+        h.update(campo)
+
+    return h.hexdigest()
+
+
+def hash_registro_v1(
+    *,
+    nif_emisor: str,
+    numero: str,
+    fecha: date,
+    total,
+    fecha_registro: datetime,
+    hash_anterior: str | None,
+) -> str:
+    payload_hash = {
+        "emisor": {
+            "nif": nif_emisor.strip().upper(),
+        },
+        "factura": {
+            "numero": numero.strip(),
+            "fecha": fecha.isoformat()[:10],
+            "total": float(total or 0.0),
+        },
+        "registro": {
+            "fecha_registro_utc": fecha_registro.isoformat(),
+            "hash_anterior": hash_anterior or "",
+        },
+    }
+
+    canonico = json.dumps(
+        payload_hash,
+        ensure_ascii=False,
+        sort_keys=True,
+        separators=(",", ":")
+    ).encode("utf-8")
+
+    return sha256(canonico).hexdigest()
+
+
+_VERSIONES = {
+    1: hash_registro_v1,
+    2: hash_registro_v2,
+}
+
+
+def hash_registro(version: int = HASH_VERSION_ACTUAL, **campos) -> str:
+    funcion = _VERSIONES.get(version)
+    if funcion is None:
+        raise ValueError(f"Versión de hash Veri*Factu desconocida: {version}")
+    return funcion(**campos)
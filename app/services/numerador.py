@@ -0,0 +1,145 @@
+# app/services/numerador.py
+from __future__ import annotations
+
+from datetime import datetime
+
+from sqlalchemy import update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import Session, select
+
+from app.models.emisor import Emisor
+from app.models.numeracion import ContadorNumeracion
+
+
+# ============================================================
+# CONTADOR (creación idempotente)
+# ============================================================
+
+def _valor_inicial(emisor: Emisor, anio: int) -> int:
+    """
+    Compatibilidad: si el emisor ya venía numerando este año con
+    siguiente_numero, el contador arranca donde lo dejó.
+    """
+    if emisor.ultimo_anio_numerado == anio and emisor.siguiente_numero:
+        return max(emisor.siguiente_numero - 1, 0)
+    return 0
+
+
+def _asegurar_contador(session: Session, emisor: Emisor, serie: str, anio: int):
+    existe = session.exec(
+        select(ContadorNumeracion.id)
+        .where(ContadorNumeracion.empresa_id == emisor.empresa_id)
+        .where(ContadorNumeracion.serie == serie)
+        .where(ContadorNumeracion.anio == anio)
+    ).first()
+
+    if existe:
+        return
+
+    valores = {
+        "empresa_id": emisor.empresa_id,
+        "serie": serie,
+        "anio": anio,
+        "ultimo_numero": _valor_inicial(emisor, anio),
+        "actualizado_en": datetime.utcnow(),
+    }
+
+    # INSERT ... ON CONFLICT DO NOTHING → si otro worker lo crea a la vez,
+    # no hay error y ambos incrementan la misma fila después.
+    dialecto = session.get_bind().dialect.name
+
+    if dialecto == "postgresql":
+        stmt = postgresql.insert(ContadorNumeracion).values(**valores)
+    else:
+        stmt = sqlite.insert(ContadorNumeracion).values(**valores)
+
+    session.exec(stmt.on_conflict_do_nothing())
+
+
+# ============================================================
+# RESERVA ATÓMICA
+# ============================================================
+
+def reservar_numeros(
+    session: Session,
+    emisor: Emisor,
+    anio: int,
+    cantidad: int = 1,
+) -> range:
+    """
+    Reserva `cantidad` correlativos consecutivos para (empresa, serie, año)
+    con un único UPDATE ... RETURNING.
+
+    - El UPDATE toma el bloqueo de escritura de la fila (PostgreSQL) o de la
+      BD (SQLite), así que dos validaciones concurrentes se serializan aquí.
+    - NO hace commit: el número queda confirmado junto con la factura.
+      Si la transacción se deshace, el número vuelve al contador (sin huecos).
+
+    Devuelve el rango de correlativos reservados.
+    """
+    if cantidad < 1:
+        raise ValueError("La cantidad a reservar debe ser >= 1")
+
+    serie = (emisor.serie_facturacion or "").strip()
+
+    _asegurar_contador(session, emisor, serie, anio)
+
+    ultimo = session.exec(
+        update(ContadorNumeracion)
+        .where(ContadorNumeracion.empresa_id == emisor.empresa_id)
+        .where(ContadorNumeracion.serie == serie)
+        .where(ContadorNumeracion.anio == anio)
+        .values(
+            ultimo_numero=ContadorNumeracion.ultimo_numero + cantidad,
+            actualizado_en=datetime.utcnow(),
+        )
+        .returning(ContadorNumeracion.ultimo_numero)
+    ).scalar_one()
+
+    # Espejo en Emisor para pantallas que aún leen siguiente_numero
+    session.exec(
+        update(Emisor)
+        .where(Emisor.id == emisor.id)
+        .values(siguiente_numero=ultimo + 1, ultimo_anio_numerado=anio)
+    )
+
+    return range(ultimo - cantidad + 1, ultimo + 1)
+
+
+def reservar_numero(session: Session, emisor: Emisor, anio: int) -> int:
+    return reservar_numeros(session, emisor, anio, 1).start
+
+
+def siguiente_numero_previsto(session: Session, emisor: Emisor, anio: int) -> int:
+    """
+    Próximo correlativo SIN reservarlo (una única lectura del contador).
+    Solo para previsualizar: el número real lo da reservar_numeros().
+    """
+    serie = (emisor.serie_facturacion or "").strip()
+
+    ultimo = session.exec(
+        select(ContadorNumeracion.ultimo_numero)
+        .where(ContadorNumeracion.empresa_id == emisor.empresa_id)
+        .where(ContadorNumeracion.serie == serie)
+        .where(ContadorNumeracion.anio == anio)
+    ).first()
+
+    if ultimo is None:
+        ultimo = _valor_inicial(emisor, anio)
+
+    return ultimo + 1
+
+
+def reiniciar_contadores(session: Session, empresa_id: int, desde_anio: int):
+    """
+    Se usa al cambiar la plantilla/serie (solo permitido sin facturas
+    validadas en el año). No hace commit.
+    """
+    contadores = session.exec(
+        select(ContadorNumeracion)
+        .where(ContadorNumeracion.empresa_id == empresa_id)
+        .where(ContadorNumeracion.anio >= desde_anio)
+    ).all()
+
+    for c in contadores:
+        session.delete(c)
@@ -0,0 +1,78 @@
+# app/services/plantilla_numeracion.py
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from datetime import date
+from functools import lru_cache
+
+
+PLANTILLA_DEFECTO = "{YEAR}-{NUM:04d}"
+
+# {NUM:04d} | {NUM} | {SERIE} | {YEAR} | {MONTH} | {cualquier otra cosa}
+_TOKEN = re.compile(r"\{NUM:(0\d+)d\}|\{(NUM|SERIE|YEAR|MONTH)\}|\{.*?\}")
+
+
+# ============================================================
+# PLANTILLA COMPILADA
+# ============================================================
+
+@dataclass(frozen=True)
+class PlantillaNumeracion:
+    """
+    Plantilla de numeración ya traducida a un format-string de Python.
+    Se compila una vez por texto de plantilla y se reutiliza en
+    previsualización, validación y numeración por lotes.
+    """
+    plantilla: str
+    formato: str
+
+    def formatear(self, correlativo: int, fecha: date, serie: str | None) -> str:
+        return self.formato.format(
+            num=correlativo,
+            serie=(serie or "").strip(),
+            year=fecha.year,
+            month=fecha.month,
+        ).strip()
+
+    def formatear_lote(self, correlativos, fecha: date, serie: str | None) -> list[str]:
+        return [self.formatear(n, fecha, serie) for n in correlativos]
+
+
+def _escapar(literal: str) -> str:
+    return literal.replace("{", "{{").replace("}", "}}")
+
+
+@lru_cache(maxsize=256)
+def compilar_plantilla(plantilla: str | None) -> PlantillaNumeracion:
+    texto = (plantilla or PLANTILLA_DEFECTO).strip()
+
+    partes = []
+    pos = 0
+
+    for m in _TOKEN.finditer(texto):
+        partes.append(_escapar(texto[pos:m.start()]))
+
+        ancho, nombre = m.group(1), m.group(2)
+
+        if ancho:
+            partes.append(f"{{num:0{int(ancho)}d}}")
+        elif nombre == "NUM":
+            partes.append("{num}")
+        elif nombre == "SERIE":
+            partes.append("{serie}")
+        elif nombre == "YEAR":
+            partes.append("{year}")
+        elif nombre == "MONTH":
+            partes.append("{month:02d}")
+        # Placeholder desconocido → se elimina (igual que la limpieza antigua)
+
+        pos = m.end()
+
+    partes.append(_escapar(texto[pos:]))
+
+    return PlantillaNumeracion(plantilla=texto, formato="".join(partes))
+
+
+def plantilla_emisor(emisor) -> PlantillaNumeracion:
+    return compilar_plantilla(emisor.numeracion_plantilla)
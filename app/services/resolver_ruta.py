@@ -1,7 +1,11 @@
 from pathlib import Path
 from fastapi import HTTPException
+from sqlmodel import Session, select
 import os
 
+from app.models.factura import Factura
+from app.services.blobs import RAIZ
+
 
 def resolver_ruta_pdf_factura(factura, emisor):
     """
@@ -10,7 +14,8 @@ def resolver_ruta_pdf_factura(factura, emisor):
       pdf_path → ruta final del archivo
 
     Reglas:
-      ✔ Siempre guarda en /data cuando está en servidor
+      ✔ Siempre guarda en /data cuando está en servidor (ruta lógica del
+        almacén de blobs: el PDF se escribe con blobs.guardar)
       ✔ Usa solo nombre lógico (ruta_facturas)
       ✔ Compatible con instalaciones antiguas (ruta_pdf local)
     """
@@ -18,9 +23,6 @@ def resolver_ruta_pdf_factura(factura, emisor):
     if not factura or not factura.fecha:
         raise HTTPException(400, "Factura sin fecha válida")
 
-    year = factura.fecha.year
-    quarter = (factura.fecha.month - 1) // 3 + 1
-
     # =====================================================
     # 1️⃣ NUEVO SISTEMA → NOMBRE LÓGICO
     # =====================================================
@@ -31,7 +33,7 @@ def resolver_ruta_pdf_factura(factura, emisor):
         nombre_carpeta = nombre_carpeta.replace("\\", "/")
         nombre_carpeta = nombre_carpeta.split("/")[-1]   # solo nombre puro
 
-        base_root = Path("/data") / nombre_carpeta
+        base_root = RAIZ / nombre_carpeta
 
     else:
         # =====================================================
@@ -43,20 +45,33 @@ def resolver_ruta_pdf_factura(factura, emisor):
         if legacy and not os.getenv("RENDER"):
             base_root = Path(legacy)
         else:
-            base_root = Path("/data/facturas")
+            base_root = RAIZ / "facturas"
 
     # =====================================================
-    # 3️⃣ ESTRUCTURA /AÑO/T#
+    # 3️⃣ ESTRUCTURA /AÑO/T# + NOMBRE ARCHIVO
     # =====================================================
-    destino = base_root / str(year) / f"T{quarter}"
+    pdf_path = base_root / subruta_pdf_factura(factura.numero, factura.fecha)
+    destino = pdf_path.parent
     destino.mkdir(parents=True, exist_ok=True)
 
-    # =====================================================
-    # 4️⃣ NOMBRE ARCHIVO
-    # =====================================================
-    numero = str(factura.numero or "SIN_NUMERO").replace("/", "-")
-    filename = f"Factura_{numero}.pdf"
+    return destino, pdf_path
 
-    pdf_path = destino / filename
 
-    return destino, pdf_path
+def subruta_pdf_factura(numero, fecha) -> str:
+    """<año>/T<n>/Factura_<numero>.pdf, relativa a la carpeta de facturas."""
+    quarter = (fecha.month - 1) // 3 + 1
+    numero = str(numero or "SIN_NUMERO").replace("/", "-")
+    return f"{fecha.year}/T{quarter}/Factura_{numero}.pdf"
+
+
+def pdfs_de_empresa(session: Session, empresa_id: int) -> set[str]:
+    """
+    Subrutas (subruta_pdf_factura) de los PDF de las facturas numeradas de
+    la empresa: identifican sus archivos en una carpeta compartida.
+    """
+    filas = session.exec(
+        select(Factura.numero, Factura.fecha)
+        .where(Factura.empresa_id == empresa_id)
+        .where(Factura.numero.is_not(None))
+    ).all()
+    return {subruta_pdf_factura(numero, fecha) for numero, fecha in filas if fecha}
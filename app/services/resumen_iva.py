@@ -0,0 +1,72 @@
+# app/services/resumen_iva.py
+from __future__ import annotations
+
+from datetime import date
+
+from sqlalchemy import case, func
+from sqlmodel import Session, select
+
+from app.models.factura import Factura, FacturaIvaDesglose
+
+
+TRIMESTRES = {
+    1: (1, 3),
+    2: (4, 6),
+    3: (7, 9),
+    4: (10, 12),
+}
+
+
+def periodo_trimestre(year: int, trimestre: int) -> tuple[date, date]:
+    mes_ini, mes_fin = TRIMESTRES[trimestre]
+    fin = date(year + 1, 1, 1) if mes_fin == 12 else date(year, mes_fin + 1, 1)
+    return date(year, mes_ini, 1), fin
+
+
+def resumen_iva(
+    session: Session,
+    *,
+    empresa_id: int,
+    desde: date | None = None,
+    hasta: date | None = None,
+) -> list[dict]:
+    """
+    Resumen por tipo de IVA (estilo modelo 303) desde factura_iva_desglose.
+    Periodo [desde, hasta). Usa el índice (empresa_id, fecha, tipo).
+    Una factura con varios tipos cuenta en cada uno de ellos.
+    """
+    D = FacturaIvaDesglose
+
+    query = (
+        select(
+            D.tipo,
+            func.count(func.distinct(D.factura_id)),
+            func.count(func.distinct(
+                case((Factura.estado == "ANULADA", D.factura_id))
+            )),
+            func.sum(D.base),
+            func.sum(D.cuota),
+        )
+        .join(Factura, Factura.id == D.factura_id)
+        .where(D.empresa_id == empresa_id)
+        .where(Factura.estado.in_(("VALIDADA", "ANULADA")))
+    )
+
+    if desde:
+        query = query.where(D.fecha >= desde)
+    if hasta:
+        query = query.where(D.fecha < hasta)
+
+    filas = session.exec(query.group_by(D.tipo).order_by(D.tipo)).all()
+
+    return [
+        {
+            "iva": tipo,
+            "facturas": int(n or 0),
+            "anuladas": int(anuladas or 0),
+            "base": round(float(base or 0), 2),
+            "cuota": round(float(cuota or 0), 2),
+            "total": round(float(base or 0) + float(cuota or 0), 2),
+        }
+        for tipo, n, anuladas, base, cuota in filas
+    ]
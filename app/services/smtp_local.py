@@ -0,0 +1,171 @@
+# app/services/smtp_local.py
+from __future__ import annotations
+
+import socketserver
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+
+
+# ============================================================
+# SERVIDOR SMTP LOCAL (desarrollo y pruebas)
+# ============================================================
+# Sustituto del servidor real: acepta cualquier remitente/destinatario y
+# AUTH PLAIN, sin TLS. Guarda los mensajes en memoria y, si se indica, como
+# .eml en una carpeta. Con `rechazar` se simulan rechazos 5xx por
+# destinatario.
+#
+#   with ServidorSMTPLocal() as smtp:
+#       config.smtp_host, config.smtp_port = smtp.host, smtp.port
+#       config.smtp_tls = config.smtp_ssl = False
+#       ...
+#       smtp.mensajes / smtp.conexiones
+#
+#   python -m app.services.smtp_local --port 1025 --carpeta /tmp/correo
+
+
+@dataclass
+class MensajeRecibido:
+    remitente: str
+    destinatarios: list[str]
+    datos: bytes
+    recibido_en: datetime = field(default_factory=datetime.utcnow)
+
+
+class _Sesion(socketserver.StreamRequestHandler):
+    def _responder(self, linea: str):
+        self.wfile.write(linea.encode() + b"\r\n")
+
+    def _leer_datos(self) -> bytes:
+        partes = []
+        for linea in self.rfile:
+            if linea in (b".\r\n", b".\n"):
+                break
+            if linea.startswith(b".."):
+                linea = linea[1:]
+            partes.append(linea)
+        return b"".join(partes)
+
+    def handle(self):
+        servidor: ServidorSMTPLocal = self.server.local
+        servidor._nueva_conexion()
+
+        remitente, destinatarios = None, []
+        self._responder("220 smtp-local listo")
+
+        for linea in self.rfile:
+            orden = linea.decode("utf-8", "replace").strip()
+            verbo = orden.split(" ", 1)[0].upper()
+            servidor.ordenes.append(verbo)
+
+            if verbo == "EHLO":
+                self._responder("250-smtp-local")
+                self._responder("250-8BITMIME")
+                self._responder("250 AUTH PLAIN")
+            elif verbo == "HELO":
+                self._responder("250 smtp-local")
+            elif verbo == "AUTH":
+                self._responder("235 autenticado")
+            elif verbo == "MAIL":
+                remitente, destinatarios = orden.split(":", 1)[1].strip(" <>"), []
+                self._responder("250 OK")
+            elif verbo == "RCPT":
+                destino = orden.split(":", 1)[1].strip(" <>")
+                if destino in servidor.rechazar:
+                    self._responder("550 buzón inexistente")
+                else:
+                    destinatarios.append(destino)
+                    self._responder("250 OK")
+            elif verbo == "DATA":
+                self._responder("354 fin con <CRLF>.<CRLF>")
+                servidor._guardar(MensajeRecibido(remitente, destinatarios, self._leer_datos()))
+                remitente, destinatarios = None, []
+                self._responder("250 OK en cola")
+            elif verbo in ("RSET", "NOOP"):
+                self._responder("250 OK")
+            elif verbo == "QUIT":
+                self._responder("221 adiós")
+                return
+            else:
+                self._responder("502 orden no implementada")
+
+
+class _Servidor(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class ServidorSMTPLocal:
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        carpeta: str | Path | None = None,
+        rechazar: set[str] | None = None,
+    ):
+        self.carpeta = Path(carpeta) if carpeta else None
+        self.rechazar = set(rechazar or ())
+        self.mensajes: list[MensajeRecibido] = []
+        self.ordenes: list[str] = []
+        self.conexiones = 0
+
+        self._lock = threading.Lock()
+        self._servidor = _Servidor((host, port), _Sesion)
+        self._servidor.local = self
+        self._hilo: threading.Thread | None = None
+
+    @property
+    def host(self) -> str:
+        return self._servidor.server_address[0]
+
+    @property
+    def port(self) -> int:
+        return self._servidor.server_address[1]
+
+    def _nueva_conexion(self):
+        with self._lock:
+            self.conexiones += 1
+
+    def _guardar(self, mensaje: MensajeRecibido):
+        with self._lock:
+            self.mensajes.append(mensaje)
+            numero = len(self.mensajes)
+
+        if self.carpeta:
+            self.carpeta.mkdir(parents=True, exist_ok=True)
+            (self.carpeta / f"{numero:06d}.eml").write_bytes(mensaje.datos)
+
+    def iniciar(self) -> "ServidorSMTPLocal":
+        self._hilo = threading.Thread(
+            target=self._servidor.serve_forever, name="smtp-local", daemon=True
+        )
+        self._hilo.start()
+        return self
+
+    def detener(self):
+        self._servidor.shutdown()
+        self._servidor.server_close()
+
+    def __enter__(self):
+        return self.iniciar()
+
+    def __exit__(self, *exc):
+        self.detener()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Servidor SMTP local de pruebas")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1025)
+    parser.add_argument("--carpeta", help="Guardar cada mensaje como .eml aquí")
+    args = parser.parse_args()
+
+    smtp = ServidorSMTPLocal(args.host, args.port, args.carpeta)
+    print(f">>> SMTP local en {smtp.host}:{smtp.port}")
+    try:
+        smtp._servidor.serve_forever()
+    except KeyboardInterrupt:
+        smtp.detener()
@@ -1,6 +1,18 @@
 import smtplib
+import socket
 import ssl
+import threading
+import time
+from contextlib import contextmanager
+from types import SimpleNamespace
 
+from app.core.config import settings
+from app.core.logger import logger
+from app.services.email_stream import MensajeStream, enviar_stream
+
+
+class ErrorConexionSMTP(RuntimeError):
+    """No se pudo conectar / autenticar con el servidor SMTP."""
 
 
 def smtp_connect(config):
@@ -61,4 +73,209 @@ def smtp_connect(config):
         return server
 
     except Exception as e:
-        raise RuntimeError(f"Error configurando conexión SMTP: {e}")
\ No newline at end of file
+        raise ErrorConexionSMTP(f"Error configurando conexión SMTP: {e}")
+
+
+# ============================================================
+# POOL DE CONEXIONES SMTP
+# ============================================================
+# Una conexión (connect + EHLO + TLS + LOGIN) sirve para muchos mensajes.
+# Las conexiones libres se guardan por servidor/usuario:
+#   - libre más de SMTP_NOOP_TRAS segundos → NOOP antes de reutilizarla
+#   - libre más de SMTP_INACTIVIDAD_MAX → se cierra (el servidor ya la
+#     habrá cortado)
+#   - tras SMTP_MENSAJES_POR_CONEXION mensajes se rehace
+#   - un fallo de conexión la descarta; el siguiente envío abre otra
+#
+#   with conexion_smtp(config) as smtp:
+#       for ...:
+#           smtp.sendmail(remitente, destinatarios, mensaje)
+
+# Solo errores de la sesión/socket. No vale OSError a secas: las
+# SMTPException heredan de él y un 5xx no estropea la conexión.
+_ERRORES_CONEXION = (
+    smtplib.SMTPServerDisconnected,
+    ConnectionError,
+    socket.timeout,
+    ssl.SSLError,
+    FileNotFoundError,  # adjunto borrado a mitad del DATA
+)
+
+
+# ------------------------------------------------------------
+# Ritmo por servidor: SMTP_MAX_POR_MINUTO > 0 reparte los envíos a un
+# mismo (host, puerto) a intervalos regulares, sumando todas las
+# empresas y conexiones del proceso (límites del proveedor).
+# ------------------------------------------------------------
+
+_turnos: dict[tuple, float] = {}
+_turnos_lock = threading.Lock()
+
+
+def esperar_turno(host: str, port: int):
+    por_minuto = settings.SMTP_MAX_POR_MINUTO
+    if por_minuto <= 0:
+        return
+
+    intervalo = 60.0 / por_minuto
+
+    with _turnos_lock:
+        ahora = time.monotonic()
+        turno = max(ahora, _turnos.get((host, port), 0.0))
+        _turnos[(host, port)] = turno + intervalo
+
+    if turno > ahora:
+        time.sleep(turno - ahora)
+
+
+def _datos_smtp(config) -> SimpleNamespace:
+    # Copia: el objeto de BD puede estar expirado cuando se reconecte
+    return SimpleNamespace(
+        smtp_host=config.smtp_host,
+        smtp_port=config.smtp_port,
+        smtp_user=config.smtp_user,
+        smtp_password=config.smtp_password,
+        smtp_ssl=config.smtp_ssl,
+        smtp_tls=config.smtp_tls,
+    )
+
+
+def _clave(datos: SimpleNamespace) -> tuple:
+    return (
+        datos.smtp_host,
+        datos.smtp_port,
+        datos.smtp_user,
+        datos.smtp_password,
+        bool(datos.smtp_ssl),
+        bool(datos.smtp_tls),
+    )
+
+
+class ConexionSMTP:
+    def __init__(self, datos: SimpleNamespace):
+        self._datos = datos
+        self.server: smtplib.SMTP | None = None
+        self.mensajes = 0
+        self.liberada = time.monotonic()
+
+    def _abrir(self):
+        self.cerrar()
+        self.server = smtp_connect(self._datos)
+        self.mensajes = 0
+
+    def viva(self) -> bool:
+        if self.server is None:
+            return False
+        try:
+            return self.server.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def sendmail(self, remitente: str, destinatarios: list[str], mensaje):
+        if self.server is None or self.mensajes >= settings.SMTP_MENSAJES_POR_CONEXION:
+            self._abrir()
+
+        esperar_turno(self._datos.smtp_host, self._datos.smtp_port)
+
+        try:
+            if isinstance(mensaje, MensajeStream):
+                respuesta = enviar_stream(self.server, remitente, destinatarios, mensaje)
+            else:
+                respuesta = self.server.sendmail(remitente, destinatarios, mensaje)
+        except (smtplib.SMTPRecipientsRefused, smtplib.SMTPResponseException):
+            # Rechazo del servidor: la transacción se procesó (y se hizo
+            # RSET), la conexión sigue sirviendo y el mensaje cuenta
+            self.mensajes += 1
+            if self.server.sock is None:
+                # smtplib cierra el socket ante un 421
+                self.server = None
+            raise
+        except _ERRORES_CONEXION:
+            # Incluye un adjunto ilegible a mitad del DATA: la sesión queda
+            # inservible y se cierra
+            self.cerrar()
+            raise
+
+        self.mensajes += 1
+        return respuesta
+
+    def cerrar(self):
+        if self.server is None:
+            return
+        try:
+            self.server.quit()
+        except Exception:
+            pass
+        self.server = None
+
+
+_libres: dict[tuple, list[ConexionSMTP]] = {}
+_lock = threading.Lock()
+
+
+def _tomar(datos: SimpleNamespace) -> ConexionSMTP:
+    clave = _clave(datos)
+
+    while True:
+        with _lock:
+            pila = _libres.get(clave) or []
+            conexion = pila.pop() if pila else None
+
+        if conexion is None:
+            return ConexionSMTP(datos)
+
+        libre = time.monotonic() - conexion.liberada
+
+        if libre > settings.SMTP_INACTIVIDAD_MAX:
+            conexion.cerrar()
+            continue
+        if libre > settings.SMTP_NOOP_TRAS and not conexion.viva():
+            conexion.cerrar()
+            continue
+
+        conexion._datos = datos
+        return conexion
+
+
+def _devolver(conexion: ConexionSMTP):
+    if conexion.server is None:
+        return
+    if conexion.mensajes >= settings.SMTP_MENSAJES_POR_CONEXION:
+        conexion.cerrar()
+        return
+
+    conexion.liberada = time.monotonic()
+    clave = _clave(conexion._datos)
+
+    with _lock:
+        pila = _libres.setdefault(clave, [])
+        if len(pila) < settings.SMTP_POOL_MAX:
+            pila.append(conexion)
+            return
+
+    conexion.cerrar()
+
+
+@contextmanager
+def conexion_smtp(config):
+    """Conexión del pool (se abre en el primer sendmail)."""
+    conexion = _tomar(_datos_smtp(config))
+    try:
+        yield conexion
+    except BaseException:
+        conexion.cerrar()
+        raise
+    else:
+        _devolver(conexion)
+
+
+def cerrar_conexiones_smtp():
+    with _lock:
+        conexiones = [c for pila in _libres.values() for c in pila]
+        _libres.clear()
+
+    for conexion in conexiones:
+        conexion.cerrar()
+
+    if conexiones:
+        logger.info(f"[SMTP] Cerradas {len(conexiones)} conexiones del pool")
@@ -0,0 +1,110 @@
+# app/services/totales.py
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Hashable, Sequence
+
+
+# ============================================================
+# MOTOR DE TOTALES (decimal exacto, muchas facturas a la vez)
+# ============================================================
+# Entrada columnar: una posición por línea, de cualquier nº de facturas.
+#
+#   calcular_totales(
+#       facturas=[7, 7, 8],
+#       cantidades=[2, 1, 3],
+#       precios=[10.05, 3.2, 1.333],
+#       tipos_iva=[21, 21, 10],
+#   )
+#
+# Reglas (las de la factura impresa):
+#   - importe de línea = cantidad × precio, redondeado a céntimos
+#   - base por tipo    = suma de importes de línea de ese tipo
+#   - cuota por tipo   = base × tipo / 100, redondeada a céntimos
+#   - subtotal = Σ bases; iva_total = Σ cuotas; total = subtotal + iva_total
+#
+# Todo en Decimal: los float de entrada se convierten por su repr corto
+# (Decimal(str(x))), así 10.05 es 10.05 y no 10.0499999...
+
+CENTIMOS = Decimal("0.01")
+_CIEN = Decimal(100)
+_CERO = Decimal(0)
+
+
+def a_decimal(valor) -> Decimal:
+    if valor is None:
+        return _CERO
+    if isinstance(valor, Decimal):
+        return valor
+    return Decimal(str(valor))
+
+
+def redondear(valor: Decimal) -> Decimal:
+    return valor.quantize(CENTIMOS, rounding=ROUND_HALF_UP)
+
+
+@dataclass
+class TotalesFactura:
+    subtotal: Decimal = _CERO
+    iva_total: Decimal = _CERO
+    total: Decimal = _CERO
+
+    # tipo IVA (%) → (base, cuota)
+    desglose: dict[Decimal, tuple[Decimal, Decimal]] = field(default_factory=dict)
+
+    # importe de cada línea sin IVA / con su cuota (mismo orden de entrada)
+    lineas: list[Decimal] = field(default_factory=list)
+    lineas_con_iva: list[Decimal] = field(default_factory=list)
+
+
+def calcular_totales(
+    *,
+    facturas: Sequence[Hashable],
+    cantidades: Sequence,
+    precios: Sequence,
+    tipos_iva: Sequence,
+) -> dict[Hashable, TotalesFactura]:
+    """
+    Una pasada sobre las columnas: importes de línea y bases por
+    (factura, tipo); después cuotas y totales por factura.
+    """
+    n = len(facturas)
+    if not (len(cantidades) == len(precios) == len(tipos_iva) == n):
+        raise ValueError("Las columnas de líneas deben tener la misma longitud")
+
+    resultado: dict[Hashable, TotalesFactura] = {}
+    bases: dict[Hashable, dict[Decimal, Decimal]] = {}
+
+    for fid, cantidad, precio, tipo in zip(facturas, cantidades, precios, tipos_iva):
+        importe = redondear(a_decimal(cantidad) * a_decimal(precio))
+        tipo = redondear(a_decimal(tipo))
+
+        totales = resultado.get(fid)
+        if totales is None:
+            totales = resultado[fid] = TotalesFactura()
+            bases[fid] = {}
+
+        totales.lineas.append(importe)
+        totales.lineas_con_iva.append(importe + redondear(importe * tipo / _CIEN))
+        por_tipo = bases[fid]
+        por_tipo[tipo] = por_tipo.get(tipo, _CERO) + importe
+
+    for fid, por_tipo in bases.items():
+        totales = resultado[fid]
+
+        for tipo in sorted(por_tipo):
+            base = por_tipo[tipo]
+            cuota = redondear(base * tipo / _CIEN)
+            totales.desglose[tipo] = (base, cuota)
+            totales.subtotal += base
+            totales.iva_total += cuota
+
+        totales.total = totales.subtotal + totales.iva_total
+
+    return resultado
+
+
+def totales_vacios() -> TotalesFactura:
+    """Factura sin líneas."""
+    return TotalesFactura()
@@ -0,0 +1,337 @@
+# app/services/validacion_lote.py
+from __future__ import annotations
+
+from dataclasses import dataclass, asdict
+from datetime import date, datetime, timedelta
+
+from fastapi import HTTPException, Request
+from sqlmodel import Session, select
+
+from app.db.shards import sesion_empresa
+from app.models.configuracion_sistema import ConfiguracionSistema
+from app.models.emisor import Emisor
+from app.models.factura import Factura, RegistroVerifactu
+from app.models.linea_factura import LineaFactura
+from app.services.auditoria_service import auditar
+from app.services.cadena_verifactu import avanzar_cadena, bloquear_cadena
+from app.services.control_sistema import validar_fecha_factura
+from app.services.control_verifactu import (
+    construir_registro_verifactu,
+    verifactu_habilitado,
+)
+from app.services.facturas_pdf import generar_factura_pdf
+from app.services.facturas_service import (
+    bloquear_numeracion,
+    guardar_desglose_iva,
+    numerar_facturas_lote,
+    recalcular_totales_lote,
+)
+from app.services.resolver_ruta import resolver_ruta_pdf_factura
+from app.services.verifactu_outbox import despertar_outbox
+from app.utils.request_context import get_ip, get_user_agent
+
+
+# ============================================================
+# RESULTADO POR FACTURA
+# ============================================================
+
+@dataclass
+class ResultadoValidacion:
+    id: int
+    ok: bool
+    numero: str | None = None
+    error: str | None = None
+
+    def dict(self):
+        return asdict(self)
+
+
+# ============================================================
+# VALIDACIÓN POR LOTES (UNA TRANSACCIÓN)
+# ============================================================
+
+def validar_facturas_lote(
+    session: Session,
+    *,
+    empresa_id: int,
+    factura_ids: list[int],
+    fecha: date | None = None,
+    mensaje_iva: str | None = None,
+    request: Request | None = None,
+) -> tuple[list[ResultadoValidacion], list[int], list[int]]:
+    """
+    Valida varios borradores de una vez:
+      1. Descarta los que no se pueden validar (resultado por factura).
+      2. Ordena cronológicamente y numera con un bloque contiguo por año.
+      3. Recalcula totales y encadena los hashes Veri*Factu en memoria.
+      4. Un único commit (facturas + registros + auditoría).
+
+    Devuelve (resultados, ids validadas, ids de RegistroVerifactu creados).
+    El PDF y el envío AEAT se hacen después, fuera de la transacción.
+    """
+    ctx = {
+        "ip": get_ip(request) if request else None,
+        "user_agent": get_user_agent(request) if request else None,
+        "empresa_id": empresa_id,
+        "commit": False,
+    }
+
+    resultados: dict[int, ResultadoValidacion] = {}
+
+    def rechazar(factura_id: int, motivo: str, resultado: str = "BLOQUEADO"):
+        resultados[factura_id] = ResultadoValidacion(id=factura_id, ok=False, error=motivo)
+        auditar(
+            session,
+            entidad="FACTURA",
+            entidad_id=factura_id,
+            accion="VALIDAR",
+            resultado=resultado,
+            nivel_evento="FISCAL" if resultado == "BLOQUEADO" else "ERROR",
+            motivo=motivo,
+            **ctx,
+        )
+
+    # ============================
+    # 1) Cargar y filtrar
+    # ============================
+    emisor = session.exec(
+        select(Emisor).where(Emisor.empresa_id == empresa_id)
+    ).first()
+
+    if not emisor:
+        raise HTTPException(400, "No hay configuración del emisor para esta empresa")
+
+    config = session.exec(
+        select(ConfiguracionSistema).where(
+            ConfiguracionSistema.empresa_id == empresa_id
+        )
+    ).first()
+
+    con_verifactu = verifactu_habilitado(config)
+    if con_verifactu and not emisor.nif:
+        raise HTTPException(500, "No hay NIF de emisor configurado.")
+
+    facturas = session.exec(
+        select(Factura)
+        .where(Factura.empresa_id == empresa_id)
+        .where(Factura.id.in_(factura_ids))
+    ).all()
+
+    encontradas = {f.id: f for f in facturas}
+
+    for factura_id in factura_ids:
+        if factura_id not in encontradas:
+            rechazar(factura_id, "Factura no encontrada", resultado="ERROR")
+
+    candidatas = []
+    for f in facturas:
+        if f.estado != "BORRADOR":
+            rechazar(f.id, "Solo se pueden validar facturas en BORRADOR")
+            continue
+
+        # La fecha del lote solo se aplica si la factura acaba validada:
+        # una rechazada se queda como estaba
+        fecha_f = fecha or f.fecha
+        if not fecha_f:
+            rechazar(f.id, "La factura debe tener fecha")
+            continue
+
+        candidatas.append((f, fecha_f))
+
+    # ============================
+    # 2) Fechas + orden cronológico
+    # ============================
+    ultima = session.exec(
+        select(Factura)
+        .where(Factura.estado == "VALIDADA")
+        .where(Factura.empresa_id == empresa_id)
+        .order_by(Factura.fecha.desc())
+        .limit(1)
+    ).first()
+
+    fecha_minima = ultima.fecha if ultima else None
+    fechas_rechazadas: dict[date, str] = {}
+    fechas_ok: set[date] = set()
+
+    validables = []
+    for f, fecha_f in sorted(candidatas, key=lambda x: (x[1], x[0].id)):
+        if fecha_minima and fecha_f < fecha_minima:
+            rechazar(f.id, "Fecha anterior a la última factura validada", resultado="ERROR")
+            continue
+
+        if fecha_f not in fechas_ok and fecha_f not in fechas_rechazadas:
+            try:
+                validar_fecha_factura(fecha_f, session, empresa_id=empresa_id)
+                fechas_ok.add(fecha_f)
+            except HTTPException as e:
+                fechas_rechazadas[fecha_f] = e.detail
+
+        if fecha_f in fechas_rechazadas:
+            rechazar(f.id, fechas_rechazadas[fecha_f])
+            continue
+
+        f.fecha = fecha_f
+        validables.append(f)
+
+    if not validables:
+        session.commit()
+        return [resultados[i] for i in factura_ids if i in resultados], [], []
+
+    # ============================
+    # 3) Numeración (bloque contiguo)
+    # ============================
+    numerar_facturas_lote(session, emisor, validables)
+
+    # ============================
+    # 4) Totales desde líneas (una consulta)
+    # ============================
+    lineas_por_factura: dict[int, list[LineaFactura]] = {f.id: [] for f in validables}
+    for l in session.exec(
+        select(LineaFactura).where(LineaFactura.factura_id.in_(list(lineas_por_factura)))
+    ).all():
+        lineas_por_factura[l.factura_id].append(l)
+
+    mensaje_iva = (mensaje_iva or "").strip()
+
+    totales = recalcular_totales_lote([(f, lineas_por_factura[f.id]) for f in validables])
+
+    for f, t in zip(validables, totales):
+        guardar_desglose_iva(session, f, t)
+
+    if mensaje_iva:
+        for f in validables:
+            f.mensaje_iva = mensaje_iva
+
+    # ============================
+    # 5) Veri*Factu encadenado en memoria
+    # ============================
+    registros: list[RegistroVerifactu] = []
+
+    if con_verifactu:
+        # Cabeza bloqueada hasta el commit del lote
+        cabeza = bloquear_cadena(session, empresa_id)
+        hash_anterior = cabeza.hash
+        secuencia = cabeza.secuencia
+        fecha_generacion = datetime.utcnow()
+
+        for f in validables:
+            secuencia += 1
+            registro = construir_registro_verifactu(
+                factura=f,
+                nif_emisor=emisor.nif,
+                hash_anterior=hash_anterior,
+                fecha_generacion=fecha_generacion,
+                secuencia=secuencia,
+            )
+            session.add(registro)
+            registros.append(registro)
+
+            hash_anterior = registro.hash_actual
+            # fecha_registro estrictamente creciente dentro del lote
+            fecha_generacion += timedelta(microseconds=1)
+
+        if registros:
+            avanzar_cadena(session, empresa_id, registros[-1])
+
+        config.verifactu_ultimo_hash = hash_anterior
+        session.add(config)
+
+    # ============================
+    # 6) Estado definitivo + bloqueo numeración
+    # ============================
+    # Mismo valor que validar_factura (fecha local del día)
+    hoy = date.today()
+
+    for f in validables:
+        f.estado = "VALIDADA"
+        f.fecha_validacion = hoy
+        session.add(f)
+
+    for anio in sorted({f.fecha.year for f in validables}):
+        bloquear_numeracion(session, date(anio, 1, 1), empresa_id, commit=False)
+
+    for f in validables:
+        resultados[f.id] = ResultadoValidacion(id=f.id, ok=True, numero=f.numero)
+        auditar(
+            session,
+            entidad="FACTURA",
+            entidad_id=f.id,
+            accion="VALIDAR",
+            resultado="OK",
+            nivel_evento="FISCAL",
+            payload={"lote": True},
+            **ctx,
+        )
+
+    # ============================
+    # 7) UN SOLO COMMIT
+    # ============================
+    session.commit()
+
+    return (
+        [resultados[i] for i in factura_ids if i in resultados],
+        [f.id for f in validables],
+        [r.id for r in registros],
+    )
+
+
+# ============================================================
+# POST-VALIDACIÓN EN SEGUNDO PLANO (AEAT + PDF)
+# ============================================================
+
+def procesar_post_validacion_lote(
+    empresa_id: int,
+    factura_ids: list[int],
+    registro_ids: list[int],
+):
+    """
+    Se ejecuta como BackgroundTask tras el commit del lote.
+    Ni el envío ni el PDF bloquean la validación fiscal.
+    Los registros ya están PENDIENTE: el outbox los envía en orden.
+    """
+    if registro_ids:
+        despertar_outbox()
+
+    with sesion_empresa(empresa_id) as session:
+        emisor = session.exec(
+            select(Emisor).where(Emisor.empresa_id == empresa_id)
+        ).first()
+
+        config = session.exec(
+            select(ConfiguracionSistema).where(
+                ConfiguracionSistema.empresa_id == empresa_id
+            )
+        ).first()
+
+        # ---------- PDFs ----------
+        for factura_id in factura_ids:
+            factura = session.get(Factura, factura_id)
+            if not factura:
+                continue
+
+            try:
+                _, ruta_pdf = resolver_ruta_pdf_factura(factura, emisor)
+
+                generar_factura_pdf(
+                    factura=factura,
+                    lineas=factura.lineas,
+                    emisor=emisor,
+                    config=config,
+                    incluir_mensaje_iva=True,
+                )
+
+                factura.ruta_pdf = f"/storage/view?path={ruta_pdf}"
+                session.add(factura)
+                session.commit()
+
+            except Exception as e:
+                auditar(
+                    session,
+                    entidad="FACTURA",
+                    entidad_id=factura_id,
+                    accion="PDF",
+                    resultado="ERROR",
+                    nivel_evento="WARN",
+                    motivo=f"PDF no generado: {e}",
+                    empresa_id=empresa_id,
+                )
@@ -1,6 +1,6 @@
-import httpx
 from fastapi import HTTPException
 from app.models.configuracion_sistema import ConfiguracionSistema
+from app.services.verifactu_http import obtener_cliente_async
 
 
 async def enviar_factura_a_verifactu(factura_data: dict, config: ConfiguracionSistema):
@@ -20,8 +20,8 @@ async def enviar_factura_a_verifactu(factura_data: dict, config: ConfiguracionSi
     url = f"{config.verifactu_url}/verifactu/enviar"
 
     try:
-        async with httpx.AsyncClient(timeout=10) as client:
-            resp = await client.post(url, json=factura_data)
+        client = obtener_cliente_async(config)
+        resp = await client.post(url, json=factura_data)
 
         if resp.status_code != 200:
             return {
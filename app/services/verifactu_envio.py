@@ -6,13 +6,13 @@ from dataclasses import dataclass
 from datetime import datetime
 from typing import Any, Dict, Optional
 
-import httpx
 from fastapi import HTTPException
 from sqlmodel import Session
 
 from app.models.factura import Factura, RegistroVerifactu
 from app.models.emisor import Emisor
 from app.models.configuracion_sistema import ConfiguracionSistema
+from app.services.verifactu_http import usar_cliente
 
 
 # ============================================================
@@ -59,8 +59,17 @@ def construir_payload_verifactu(
 
     iva_items = []
 
+    # Desglose por tipo guardado al validar
+    if factura.desglose_iva:
+        for d in sorted(factura.desglose_iva, key=lambda d: d.tipo):
+            iva_items.append({
+                "tipo": float(d.tipo),
+                "base": round(d.base, 2),
+                "cuota": round(d.cuota, 2),
+            })
+
     # Si el sistema actualmente usa IVA global
-    if factura.iva_global and factura.iva_global > 0:
+    elif factura.iva_global and factura.iva_global > 0:
         iva_items.append({
             "tipo": float(factura.iva_global),
             "base": round(base_imponible, 2),
@@ -113,82 +122,220 @@ def construir_payload_verifactu(
 
 
 # ============================================================
-# ENVÍO (TEST simulado / PROD HTTP)
+# ENVÍO HTTP (sin BD)
 # ============================================================
 
-def enviar_a_aeat(
+def enviar_registro(
     *,
     factura: Factura,
     emisor: Emisor,
     registro: RegistroVerifactu,
     config: ConfiguracionSistema,
-    session: Session,
 ) -> ResultadoEnvio:
-
-    # --- Validaciones mínimas ---
-    if not emisor or not emisor.nif:
-        raise HTTPException(500, "No hay NIF de emisor para envío Veri*Factu.")
-
-    if not factura.numero or not factura.fecha:
-        raise HTTPException(500, "Factura sin número/fecha definitiva para envío Veri*Factu.")
-
-    if registro is None or not registro.hash_actual:
-        raise HTTPException(500, "Registro Veri*Factu inválido (sin hash).")
-
-    # asegurar fecha de registro
-    if not getattr(registro, "fecha_registro", None):
-        registro.fecha_registro = datetime.utcnow()
-        session.add(registro)
-        session.commit()
-
+    """
+    Envía UN registro y devuelve el resultado. No toca la BD:
+    el estado lo actualiza quien llama (outbox o enviar_a_aeat).
+    """
     endpoint = _get_endpoint(config)
     payload = construir_payload_verifactu(factura, emisor, registro, config)
 
     try:
-        timeout = httpx.Timeout(20.0, connect=10.0)
+        with usar_cliente(config) as client:
+            resp = client.post(endpoint, json=payload)
 
-        with httpx.Client(timeout=timeout) as client:
-            resp = client.post(
-                endpoint,
-                json=payload,
-                headers={"Content-Type": "application/json"},
-            )
-
-        # ------------- RESPUESTA CORRECTA -----------------
         if 200 <= resp.status_code < 300:
-            registro.estado_envio = "ENVIADO"
-            registro.error_envio = None
-            session.add(registro)
-            session.commit()
-
             return ResultadoEnvio(
                 ok=True,
                 http_status=resp.status_code,
                 respuesta_texto=resp.text[:2000],
             )
 
-        # ------------- ERROR HTTP -----------------
-        registro.estado_envio = "ERROR"
-        registro.error_envio = f"HTTP {resp.status_code}: {resp.text[:500]}"
-        session.add(registro)
-        session.commit()
-
         return ResultadoEnvio(
             ok=False,
             http_status=resp.status_code,
             respuesta_texto=resp.text[:2000],
-            error=registro.error_envio,
+            error=f"HTTP {resp.status_code}: {resp.text[:500]}",
         )
 
     except Exception as e:
-        registro.estado_envio = "ERROR"
-        registro.error_envio = str(e)[:500]
-        session.add(registro)
-        session.commit()
-
         return ResultadoEnvio(
             ok=False,
             http_status=None,
             respuesta_texto=None,
             error=str(e),
         )
+
+
+# ============================================================
+# ENVÍO POR LOTES (varios registros en una sola petición)
+# ============================================================
+
+def construir_payload_lote(
+    emisor: Emisor,
+    registros: list[RegistroVerifactu],
+    config: ConfiguracionSistema,
+) -> Dict[str, Any]:
+    """
+    Un único payload con N registros, en orden de la cadena.
+    Reutiliza construir_payload_verifactu: modo/emisor van una sola vez
+    y cada registro aporta su bloque factura + encadenado.
+    """
+    piezas = [
+        construir_payload_verifactu(r.factura, emisor, r, config)
+        for r in registros
+    ]
+
+    return {
+        "modo": config.verifactu_modo,
+        "emisor": piezas[0]["emisor"],
+        "registros": [
+            {"factura": p["factura"], "encadenado": p["encadenado"]}
+            for p in piezas
+        ],
+    }
+
+
+def _resultados_por_registro(
+    registros: list[RegistroVerifactu],
+    resp,
+) -> list[ResultadoEnvio]:
+    """
+    Mapea la respuesta del lote a cada registro.
+    Se espera {"resultados": [{"hash_actual"?, "ok", "error"?}, ...]};
+    si la respuesta no trae detalle, el 2xx vale para todos. Una entrada
+    sin "ok": true cuenta como rechazada.
+    """
+    texto = resp.text[:2000]
+
+    try:
+        detalle = resp.json().get("resultados")
+    except Exception:
+        detalle = None
+
+    if not isinstance(detalle, list):
+        return [
+            ResultadoEnvio(ok=True, http_status=resp.status_code, respuesta_texto=texto)
+            for _ in registros
+        ]
+
+    por_hash = {
+        d.get("hash_actual"): d
+        for d in detalle
+        if isinstance(d, dict) and d.get("hash_actual")
+    }
+
+    resultados = []
+    for i, r in enumerate(registros):
+        d = por_hash.get(r.hash_actual)
+        if d is None and not por_hash and i < len(detalle):
+            d = detalle[i]
+
+        if not isinstance(d, dict):
+            resultados.append(ResultadoEnvio(
+                ok=False,
+                http_status=resp.status_code,
+                respuesta_texto=texto,
+                error="Registro sin resultado en la respuesta del lote",
+            ))
+            continue
+
+        # Sin "ok" explícito no se da por aceptado
+        ok = d.get("ok") is True
+        resultados.append(ResultadoEnvio(
+            ok=ok,
+            http_status=resp.status_code,
+            respuesta_texto=texto,
+            error=None if ok else str(d.get("error") or "Rechazado")[:500],
+        ))
+
+    return resultados
+
+
+def enviar_registros_lote(
+    *,
+    emisor: Emisor,
+    registros: list[RegistroVerifactu],
+    config: ConfiguracionSistema,
+) -> list[ResultadoEnvio]:
+    """
+    Envía varios registros de la MISMA empresa en una sola petición.
+    Devuelve un ResultadoEnvio por registro (mismo orden). No toca la BD.
+    """
+    if len(registros) == 1:
+        r = registros[0]
+        return [enviar_registro(factura=r.factura, emisor=emisor, registro=r, config=config)]
+
+    endpoint = _get_endpoint(config)
+    payload = construir_payload_lote(emisor, registros, config)
+
+    try:
+        with usar_cliente(config) as client:
+            resp = client.post(endpoint, json=payload)
+
+        if 200 <= resp.status_code < 300:
+            return _resultados_por_registro(registros, resp)
+
+        error = f"HTTP {resp.status_code}: {resp.text[:500]}"
+        return [
+            ResultadoEnvio(
+                ok=False,
+                http_status=resp.status_code,
+                respuesta_texto=resp.text[:2000],
+                error=error,
+            )
+            for _ in registros
+        ]
+
+    except Exception as e:
+        return [ResultadoEnvio(ok=False, error=str(e)) for _ in registros]
+
+
+# ============================================================
+# ENVÍO (TEST simulado / PROD HTTP)
+# ============================================================
+
+def enviar_a_aeat(
+    *,
+    factura: Factura,
+    emisor: Emisor,
+    registro: RegistroVerifactu,
+    config: ConfiguracionSistema,
+    session: Session,
+) -> ResultadoEnvio:
+
+    # --- Validaciones mínimas ---
+    if not emisor or not emisor.nif:
+        raise HTTPException(500, "No hay NIF de emisor para envío Veri*Factu.")
+
+    if not factura.numero or not factura.fecha:
+        raise HTTPException(500, "Factura sin número/fecha definitiva para envío Veri*Factu.")
+
+    if registro is None or not registro.hash_actual:
+        raise HTTPException(500, "Registro Veri*Factu inválido (sin hash).")
+
+    # asegurar fecha de registro
+    if not getattr(registro, "fecha_registro", None):
+        registro.fecha_registro = datetime.utcnow()
+        session.add(registro)
+        session.commit()
+
+    resultado = enviar_registro(
+        factura=factura,
+        emisor=emisor,
+        registro=registro,
+        config=config,
+    )
+
+    if resultado.ok:
+        registro.estado_envio = "ENVIADO"
+        registro.error_envio = None
+        registro.proximo_intento = None
+        registro.enviado_en = datetime.utcnow()
+    else:
+        registro.estado_envio = "ERROR"
+        registro.error_envio = (resultado.error or "")[:500]
+
+    session.add(registro)
+    session.commit()
+
+    return resultado
@@ -0,0 +1,218 @@
+# app/services/verifactu_http.py
+from __future__ import annotations
+
+import asyncio
+import os
+import secrets
+import ssl
+import tempfile
+import threading
+from contextlib import contextmanager
+
+import httpx
+from cryptography.hazmat.primitives.serialization import (
+    BestAvailableEncryption,
+    Encoding,
+    PrivateFormat,
+    pkcs12,
+)
+
+from app.core.config import settings
+from app.core.logger import logger
+from app.models.configuracion_sistema import ConfiguracionSistema
+
+
+# ============================================================
+# CLIENTES HTTP VERI*FACTU (pool por empresa)
+# ============================================================
+# Un httpx.Client de larga duración por empresa:
+#   - keep-alive: las conexiones TCP/TLS se reutilizan entre envíos
+#   - certificado AEAT (PKCS#12) cargado UNA vez en el SSLContext
+#   - HTTP/2 opcional (requiere el paquete "h2")
+# Si cambia el certificado (ruta, contraseña o fichero) se recrea el cliente.
+# El sustituido se retira, y solo se cierra cuando ningún hilo lo está usando
+# (contador _en_uso): cerrarlo a mitad de un post() cortaría ese envío.
+
+_lock = threading.Lock()
+_clientes: dict[int, tuple[tuple, httpx.Client]] = {}
+_en_uso: dict[httpx.Client, int] = {}
+_retirados: set[httpx.Client] = set()
+_clientes_async: dict[int, tuple[tuple, httpx.AsyncClient]] = {}
+
+
+def _http2_disponible() -> bool:
+    if not settings.VERIFACTU_HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        logger.warning("[VERIFACTU] HTTP/2 solicitado pero 'h2' no está instalado")
+        return False
+
+
+def _clave_cliente(config: ConfiguracionSistema) -> tuple:
+    ruta = config.cert_aeat_path or None
+    mtime = None
+    if ruta and os.path.exists(ruta):
+        mtime = os.path.getmtime(ruta)
+    return (ruta, config.cert_aeat_password or None, mtime)
+
+
+def _contexto_ssl(config: ConfiguracionSistema) -> ssl.SSLContext:
+    """
+    SSLContext compartido por todas las conexiones del pool.
+    El .pfx/.p12 se descifra aquí una sola vez; ssl solo acepta PEM en
+    fichero, así que se vuelca a un temporal que se borra al terminar.
+    La clave va cifrada en el temporal con una contraseña aleatoria que
+    solo vive en memoria.
+    """
+    ctx = ssl.create_default_context()
+
+    ruta = config.cert_aeat_path
+    if not ruta or not os.path.exists(ruta):
+        return ctx
+
+    with open(ruta, "rb") as f:
+        clave, cert, cadena = pkcs12.load_key_and_certificates(
+            f.read(),
+            config.cert_aeat_password.encode() if config.cert_aeat_password else None,
+        )
+
+    if not clave or not cert:
+        raise ValueError("Certificado AEAT sin clave privada o sin certificado")
+
+    password = secrets.token_bytes(32)
+    pem = clave.private_bytes(
+        Encoding.PEM, PrivateFormat.PKCS8, BestAvailableEncryption(password)
+    )
+    pem += cert.public_bytes(Encoding.PEM)
+    for extra in cadena or []:
+        pem += extra.public_bytes(Encoding.PEM)
+
+    fd, tmp = tempfile.mkstemp(suffix=".pem")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(pem)
+        ctx.load_cert_chain(tmp, password=password)
+    finally:
+        os.remove(tmp)
+
+    return ctx
+
+
+def _opciones_cliente(config: ConfiguracionSistema) -> dict:
+    return {
+        "verify": _contexto_ssl(config),
+        "http2": _http2_disponible(),
+        "timeout": httpx.Timeout(settings.VERIFACTU_HTTP_TIMEOUT, connect=10.0),
+        "limits": httpx.Limits(
+            max_connections=settings.VERIFACTU_HTTP_MAX_CONEXIONES,
+            max_keepalive_connections=settings.VERIFACTU_HTTP_KEEPALIVE,
+            keepalive_expiry=settings.VERIFACTU_HTTP_KEEPALIVE_EXPIRY,
+        ),
+        "headers": {"Content-Type": "application/json"},
+    }
+
+
+@contextmanager
+def usar_cliente(config: ConfiguracionSistema):
+    """
+    Cliente síncrono (outbox / enviar_a_aeat). Seguro entre hilos:
+
+        with usar_cliente(config) as client:
+            client.post(...)
+    """
+    clave = _clave_cliente(config)
+    retirado = None
+
+    with _lock:
+        actual = _clientes.get(config.empresa_id)
+        if actual and actual[0] == clave:
+            cliente = actual[1]
+        else:
+            cliente = httpx.Client(**_opciones_cliente(config))
+            _clientes[config.empresa_id] = (clave, cliente)
+            if actual:
+                if actual[1] in _en_uso:
+                    _retirados.add(actual[1])
+                else:
+                    retirado = actual[1]
+
+        _en_uso[cliente] = _en_uso.get(cliente, 0) + 1
+
+    if retirado:
+        retirado.close()
+
+    try:
+        yield cliente
+    finally:
+        with _lock:
+            _en_uso[cliente] -= 1
+            cerrar = False
+            if not _en_uso[cliente]:
+                del _en_uso[cliente]
+                cerrar = cliente in _retirados
+                _retirados.discard(cliente)
+
+        if cerrar:
+            cliente.close()
+
+
+def obtener_cliente_async(config: ConfiguracionSistema) -> httpx.AsyncClient:
+    """Cliente asíncrono (verifactu_client). Mismo pool y certificado."""
+    clave = _clave_cliente(config)
+
+    with _lock:
+        actual = _clientes_async.get(config.empresa_id)
+        if actual and actual[0] == clave:
+            return actual[1]
+
+        cliente = httpx.AsyncClient(**_opciones_cliente(config))
+        _clientes_async[config.empresa_id] = (clave, cliente)
+
+    if actual:
+        _cerrar_async(actual[1])
+
+    return cliente
+
+
+# Tareas de cierre en curso (referencia fuerte hasta que terminan)
+_cierres: set[asyncio.Task] = set()
+
+
+def _cerrar_async(cliente: httpx.AsyncClient):
+    """aclose() del cliente sustituido sin bloquear a quien pide el nuevo."""
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        # Sin bucle en marcha (llamada desde código síncrono)
+        try:
+            asyncio.run(cliente.aclose())
+        except Exception as e:
+            logger.warning(f"[VERIFACTU] No se pudo cerrar el cliente anterior: {e}")
+        return
+
+    tarea = loop.create_task(cliente.aclose())
+    _cierres.add(tarea)
+    tarea.add_done_callback(_cierres.discard)
+
+
+def cerrar_clientes():
+    """Cierra los pools síncronos (shutdown de la app)."""
+    with _lock:
+        clientes = [c for _, c in _clientes.values()] + list(_retirados)
+        _clientes.clear()
+        _retirados.clear()
+
+    for c in clientes:
+        c.close()
+
+
+async def cerrar_clientes_async():
+    with _lock:
+        clientes = [c for _, c in _clientes_async.values()]
+        _clientes_async.clear()
+
+    for c in clientes:
+        await c.aclose()
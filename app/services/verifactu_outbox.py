@@ -0,0 +1,354 @@
+# app/services/verifactu_outbox.py
+from __future__ import annotations
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, or_, update
+from sqlmodel import Session, select
+
+from app.core.config import settings
+from app.core.logger import logger
+from app.db.shards import bds_de_empresas, sesion_empresa
+from app.models.configuracion_sistema import ConfiguracionSistema
+from app.models.emisor import Emisor
+from app.models.factura import RegistroVerifactu
+from app.services.verifactu_envio import enviar_registros_lote
+
+
+# ============================================================
+# OUTBOX VERI*FACTU
+# ============================================================
+# La validación solo deja el RegistroVerifactu en PENDIENTE y hace commit.
+# Este worker los envía en segundo plano:
+#   - orden ESTRICTO de la cadena por empresa (secuencia);
+#     si un registro falla, los siguientes de esa empresa esperan
+#   - reintentos con backoff exponencial (intentos_envio / proximo_intento)
+#   - concurrencia acotada: N empresas en paralelo, una a una dentro
+#   - reserva (lease) sobre proximo_intento para que varios procesos
+#     uvicorn no envíen el mismo registro a la vez
+#   - envío por lotes: hasta VERIFACTU_LOTE_MAX registros por petición,
+#     esperando como mucho VERIFACTU_LOTE_VENTANA segundos a llenar el lote
+
+_despertar = threading.Event()
+_parar = threading.Event()
+_hilo: threading.Thread | None = None
+_avisadas_sin_endpoint: set[int] = set()
+
+
+def calcular_backoff(intentos: int) -> timedelta:
+    segundos = settings.VERIFACTU_BACKOFF_BASE * (2 ** max(intentos - 1, 0))
+    return timedelta(seconds=min(segundos, settings.VERIFACTU_BACKOFF_MAX))
+
+
+def _empresas_con_pendientes(session: Session) -> list[int]:
+    return list(
+        session.exec(
+            select(RegistroVerifactu.empresa_id)
+            .where(RegistroVerifactu.estado_envio != "ENVIADO")
+            .where(RegistroVerifactu.intentos_envio < settings.VERIFACTU_MAX_INTENTOS)
+            .distinct()
+        ).all()
+    )
+
+
+def _empresas_pendientes() -> list[int]:
+    empresas = []
+    for bd in bds_de_empresas():
+        with sesion_empresa(bd) as session:
+            empresas.extend(_empresas_con_pendientes(session))
+    return empresas
+
+
+def _siguientes_de_la_cadena(
+    session: Session,
+    empresa_id: int,
+    limite: int,
+) -> list[RegistroVerifactu]:
+    """Primeros registros NO enviados de la empresa (cabeza de la cola)."""
+    return list(
+        session.exec(
+            select(RegistroVerifactu)
+            .where(RegistroVerifactu.empresa_id == empresa_id)
+            .where(RegistroVerifactu.estado_envio != "ENVIADO")
+            .order_by(RegistroVerifactu.secuencia)
+            .limit(limite)
+        ).all()
+    )
+
+
+def _reservar(session: Session, registro_ids: list[int], ahora: datetime) -> bool:
+    """
+    Lease atómico sobre la CABEZA de la cola: solo un proceso consigue mover
+    su proximo_intento al futuro. Como todos empiezan por la cabeza, ganarla
+    equivale a bloquear la empresa; el resto del lote se marca igual.
+    """
+    lease = ahora + timedelta(seconds=settings.VERIFACTU_LEASE_SEGUNDOS)
+    cabeza, resto = registro_ids[0], registro_ids[1:]
+
+    reservado = session.exec(
+        update(RegistroVerifactu)
+        .where(RegistroVerifactu.id == cabeza)
+        .where(RegistroVerifactu.estado_envio != "ENVIADO")
+        .where(
+            or_(
+                RegistroVerifactu.proximo_intento.is_(None),
+                RegistroVerifactu.proximo_intento <= ahora,
+            )
+        )
+        .values(proximo_intento=lease)
+        .returning(RegistroVerifactu.id)
+    ).first()
+
+    if reservado is not None and resto:
+        session.exec(
+            update(RegistroVerifactu)
+            .where(RegistroVerifactu.id.in_(resto))
+            .values(proximo_intento=lease)
+        )
+
+    session.commit()
+    return reservado is not None
+
+
+def _aplicar_resultado(registro: RegistroVerifactu, resultado) -> None:
+    if resultado.ok:
+        registro.estado_envio = "ENVIADO"
+        registro.error_envio = None
+        registro.proximo_intento = None
+        registro.enviado_en = datetime.utcnow()
+        return
+
+    registro.estado_envio = "ERROR"
+    registro.error_envio = (resultado.error or "")[:500]
+    registro.intentos_envio += 1
+    registro.proximo_intento = (
+        datetime.utcnow() + calcular_backoff(registro.intentos_envio)
+        if registro.intentos_envio < settings.VERIFACTU_MAX_INTENTOS
+        else None
+    )
+
+
+def _devolver_a_la_cola(registro: RegistroVerifactu) -> None:
+    """Detrás de un fallo: vuelve a PENDIENTE sin gastar intento."""
+    registro.estado_envio = "PENDIENTE"
+    registro.error_envio = None
+    registro.proximo_intento = None
+
+
+def procesar_empresa(empresa_id: int, limite: int = 500) -> int:
+    """
+    Envía en orden los registros pendientes de una empresa, en lotes de
+    hasta VERIFACTU_LOTE_MAX registros por petición.
+    Se detiene en el primer fallo (la cadena no se puede saltar).
+    Devuelve cuántos se enviaron.
+    """
+    enviados = 0
+    lote_max = max(1, settings.VERIFACTU_LOTE_MAX)
+    ventana = timedelta(seconds=settings.VERIFACTU_LOTE_VENTANA)
+
+    with sesion_empresa(empresa_id) as session:
+        config = session.exec(
+            select(ConfiguracionSistema).where(
+                ConfiguracionSistema.empresa_id == empresa_id
+            )
+        ).first()
+
+        emisor = session.exec(
+            select(Emisor).where(Emisor.empresa_id == empresa_id)
+        ).first()
+
+        if not config or not config.verifactu_url or not emisor:
+            # Se avisa una vez por empresa, no en cada barrido
+            if empresa_id not in _avisadas_sin_endpoint:
+                _avisadas_sin_endpoint.add(empresa_id)
+                logger.warning(
+                    f"[VERIFACTU] empresa={empresa_id} sin endpoint Veri*Factu "
+                    f"o sin emisor: los registros siguen en PENDIENTE"
+                )
+            return 0
+
+        _avisadas_sin_endpoint.discard(empresa_id)
+
+        while enviados < limite and not _parar.is_set():
+            registros = _siguientes_de_la_cadena(
+                session, empresa_id, min(lote_max, limite - enviados)
+            )
+            if not registros:
+                break
+
+            cabeza = registros[0]
+            ahora = datetime.utcnow()
+
+            # Error definitivo o en backoff → la empresa espera
+            if cabeza.intentos_envio >= settings.VERIFACTU_MAX_INTENTOS:
+                break
+            if cabeza.proximo_intento and cabeza.proximo_intento > ahora:
+                break
+
+            # Lote incompleto y reciente → esperar a que se llene (ventana)
+            if (
+                lote_max > 1
+                and len(registros) < lote_max
+                and cabeza.intentos_envio == 0
+                and cabeza.fecha_registro > ahora - ventana
+            ):
+                break
+
+            if not _reservar(session, [r.id for r in registros], ahora):
+                break  # otro proceso lo está enviando
+
+            for r in registros:
+                session.refresh(r)
+
+            resultados = enviar_registros_lote(
+                emisor=emisor,
+                registros=registros,
+                config=config,
+            )
+
+            fallidos = []
+            for r, resultado in zip(registros, resultados):
+                session.add(r)
+
+                # La cadena se corta en el primer fallo: los siguientes se
+                # reenvían detrás de él aunque la respuesta los dé por buenos
+                if fallidos:
+                    _devolver_a_la_cola(r)
+                    continue
+
+                _aplicar_resultado(r, resultado)
+                if resultado.ok:
+                    enviados += 1
+                    config.verifactu_ultimo_envio = r.enviado_en
+                else:
+                    fallidos.append(r)
+
+            session.add(config)
+            session.commit()
+
+            if fallidos:
+                for r in fallidos:
+                    logger.warning(
+                        f"[VERIFACTU] Envío fallido registro={r.id} "
+                        f"intento={r.intentos_envio}: {r.error_envio}"
+                    )
+                break
+
+    return enviados
+
+
+def procesar_outbox() -> int:
+    """Un barrido completo: todas las empresas con pendientes."""
+    empresas = _empresas_pendientes()
+
+    if not empresas:
+        return 0
+
+    workers = max(1, min(settings.VERIFACTU_OUTBOX_WORKERS, len(empresas)))
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="verifactu") as pool:
+        return sum(pool.map(procesar_empresa, empresas))
+
+
+# ============================================================
+# CICLO DE VIDA DEL WORKER
+# ============================================================
+
+def _bucle():
+    while not _parar.is_set():
+        try:
+            procesar_outbox()
+        except Exception as e:
+            logger.error(f"[VERIFACTU] Error en outbox: {e}")
+
+        _despertar.wait(settings.VERIFACTU_OUTBOX_INTERVALO)
+        _despertar.clear()
+
+
+def despertar_outbox():
+    """Llamar tras commitear registros nuevos: envío inmediato."""
+    _despertar.set()
+
+
+def iniciar_outbox_verifactu():
+    global _hilo
+
+    if not settings.VERIFACTU_OUTBOX_ACTIVO:
+        return
+    if _hilo and _hilo.is_alive():
+        return
+
+    _parar.clear()
+    _hilo = threading.Thread(target=_bucle, name="verifactu-outbox", daemon=True)
+    _hilo.start()
+
+
+def detener_outbox_verifactu(timeout: float = 10.0):
+    _parar.set()
+    _despertar.set()
+    if _hilo:
+        _hilo.join(timeout)
+
+
+# ============================================================
+# ADMINISTRACIÓN
+# ============================================================
+# Cuando la cabeza de la cadena agota VERIFACTU_MAX_INTENTOS el worker deja
+# de enviar esa empresa. Recuperación manual (admin), una vez corregida la
+# causa: GET /auditoria/verifactu/outbox para ver el estado y
+# POST /auditoria/verifactu/reencolar para reintentar.
+
+def reencolar_errores(session: Session, empresa_id: int) -> int:
+    """Reinicia los registros en ERROR para reintentarlos ya."""
+    registros = session.exec(
+        select(RegistroVerifactu)
+        .where(RegistroVerifactu.empresa_id == empresa_id)
+        .where(RegistroVerifactu.estado_envio == "ERROR")
+    ).all()
+
+    for r in registros:
+        r.intentos_envio = 0
+        r.proximo_intento = None
+        session.add(r)
+
+    session.commit()
+    despertar_outbox()
+    return len(registros)
+
+
+def resumen_outbox(session: Session, empresa_id: int) -> dict:
+    """
+    Conteo por estado, más lo que impide avanzar a la cadena:
+    falta de endpoint/emisor o cabeza en error definitivo.
+    """
+    filas = session.exec(
+        select(RegistroVerifactu.estado_envio, func.count())
+        .where(RegistroVerifactu.empresa_id == empresa_id)
+        .group_by(RegistroVerifactu.estado_envio)
+    ).all()
+
+    config = session.exec(
+        select(ConfiguracionSistema).where(
+            ConfiguracionSistema.empresa_id == empresa_id
+        )
+    ).first()
+
+    emisor = session.exec(
+        select(Emisor).where(Emisor.empresa_id == empresa_id)
+    ).first()
+
+    cabeza = next(iter(_siguientes_de_la_cadena(session, empresa_id, 1)), None)
+    bloqueada = (
+        cabeza is not None
+        and cabeza.intentos_envio >= settings.VERIFACTU_MAX_INTENTOS
+    )
+
+    return {
+        "estados": {estado: total for estado, total in filas},
+        "sin_endpoint": not (config and config.verifactu_url and emisor),
+        "bloqueada": bloqueada,
+        "registro_bloqueante": cabeza.id if bloqueada else None,
+        "error": cabeza.error_envio if bloqueada else None,
+    }
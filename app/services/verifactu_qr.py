@@ -1,10 +1,17 @@
 # app/services/verifactu_qr.py
 from __future__ import annotations
 
+import threading
+from collections import OrderedDict
 from urllib.parse import quote
 from datetime import date
 from decimal import Decimal, ROUND_HALF_UP
 
+from reportlab.graphics import renderSVG
+from reportlab.graphics.barcode.qr import QrCodeWidget
+from reportlab.graphics.shapes import Drawing
+from reportlab.lib.units import mm
+
 from app.models.factura import Factura
 from app.models.emisor import Emisor
 from app.models.configuracion_sistema import ConfiguracionSistema
@@ -63,3 +70,86 @@ def construir_url_qr(
     base = base_veri if es_verifactu else base_noveri
 
     return f"{base}?nif={nif}&numserie={numserie}&fecha={fecha}&importe={importe}"
+
+
+# ============================================================
+# CACHÉ DE DIBUJOS QR
+# ============================================================
+# El QR depende solo de la URL: codificar la matriz es lo caro, así que
+# guardamos el Drawing ya construido (rectángulos estáticos) y lo reutilizamos
+# en re-generaciones de PDF, envíos por email y trabajos por lotes.
+
+QR_CACHE_MAX = 2048
+
+# Tamaño del QR impreso que admite la AEAT (de 30x30 a 40x40 mm)
+QR_MM_MIN = 30
+QR_MM_MAX = 40
+
+_qr_cache: "OrderedDict[tuple[str, float], Drawing]" = OrderedDict()
+_qr_lock = threading.Lock()
+
+
+def _construir_drawing_qr(url: str, size_mm: float) -> Drawing:
+    size = size_mm * mm
+    widget = QrCodeWidget(url, barWidth=size, barHeight=size)
+
+    # draw() codifica la matriz UNA vez y devuelve un Group de rectángulos
+    d = Drawing(size, size)
+    d.add(widget.draw())
+    return d
+
+
+def obtener_drawing_qr(url: str, size_mm: float = 35) -> Drawing:
+    """
+    Devuelve el Drawing del QR para la URL (ISO/IEC 18004).
+    Cacheado por (url, tamaño) con política LRU.
+    """
+    clave = (url, float(size_mm))
+
+    with _qr_lock:
+        d = _qr_cache.get(clave)
+        if d is not None:
+            _qr_cache.move_to_end(clave)
+            return d
+
+    d = _construir_drawing_qr(url, size_mm)
+
+    with _qr_lock:
+        _qr_cache[clave] = d
+        _qr_cache.move_to_end(clave)
+        while len(_qr_cache) > QR_CACHE_MAX:
+            _qr_cache.popitem(last=False)
+
+    return d
+
+
+# ============================================================
+# QR POR LOTES (tickets / recibos)
+# ============================================================
+
+def generar_qr_lote(
+    urls: list[str],
+    *,
+    size_mm: float = 35,
+    formato: str = "svg",
+) -> dict[str, str | Drawing]:
+    """
+    Genera los QR de varias URLs de una vez.
+    formato:
+      "svg"     → texto SVG listo para impresoras de tickets / HTML
+      "drawing" → Drawing de ReportLab para componer PDFs propios
+    URLs repetidas se codifican una sola vez.
+    """
+    if formato not in ("svg", "drawing"):
+        raise ValueError(f"Formato QR no soportado: {formato}")
+
+    resultado: dict[str, str | Drawing] = {}
+
+    for url in urls:
+        if url in resultado:
+            continue
+
+        d = obtener_drawing_qr(url, size_mm)
+        resultado[url] = renderSVG.drawToString(d) if formato == "svg" else d
+
+    return resultado
@@ -0,0 +1,329 @@
+# app/services/verificador_cadena.py
+from __future__ import annotations
+
+import hashlib
+import hmac
+import threading
+from dataclasses import asdict, dataclass
+
+from sqlmodel import Session, select
+
+from app.core.config import settings
+from app.core.logger import logger
+from app.db.shards import bds_de_empresas, sesion_empresa
+from app.models.checkpoint_verifactu import CheckpointVerifactu
+from app.models.emisor import Emisor
+from app.models.factura import Factura, RegistroVerifactu
+from app.services.auditoria_service import auditar
+from app.services.control_verifactu import generar_hash_verifactu
+
+
+# ============================================================
+# VERIFICACIÓN INCREMENTAL DE LA CADENA VERI*FACTU
+# ============================================================
+# Recorre los RegistroVerifactu de una empresa por secuencia con un cursor
+# (yield_per, sin cargar la historia en memoria) y para cada eslabón:
+#   - secuencia consecutiva
+#   - hash_anterior == hash_actual del eslabón previo
+#   - hash_actual == hash recalculado desde la Factura
+# Cada VERIFACTU_CHECKPOINT_CADA registros guarda un checkpoint firmado;
+# la siguiente ejecución empieza desde el último checkpoint válido.
+#
+# Nota: el hash se recalcula con el NIF ACTUAL del emisor; si el NIF
+# cambió, los registros anteriores aparecerán como rotos.
+
+_LOTE_CURSOR = 500
+
+
+@dataclass
+class EslabonRoto:
+    registro_id: int
+    secuencia: int | None
+    factura_id: int | None
+    motivo: str
+
+
+@dataclass
+class ResultadoVerificacion:
+    empresa_id: int
+    ok: bool
+    desde_secuencia: int
+    hasta_secuencia: int
+    verificados: int
+    roto: EslabonRoto | None = None
+
+    def dict(self) -> dict:
+        return asdict(self)
+
+
+# ============================================================
+# CHECKPOINTS FIRMADOS
+# ============================================================
+
+def _firmar(empresa_id: int, secuencia: int, registro_id: int, hash_actual: str) -> str:
+    mensaje = f"{empresa_id}|{secuencia}|{registro_id}|{hash_actual}".encode()
+    return hmac.new(settings.SECRET_KEY.encode(), mensaje, hashlib.sha256).hexdigest()
+
+
+def _ultimo_checkpoint_valido(
+    session: Session,
+    empresa_id: int,
+) -> CheckpointVerifactu | None:
+    """
+    Último checkpoint cuya firma es correcta y cuyo registro sigue teniendo
+    la misma secuencia y hash. Si no lo hay → verificación completa.
+    """
+    checkpoints = session.exec(
+        select(CheckpointVerifactu)
+        .where(CheckpointVerifactu.empresa_id == empresa_id)
+        .order_by(CheckpointVerifactu.secuencia.desc())
+    )
+
+    for cp in checkpoints:
+        firma = _firmar(empresa_id, cp.secuencia, cp.registro_id, cp.hash_actual)
+        if not hmac.compare_digest(firma, cp.firma):
+            logger.warning(f"[VERIFACTU] Checkpoint con firma inválida id={cp.id}")
+            continue
+
+        registro = session.get(RegistroVerifactu, cp.registro_id)
+        if (
+            registro
+            and registro.secuencia == cp.secuencia
+            and registro.hash_actual == cp.hash_actual
+        ):
+            return cp
+
+    return None
+
+
+def _guardar_checkpoint(empresa_id: int, registro: RegistroVerifactu):
+    # Sesión aparte: el cursor de lectura sigue abierto
+    with sesion_empresa(empresa_id) as session:
+        session.add(CheckpointVerifactu(
+            empresa_id=empresa_id,
+            secuencia=registro.secuencia,
+            registro_id=registro.id,
+            hash_actual=registro.hash_actual,
+            firma=_firmar(empresa_id, registro.secuencia, registro.id, registro.hash_actual),
+        ))
+        session.commit()
+
+
+# ============================================================
+# VERIFICADOR
+# ============================================================
+
+def _comprobar_eslabon(
+    registro: RegistroVerifactu,
+    factura: Factura | None,
+    nif_emisor: str,
+    secuencia_esperada: int,
+    hash_previo: str | None,
+) -> str | None:
+    """Devuelve el motivo de rotura o None si el eslabón es correcto."""
+    if registro.secuencia != secuencia_esperada:
+        return f"Secuencia {registro.secuencia}, se esperaba {secuencia_esperada}"
+
+    if (registro.hash_anterior or "") != (hash_previo or ""):
+        return "hash_anterior no coincide con el eslabón previo"
+
+    if factura is None:
+        return "Factura del registro inexistente"
+
+    try:
+        recalculado = generar_hash_verifactu(
+            factura=factura,
+            nif_emisor=nif_emisor,
+            fecha_generacion=registro.fecha_registro,
+            hash_anterior=registro.hash_anterior,
+            version=registro.version_hash or 1,
+        )
+    except ValueError as e:
+        return str(e)
+
+    if recalculado != registro.hash_actual:
+        return "Hash recalculado distinto: factura o registro alterados"
+
+    return None
+
+
+def verificar_cadena(
+    empresa_id: int,
+    *,
+    desde_cero: bool = False,
+    checkpoint_cada: int | None = None,
+) -> ResultadoVerificacion:
+    """
+    Verifica la cadena de una empresa desde el último checkpoint válido
+    (o desde el principio) y se detiene en el primer eslabón roto.
+    """
+    cada = checkpoint_cada or settings.VERIFACTU_CHECKPOINT_CADA
+
+    with sesion_empresa(empresa_id) as session:
+        emisor = session.exec(
+            select(Emisor).where(Emisor.empresa_id == empresa_id)
+        ).first()
+        nif_emisor = (emisor.nif if emisor else "") or ""
+
+        cp = None if desde_cero else _ultimo_checkpoint_valido(session, empresa_id)
+        desde = cp.secuencia if cp else 0
+        hash_previo = cp.hash_actual if cp else None
+
+        filas = session.exec(
+            select(RegistroVerifactu, Factura)
+            .join(Factura, Factura.id == RegistroVerifactu.factura_id, isouter=True)
+            .where(RegistroVerifactu.empresa_id == empresa_id)
+            .where(RegistroVerifactu.secuencia > desde)
+            .order_by(RegistroVerifactu.secuencia)
+            .execution_options(yield_per=_LOTE_CURSOR)
+        )
+
+        secuencia = desde
+        verificados = 0
+
+        for registro, factura in filas:
+            motivo = _comprobar_eslabon(
+                registro, factura, nif_emisor, secuencia + 1, hash_previo
+            )
+
+            if motivo:
+                return ResultadoVerificacion(
+                    empresa_id=empresa_id,
+                    ok=False,
+                    desde_secuencia=desde,
+                    hasta_secuencia=secuencia,
+                    verificados=verificados,
+                    roto=EslabonRoto(
+                        registro_id=registro.id,
+                        secuencia=registro.secuencia,
+                        factura_id=registro.factura_id,
+                        motivo=motivo,
+                    ),
+                )
+
+            secuencia = registro.secuencia
+            hash_previo = registro.hash_actual
+            verificados += 1
+
+            if secuencia % cada == 0:
+                _guardar_checkpoint(empresa_id, registro)
+
+            # Sin acumular objetos en la identity map
+            session.expunge(registro)
+            if factura is not None:
+                session.expunge(factura)
+
+        return ResultadoVerificacion(
+            empresa_id=empresa_id,
+            ok=True,
+            desde_secuencia=desde,
+            hasta_secuencia=secuencia,
+            verificados=verificados,
+        )
+
+
+def empresas_con_registros() -> list[int]:
+    empresas = []
+    for bd in bds_de_empresas():
+        with sesion_empresa(bd) as session:
+            empresas.extend(session.exec(
+                select(RegistroVerifactu.empresa_id).distinct()
+            ).all())
+    return empresas
+
+
+def verificar_todas() -> list[ResultadoVerificacion]:
+    """Verifica todas las empresas con registros; audita las roturas."""
+    empresas = empresas_con_registros()
+    resultados = []
+
+    for empresa_id in empresas:
+        resultado = verificar_cadena(empresa_id)
+        resultados.append(resultado)
+
+        if resultado.ok:
+            continue
+
+        logger.error(
+            f"[VERIFACTU] Cadena rota empresa={empresa_id} "
+            f"registro={resultado.roto.registro_id}: {resultado.roto.motivo}"
+        )
+
+        with sesion_empresa(empresa_id) as session:
+            auditar(
+                session,
+                entidad="VERIFACTU",
+                entidad_id=resultado.roto.registro_id,
+                accion="VERIFICAR_CADENA",
+                resultado="ERROR",
+                nivel_evento="CRITICAL",
+                motivo=resultado.roto.motivo,
+                empresa_id=empresa_id,
+                payload=resultado.dict(),
+            )
+
+    return resultados
+
+
+# ============================================================
+# VERIFICACIÓN PROGRAMADA
+# ============================================================
+
+_parar = threading.Event()
+_hilo: threading.Thread | None = None
+
+
+def _bucle():
+    intervalo = settings.VERIFACTU_VERIFICACION_HORAS * 3600
+
+    while not _parar.wait(intervalo):
+        try:
+            verificar_todas()
+        except Exception as e:
+            logger.error(f"[VERIFACTU] Error verificando cadenas: {e}")
+
+
+def iniciar_verificacion_programada():
+    global _hilo
+
+    if settings.VERIFACTU_VERIFICACION_HORAS <= 0:
+        return
+    if _hilo and _hilo.is_alive():
+        return
+
+    _parar.clear()
+    _hilo = threading.Thread(target=_bucle, name="verifactu-verificacion", daemon=True)
+    _hilo.start()
+
+
+def detener_verificacion_programada():
+    _parar.set()
+
+
+# ============================================================
+# CLI
+# ============================================================
+# python -m app.services.verificador_cadena [--empresa ID] [--desde-cero]
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    import sys
+
+    import app.db.base  # noqa: F401  (registra todos los modelos)
+
+    parser = argparse.ArgumentParser(description="Verifica la cadena Veri*Factu")
+    parser.add_argument("--empresa", type=int, help="Solo esta empresa")
+    parser.add_argument("--desde-cero", action="store_true", help="Ignorar checkpoints")
+    args = parser.parse_args()
+
+    if args.empresa:
+        resultados = [verificar_cadena(args.empresa, desde_cero=args.desde_cero)]
+    else:
+        resultados = [
+            verificar_cadena(e, desde_cero=args.desde_cero)
+            for e in empresas_con_registros()
+        ]
+
+    print(json.dumps([r.dict() for r in resultados], indent=2, ensure_ascii=False))
+    sys.exit(0 if all(r.ok for r in resultados) else 1)
@@ -0,0 +1,97 @@
+# app/services/zip_stream.py
+from __future__ import annotations
+
+import io
+import zipfile
+from pathlib import Path
+from typing import Iterable, Iterator
+
+
+# ============================================================
+# ZIP EN STREAMING
+# ============================================================
+# zipfile escribe sobre una salida NO seekable (_Salida): en ese caso pone
+# CRC y tamaños en un data descriptor tras cada archivo en vez de volver
+# atrás a la cabecera local, y usa ZIP64 cuando el tamaño (del stat) o el
+# directorio central lo necesitan. Tras cada bloque leído se entrega lo
+# que haya en la salida, así que:
+#   - la descarga empieza con el primer bloque del primer archivo
+#   - la memoria está acotada a un bloque (+ el buffer del deflate)
+#
+#   StreamingResponse(zip_stream((ruta, nombre_en_zip) for ...), media_type="application/zip")
+#
+# PDF, imágenes y comprimidos van sin comprimir (ZIP_STORED): deflate
+# gasta CPU para ganar nada.
+
+BLOQUE = 64 * 1024
+
+YA_COMPRIMIDOS = {
+    ".pdf", ".zip", ".gz", ".tgz", ".bz2", ".xz", ".7z", ".rar",
+    ".png", ".jpg", ".jpeg", ".gif", ".webp", ".xlsx", ".docx", ".odt", ".ods",
+}
+
+
+class _Salida(io.RawIOBase):
+    """Acumula lo escrito hasta que el generador lo recoge."""
+
+    def __init__(self):
+        self._trozos: list[bytes] = []
+        self._posicion = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, datos) -> int:
+        self._trozos.append(bytes(datos))
+        self._posicion += len(datos)
+        return len(datos)
+
+    def tell(self) -> int:
+        return self._posicion
+
+    def vaciar(self) -> bytes:
+        datos = b"".join(self._trozos)
+        self._trozos.clear()
+        return datos
+
+
+def _tipo_compresion(nombre: str) -> int:
+    if Path(nombre).suffix.lower() in YA_COMPRIMIDOS:
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+def zip_stream(archivos: Iterable[tuple[Path, str]]) -> Iterator[bytes]:
+    """
+    ZIP de (ruta en disco, nombre dentro del ZIP), en trozos.
+    Los archivos que no se pueden abrir se omiten; nombres repetidos, también.
+    """
+    salida = _Salida()
+    nombres: set[str] = set()
+
+    with zipfile.ZipFile(salida, "w", allowZip64=True, strict_timestamps=False) as zf:
+        for ruta, nombre in archivos:
+            if nombre in nombres:
+                continue
+
+            try:
+                info = zipfile.ZipInfo.from_file(ruta, nombre, strict_timestamps=False)
+                origen = open(ruta, "rb")
+            except OSError:
+                continue
+
+            nombres.add(nombre)
+            info.compress_type = _tipo_compresion(nombre)
+
+            with origen, zf.open(info, "w") as destino:
+                while bloque := origen.read(BLOQUE):
+                    destino.write(bloque)
+                    if datos := salida.vaciar():
+                        yield datos
+
+            # Cola del deflate + data descriptor
+            if datos := salida.vaciar():
+                yield datos
+
+    # Directorio central (ZipFile.close)
+    yield salida.vaciar()
@@ -0,0 +1,92 @@
+# scripts/bench_backup.py
+"""
+Tiempos del backup incremental (app/services/backup.py).
+
+Genera en una carpeta temporal un /data con N archivos aleatorios (por
+defecto 2000 archivos, 5 GB) más la BD, y mide:
+  backup completo, backup sin cambios, backup con un % de archivos
+  cambiados, verificar --rapido, verificar completo y restauración.
+
+    python scripts/bench_backup.py [--gb 5] [--archivos 2000] [--cambiados 1]
+                                   [--carpeta /ruta/con/espacio]
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+_TROZO = 4 * 1024 * 1024
+
+
+def _escribir(ruta: Path, tamano: int):
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    with open(ruta, "wb") as f:
+        while tamano > 0:
+            n = min(tamano, _TROZO)
+            f.write(os.urandom(n))
+            tamano -= n
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--gb", type=float, default=5.0, help="Tamaño total de /data")
+    parser.add_argument("--archivos", type=int, default=2000)
+    parser.add_argument("--cambiados", type=float, default=1.0, help="%% de archivos a modificar")
+    parser.add_argument("--carpeta", help="Dónde crear los datos (por defecto /tmp)")
+    parser.add_argument("--conservar", action="store_true", help="No borrar los datos al acabar")
+    args = parser.parse_args()
+
+    base = Path(tempfile.mkdtemp(prefix="bench-backup-", dir=args.carpeta))
+    raiz = base / "data"
+    raiz.mkdir()
+    os.environ["DATABASE_URL"] = f"sqlite:///{raiz}/facturacion.db"
+    os.environ["ALMACENAMIENTO_RAIZ"] = str(raiz)
+    os.environ["BACKUP_DIR"] = str(base / "backups")
+    os.environ["DB_SHARDS_DIR"] = str(raiz / "empresas")
+
+    from app.db.base import init_db
+    from app.services.backup import crear_backup, restaurar_backup, verificar_backup
+
+    init_db()
+
+    tamano = int(args.gb * 1024 ** 3 / args.archivos)
+    rutas = [raiz / "facturas" / f"{i // 500:03d}" / f"Factura_A-{i}.pdf" for i in range(args.archivos)]
+
+    inicio = time.perf_counter()
+    for ruta in rutas:
+        _escribir(ruta, tamano)
+    print(
+        f"{args.archivos} archivos, {args.gb:g} GB en {raiz} "
+        f"(generados en {time.perf_counter() - inicio:.1f} s)"
+    )
+
+    def medir(nombre, funcion, *a, **k):
+        inicio = time.perf_counter()
+        resultado = funcion(*a, **k)
+        print(f"{nombre:<28} {time.perf_counter() - inicio:8.2f} s")
+        return resultado
+
+    try:
+        medir("backup completo", crear_backup)
+        medir("backup sin cambios", crear_backup)
+
+        for ruta in random.sample(rutas, max(1, int(len(rutas) * args.cambiados / 100))):
+            _escribir(ruta, tamano)
+        medir(f"backup con {args.cambiados:g}% cambiados", crear_backup)
+
+        medir("verificar --rapido", verificar_backup, completo=False)
+        medir("verificar completo", verificar_backup)
+        medir("restaurar", restaurar_backup, "ultimo", base / "restaurado")
+    finally:
+        if not args.conservar:
+            shutil.rmtree(base, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+# scripts/bench_email_stream.py
+"""
+Memoria pico por email con un PDF grande adjunto (app/services/email_stream.py).
+
+Envía el mismo PDF a un servidor SMTP local (app.services.smtp_local, en
+otro proceso para no contar su memoria) de dos formas y mide el pico con
+tracemalloc:
+  - antes: MIMEMultipart + MIMEApplication(f.read()) + as_string()
+  - ahora: MensajeStream + enviar_stream (adjunto leído por bloques)
+Comprueba además que el adjunto recibido es idéntico al original.
+
+    python scripts/bench_email_stream.py [--mb 20]
+"""
+import argparse
+import os
+import smtplib
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from email import message_from_bytes
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from pathlib import Path
+
+RAIZ_REPO = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(RAIZ_REPO))
+
+from app.services.email_stream import MensajeStream, enviar_stream
+
+REMITENTE = "facturas@example.com"
+DESTINO = "cliente@example.com"
+
+
+def _puerto_libre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _esperar(port: int):
+    limite = time.monotonic() + 10
+    while time.monotonic() < limite:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError("El servidor SMTP local no arrancó")
+
+
+def _antes(server: smtplib.SMTP, pdf: str):
+    msg = MIMEMultipart()
+    msg["From"], msg["To"], msg["Subject"] = REMITENTE, DESTINO, "Factura A-1"
+    msg.attach(MIMEText("<p>Adjunta</p>", "html", "utf-8"))
+    with open(pdf, "rb") as f:
+        parte = MIMEApplication(f.read(), _subtype="pdf")
+    parte.add_header("Content-Disposition", "attachment", filename=os.path.basename(pdf))
+    msg.attach(parte)
+    server.sendmail(REMITENTE, [DESTINO], msg.as_string())
+
+
+def _ahora(server: smtplib.SMTP, pdf: str):
+    msg = MensajeStream(
+        remitente=REMITENTE, para=DESTINO, asunto="Factura A-1",
+        cuerpo_html="<p>Adjunta</p>", adjuntos=[pdf],
+    )
+    enviar_stream(server, REMITENTE, [DESTINO], msg)
+
+
+def _medir(nombre: str, enviar, port: int, pdf: str, mb: int):
+    with smtplib.SMTP("127.0.0.1", port) as server:
+        server.ehlo()
+        tracemalloc.start()
+        inicio = time.perf_counter()
+        enviar(server, pdf)
+        total = time.perf_counter() - inicio
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    print(f"{nombre:<8} pico {pico / 1e6:8.1f} MB  ({pico / (mb * 1e6):5.2f}× el PDF)  {total:6.2f} s")
+
+
+def _adjunto(eml: Path) -> bytes:
+    msg = message_from_bytes(eml.read_bytes())
+    for parte in msg.walk():
+        if parte.get_content_type() == "application/pdf":
+            return parte.get_payload(decode=True)
+    raise RuntimeError(f"Sin adjunto en {eml}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--mb", type=int, default=20, help="Tamaño del PDF")
+    args = parser.parse_args()
+
+    tmp = Path(tempfile.mkdtemp(prefix="bench-email-"))
+    pdf = tmp / "Factura_A-1.pdf"
+    with open(pdf, "wb") as f:
+        f.write(b"%PDF-1.4\n")
+        for _ in range(args.mb):
+            f.write(os.urandom(1_000_000))
+
+    port = _puerto_libre()
+    buzon = tmp / "buzon"
+    servidor = subprocess.Popen(
+        [sys.executable, "-m", "app.services.smtp_local", "--port", str(port), "--carpeta", str(buzon)],
+        cwd=RAIZ_REPO,
+        stdout=subprocess.DEVNULL,
+    )
+    try:
+        _esperar(port)
+        print(f"PDF de {args.mb} MB → smtp local :{port}")
+        _medir("antes", _antes, port, str(pdf), args.mb)
+        _medir("ahora", _ahora, port, str(pdf), args.mb)
+
+        original = pdf.read_bytes()
+        recibidos = sorted(buzon.glob("*.eml"))
+        for eml, nombre in zip(recibidos, ("antes", "ahora")):
+            print(f"{nombre:<8} adjunto recibido idéntico: {_adjunto(eml) == original}")
+    finally:
+        servidor.terminate()
+        servidor.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+# scripts/bench_hash_verifactu.py
+"""
+Tiempos del hash Veri*Factu v1 (JSON) frente a v2 (campos en orden fijo).
+
+Encadena N registros sintéticos (por defecto 1.000.000) con cada versión,
+como hace la validación: el hash de uno es el hash_anterior del siguiente.
+Los campos se generan antes de medir y se recorren en ciclo, así que el
+tiempo es solo el del hash.
+
+    python scripts/bench_hash_verifactu.py [--registros 1000000] [--distintos 10000]
+"""
+import argparse
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.services.hash_verifactu import hash_registro_v1, hash_registro_v2  # noqa: E402
+
+
+def _registros(n: int) -> list[dict]:
+    rnd = random.Random(0)
+    inicio = datetime(2026, 1, 1, 8, 0, 0)
+    return [
+        {
+            "nif_emisor": f"B{rnd.randrange(10**7, 10**8)}",
+            "numero": f"A-{i + 1}",
+            "fecha": date(2026, 1, 1) + timedelta(days=i % 365),
+            "total": Decimal(rnd.randrange(1, 10**6)) / 100,
+            "fecha_registro": inicio + timedelta(seconds=i, microseconds=rnd.randrange(10**6)),
+        }
+        for i in range(n)
+    ]
+
+
+def _encadenar(funcion, registros: list[dict], total: int) -> float:
+    n = len(registros)
+    anterior = None
+    inicio = time.perf_counter()
+    for i in range(total):
+        anterior = funcion(**registros[i % n], hash_anterior=anterior)
+    return time.perf_counter() - inicio
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--registros", type=int, default=1_000_000)
+    parser.add_argument("--distintos", type=int, default=10_000, help="Registros sintéticos en ciclo")
+    args = parser.parse_args()
+
+    registros = _registros(min(args.distintos, args.registros))
+    print(f"{args.registros} registros encadenados ({len(registros)} distintos)")
+
+    tiempos = {}
+    for nombre, funcion in (("v1 (JSON)", hash_registro_v1), ("v2 (campos)", hash_registro_v2)):
+        tiempos[nombre] = segundos = _encadenar(funcion, registros, args.registros)
+        print(
+            f"{nombre:<12} {segundos:8.2f} s  "
+            f"{segundos / args.registros * 1e6:6.2f} µs/registro  "
+            f"{args.registros / segundos:10,.0f} registros/s"
+        )
+
+    v1, v2 = tiempos.values()
+    print(f"v2 / v1      {v2 / v1:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
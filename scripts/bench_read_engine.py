@@ -0,0 +1,198 @@
+# scripts/bench_read_engine.py
+"""
+Latencia de validación con informes en paralelo, con y sin el engine de
+solo lectura (app/db/session.py).
+
+Crea una BD SQLite temporal con N facturas validadas (para los informes) y
+borradores a validar. En cada ronda, durante unos segundos:
+  - un hilo valida borradores uno a uno con validar_facturas_lote
+    (numeración, totales, cadena Veri*Factu, auditoría y commit)
+  - varios lectores lanzan la consulta de facturación anual de informes
+Rondas: sin lectores (referencia), lectores con read_engine y lectores con
+el engine de escritura (como antes). Muestra p50/p99 de la validación y
+consultas/s de los lectores, y comprueba que read_engine rechaza escrituras.
+
+    python scripts/bench_read_engine.py [--facturas 50000] [--lectores 4] [--segundos 5]
+                                        [--borradores 5000]
+"""
+import argparse
+import math
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+_TMP = tempfile.mkdtemp(prefix="bench-lectura-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_TMP}/facturacion.db"
+os.environ["DB_SHARDING"] = "false"
+
+from sqlalchemy import extract, func, insert, text
+from sqlalchemy.exc import OperationalError
+from sqlmodel import Session, select
+
+from app.db.base import init_db
+from app.db.session import engine, read_engine
+from app.models.cliente import Cliente
+from app.models.configuracion_sistema import ConfiguracionSistema
+from app.models.emisor import Emisor
+from app.models.empresa import Empresa
+from app.models.factura import Factura
+from app.models.linea_factura import LineaFactura
+from app.services.validacion_lote import validar_facturas_lote
+
+
+def _poblar(n: int) -> tuple[int, int]:
+    with Session(engine) as session:
+        empresa = Empresa(nombre="Bench", cif="B00000000", activa=True)
+        session.add(empresa)
+        session.flush()
+        session.add(Emisor(empresa_id=empresa.id, nombre="Bench", nif="B00000000"))
+        session.add(ConfiguracionSistema(
+            empresa_id=empresa.id, verifactu_activo=True, verifactu_modo="TEST",
+        ))
+        cliente = Cliente(empresa_id=empresa.id, nombre="Cliente")
+        session.add(cliente)
+        session.flush()
+
+        inicio = date(2020, 1, 1)
+        filas = [
+            {
+                "empresa_id": empresa.id,
+                "cliente_id": cliente.id,
+                "numero": f"A-{i}",
+                "fecha": inicio + timedelta(days=i % 2000),
+                "subtotal": 100.0,
+                "iva_total": 21.0,
+                "total": 121.0,
+                "estado": "VALIDADA" if i % 3 else "BORRADOR",
+            }
+            for i in range(n)
+        ]
+        session.exec(insert(Factura), params=filas)
+        session.commit()
+        return empresa.id, cliente.id
+
+
+def _borradores(empresa_id: int, cliente_id: int, n: int) -> list[int]:
+    """Borradores con una línea, posteriores a todas las validadas."""
+    with Session(engine) as session:
+        ids = []
+        for _ in range(n):
+            f = Factura(
+                empresa_id=empresa_id, cliente_id=cliente_id,
+                fecha=date.today(), estado="BORRADOR",
+            )
+            session.add(f)
+            session.flush()
+            session.add(LineaFactura(
+                factura_id=f.id, descripcion="Servicio",
+                cantidad=1, precio_unitario=100.0, iva=21.0, total=100.0,
+            ))
+            ids.append(f.id)
+        session.commit()
+        return ids
+
+
+def _consulta(empresa_id: int):
+    # Misma forma que facturacion_anual_view
+    return (
+        select(
+            extract("year", Factura.fecha),
+            func.count(Factura.id),
+            func.sum(Factura.subtotal),
+            func.sum(Factura.iva_total),
+            func.sum(Factura.total),
+        )
+        .where(Factura.empresa_id == empresa_id, Factura.estado == "VALIDADA")
+        .group_by(extract("year", Factura.fecha))
+    )
+
+
+def _percentil(valores: list[float], p: float) -> float:
+    """Percentil por rango más cercano (valores ordenados)."""
+    return valores[max(0, math.ceil(len(valores) * p) - 1)]
+
+
+def _ronda(nombre, engine_lectura, empresa_id, borradores, lectores, segundos):
+    fin = time.perf_counter() + segundos
+    validaciones: list[float] = []
+    consultas = [0]
+    lock = threading.Lock()
+
+    def leer():
+        propias = 0
+        while time.perf_counter() < fin:
+            with Session(engine_lectura) as session:
+                session.exec(_consulta(empresa_id)).all()
+            propias += 1
+        with lock:
+            consultas[0] += propias
+
+    def validar():
+        for factura_id in borradores:
+            if time.perf_counter() >= fin:
+                return
+            t = time.perf_counter()
+            with Session(engine) as session:
+                resultados, _, _ = validar_facturas_lote(
+                    session, empresa_id=empresa_id, factura_ids=[factura_id],
+                )
+            validaciones.append(time.perf_counter() - t)
+            if not resultados[0].ok:
+                raise RuntimeError(f"Validación rechazada: {resultados[0].error}")
+        print(f"  (sin borradores antes de {segundos:g} s: suba --borradores)")
+
+    hilos = [threading.Thread(target=leer) for _ in range(lectores if engine_lectura else 0)]
+    hilos.append(threading.Thread(target=validar))
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+
+    validaciones.sort()
+    lectura = f"  lectores {consultas[0] / segundos:7.1f} consultas/s" if engine_lectura else ""
+    print(
+        f"{nombre:<18} {len(validaciones):6d} validaciones  "
+        f"p50 {statistics.median(validaciones) * 1000:7.1f} ms  "
+        f"p99 {_percentil(validaciones, 0.99) * 1000:7.1f} ms{lectura}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--facturas", type=int, default=50_000)
+    parser.add_argument("--lectores", type=int, default=4)
+    parser.add_argument("--segundos", type=float, default=5.0)
+    parser.add_argument("--borradores", type=int, default=5000, help="Borradores por ronda")
+    args = parser.parse_args()
+
+    init_db()
+    empresa_id, cliente_id = _poblar(args.facturas)
+    rondas = [
+        ("sin informes", None),
+        ("read_engine", read_engine),
+        ("engine (antes)", engine),
+    ]
+    borradores = [_borradores(empresa_id, cliente_id, args.borradores) for _ in rondas]
+    print(f"BD: {_TMP}/facturacion.db  ({args.facturas} facturas, {args.lectores} lectores)")
+
+    for (nombre, engine_lectura), ids in zip(rondas, borradores):
+        _ronda(nombre, engine_lectura, empresa_id, ids, args.lectores, args.segundos)
+
+    try:
+        with Session(read_engine) as session:
+            session.exec(text("DELETE FROM factura"))
+            session.commit()
+        print("read_engine: ¡la escritura NO se rechazó!")
+    except OperationalError as e:
+        print(f"read_engine rechaza escrituras: {e.orig}")
+
+
+if __name__ == "__main__":
+    main()
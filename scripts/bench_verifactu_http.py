@@ -0,0 +1,166 @@
+# scripts/bench_verifactu_http.py
+"""
+Carga del cliente HTTP Veri*Factu (app/services/verifactu_http.py).
+
+Levanta un servidor HTTPS local que exige certificado de cliente (mTLS,
+como la AEAT) y compara N envíos con:
+  - el cliente compartido de usar_cliente() (keep-alive)
+  - un httpx.Client nuevo por envío, descifrando el PKCS#12 y montando
+    el SSLContext cada vez (como antes)
+Cuenta las conexiones TLS aceptadas por el servidor.
+
+    python scripts/bench_verifactu_http.py [--envios 200]
+"""
+import argparse
+import datetime as dt
+import os
+import ssl
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import httpx
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives.serialization import pkcs12
+from cryptography.x509.oid import NameOID
+
+
+def _certificado(nombre, emisor=None, clave_emisor=None, ca=False):
+    clave = ec.generate_private_key(ec.SECP256R1())
+    sujeto = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, nombre)])
+    ahora = dt.datetime.now(dt.timezone.utc)
+    builder = (
+        x509.CertificateBuilder()
+        .subject_name(sujeto)
+        .issuer_name(emisor.subject if emisor else sujeto)
+        .public_key(clave.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(ahora - dt.timedelta(minutes=1))
+        .not_valid_after(ahora + dt.timedelta(days=1))
+        .add_extension(x509.BasicConstraints(ca=ca, path_length=None), critical=True)
+    )
+    if not ca:
+        builder = builder.add_extension(
+            x509.SubjectAlternativeName([x509.DNSName("localhost")]), critical=False
+        )
+    return clave, builder.sign(clave_emisor or clave, hashes.SHA256())
+
+
+def _pem(ruta: Path, *objetos):
+    datos = b""
+    for o in objetos:
+        if isinstance(o, x509.Certificate):
+            datos += o.public_bytes(serialization.Encoding.PEM)
+        else:
+            datos += o.private_bytes(
+                serialization.Encoding.PEM,
+                serialization.PrivateFormat.PKCS8,
+                serialization.NoEncryption(),
+            )
+    ruta.write_bytes(datos)
+    return str(ruta)
+
+
+class _Servidor(ThreadingHTTPServer):
+    daemon_threads = True
+    conexiones = 0
+
+    def get_request(self):
+        sock, addr = super().get_request()
+        type(self).conexiones += 1
+        return sock, addr
+
+
+class _Manejador(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Cabeceras y cuerpo en una sola escritura y sin Nagle: si no, Nagle +
+    # ACK retardado añaden ~40 ms por petición y eso es lo que se mediría
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("content-length", 0)))
+        cuerpo = b'{"estado":"Correcto"}'
+        self.send_response(200)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--envios", type=int, default=200)
+    args = parser.parse_args()
+
+    tmp = Path(tempfile.mkdtemp(prefix="bench-verifactu-"))
+    clave_ca, ca = _certificado("CA bench", ca=True)
+    clave_srv, srv = _certificado("localhost", ca, clave_ca)
+    clave_cli, cli = _certificado("cliente bench", ca, clave_ca)
+
+    p12 = tmp / "aeat.p12"
+    p12.write_bytes(pkcs12.serialize_key_and_certificates(
+        b"aeat", clave_cli, cli, None, serialization.BestAvailableEncryption(b"bench")
+    ))
+    ca_pem = _pem(tmp / "ca.pem", ca)
+
+    ctx_srv = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    ctx_srv.load_cert_chain(_pem(tmp / "srv.pem", clave_srv, srv))
+    ctx_srv.load_verify_locations(ca_pem)
+    ctx_srv.verify_mode = ssl.CERT_REQUIRED
+
+    servidor = _Servidor(("127.0.0.1", 0), _Manejador)
+    servidor.socket = ctx_srv.wrap_socket(servidor.socket, server_side=True)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    url = f"https://localhost:{servidor.server_address[1]}/verifactu"
+
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{tmp}/bench.db")
+    from app.services import verifactu_http
+
+    # El servidor usa nuestra CA: el SSLContext del pool tiene que fiarse de ella
+    crear = ssl.create_default_context
+    verifactu_http.ssl.create_default_context = lambda *a, **k: crear(cafile=ca_pem)
+
+    config = SimpleNamespace(empresa_id=1, cert_aeat_path=str(p12), cert_aeat_password="bench")
+    cuerpo = {"registro": "x" * 2000}
+
+    def medir(nombre, enviar):
+        _Servidor.conexiones = 0
+        inicio = time.perf_counter()
+        for _ in range(args.envios):
+            enviar().raise_for_status()
+        total = time.perf_counter() - inicio
+        print(
+            f"{nombre:<28} {args.envios / total:8.0f} envíos/s  "
+            f"{total / args.envios * 1000:6.2f} ms/envío  {_Servidor.conexiones} conexiones TLS"
+        )
+
+    def compartido():
+        with verifactu_http.usar_cliente(config) as c:
+            return c.post(url, json=cuerpo)
+
+    medir("cliente compartido", compartido)
+
+    def nuevo_por_envio():
+        with httpx.Client(**verifactu_http._opciones_cliente(config)) as c:
+            return c.post(url, json=cuerpo)
+
+    medir("cliente nuevo por envío", nuevo_por_envio)
+
+    verifactu_http.cerrar_clientes()
+    servidor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+# tests/conftest.py
+# La configuración (app/core/config.py) se lee al importar: las variables de
+# entorno van antes de cualquier import de app.
+import itertools
+import os
+import tempfile
+
+_TMP = tempfile.mkdtemp(prefix="facturacion-tests-")
+
+os.environ["DATABASE_URL"] = f"sqlite:///{_TMP}/facturacion.db"
+os.environ["ALMACENAMIENTO_RAIZ"] = f"{_TMP}/data"
+os.environ["BACKUP_DIR"] = f"{_TMP}/backups"
+os.environ["DB_SHARDS_DIR"] = f"{_TMP}/data/empresas"
+os.environ["ALMACENAMIENTO_ESCANEO_INTERVALO"] = "0"
+
+os.makedirs(os.environ["ALMACENAMIENTO_RAIZ"], exist_ok=True)
+
+import pytest
+from sqlmodel import Session
+
+from app.db.base import init_db
+from app.db.session import engine
+
+init_db()
+
+_cifs = itertools.count(1)
+
+
+@pytest.fixture
+def tmp_raiz():
+    return os.environ["ALMACENAMIENTO_RAIZ"]
+
+
+@pytest.fixture
+def empresa():
+    """Empresa + emisor nuevos en cada test (la BD se comparte en la sesión)."""
+    from app.models.emisor import Emisor
+    from app.models.empresa import Empresa
+
+    with Session(engine) as session:
+        e = Empresa(nombre="Test", cif=f"B{next(_cifs):08d}", activa=True)
+        session.add(e)
+        session.flush()
+        emisor = Emisor(empresa_id=e.id, nombre="Emisor test", serie_facturacion="A")
+        session.add(emisor)
+        session.commit()
+        session.refresh(e)
+        session.refresh(emisor)
+        return e, emisor
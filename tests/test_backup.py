@@ -0,0 +1,49 @@
+# tests/test_backup.py
+import os
+import uuid
+
+from app.services.backup import crear_backup, restaurar_backup, cargar_manifiesto
+from app.services.blobs import RAIZ, guardar_bytes, ruta_blob
+
+
+def test_backup_sin_blobs_y_restauracion_con_enlaces(tmp_path):
+    carpeta = f"facturas-{uuid.uuid4().hex[:8]}"
+    original = RAIZ / carpeta / "2026/T1/Factura_A-1.pdf"
+    copia = RAIZ / carpeta / "2026/T1/Factura_A-1-copia.pdf"
+    sha = guardar_bytes(original, b"%PDF mismo contenido")
+    guardar_bytes(copia, b"%PDF mismo contenido")
+
+    crear_backup()
+    manifiesto = cargar_manifiesto()
+
+    # Cada contenido entra una vez, por sus rutas lógicas
+    assert not [r for r in manifiesto["archivos"] if r.startswith(".blobs/")]
+    assert manifiesto["archivos"][f"{carpeta}/2026/T1/Factura_A-1.pdf"]["sha256"] == sha
+
+    destino = tmp_path / "restaurado"
+    restaurar_backup("ultimo", destino)
+
+    blob = ruta_blob(sha, destino)
+    a = destino / carpeta / "2026/T1/Factura_A-1.pdf"
+    b = destino / carpeta / "2026/T1/Factura_A-1-copia.pdf"
+
+    assert blob.read_bytes() == b"%PDF mismo contenido"
+    assert os.path.samefile(a, blob) and os.path.samefile(b, blob)
+    assert blob.stat().st_nlink == 3
+
+
+def test_restauracion_no_enlaza_archivos_fuera_del_almacen(tmp_path):
+    carpeta = RAIZ / f"sueltos-{uuid.uuid4().hex[:8]}"
+    carpeta.mkdir(parents=True)
+    (carpeta / "vacio-1.txt").write_bytes(b"")
+    (carpeta / "vacio-2.txt").write_bytes(b"")
+
+    crear_backup()
+    destino = tmp_path / "restaurado"
+    restaurar_backup("ultimo", destino)
+
+    a = destino / carpeta.relative_to(RAIZ) / "vacio-1.txt"
+    b = destino / carpeta.relative_to(RAIZ) / "vacio-2.txt"
+    assert a.read_bytes() == b.read_bytes() == b""
+    assert not os.path.samefile(a, b)
+    assert a.stat().st_nlink == 1
@@ -0,0 +1,102 @@
+# tests/test_blobs.py
+import asyncio
+import io
+import uuid
+import zipfile
+from datetime import date
+
+from sqlmodel import Session
+from starlette.requests import Request
+
+from app.db.session import engine
+from app.models.blob import RutaBlob
+from app.models.cliente import Cliente
+from app.models.factura import Factura
+from app.routers.storage import storage_batch_zip
+from app.services.blobs import RAIZ, guardar_bytes, trasladar_carpeta
+from app.services.catalogo_almacenamiento import relativa
+from app.services.resolver_ruta import pdfs_de_empresa
+
+
+def _factura(empresa_id: int, numero: str, fecha: date):
+    with Session(engine) as session:
+        cliente = Cliente(empresa_id=empresa_id, nombre="Cliente")
+        session.add(cliente)
+        session.flush()
+        session.add(Factura(
+            empresa_id=empresa_id, cliente_id=cliente.id, numero=numero,
+            fecha=fecha, estado="VALIDADA",
+        ))
+        session.commit()
+
+
+def _dueno(ruta):
+    with Session(engine) as session:
+        fila = session.get(RutaBlob, relativa(ruta))
+        return fila.empresa_id if fila else "sin registro"
+
+
+def test_trasladar_carpeta_compartida_solo_mueve_lo_de_la_empresa(empresa):
+    a, _ = empresa
+    b = a.id + 10_000      # otra empresa: solo cuenta su empresa_id
+
+    origen = RAIZ / f"facturas-{uuid.uuid4().hex[:8]}"
+    destino = RAIZ / f"propias-{uuid.uuid4().hex[:8]}"
+
+    # Registrados a nombre de cada empresa
+    guardar_bytes(origen / "2026/T1/Factura_A-1.pdf", b"a1", empresa_id=a.id)
+    guardar_bytes(origen / "2026/T1/Factura_B-1.pdf", b"b1", empresa_id=b)
+
+    # Sin dueño: en el almacén y escritos por fuera
+    guardar_bytes(origen / "2026/T2/Factura_A-2026-2.pdf", b"a2")
+    (origen / "2026/T2/Factura_A-2026-3.pdf").write_bytes(b"a3")
+    (origen / "2026/T2/Factura_X-9.pdf").write_bytes(b"x9")
+    guardar_bytes(origen / "2026/T2/Factura_Y-9.pdf", b"y9")
+
+    _factura(a.id, "A/2026/2", date(2026, 4, 2))
+    _factura(a.id, "A/2026/3", date(2026, 5, 3))
+    with Session(engine) as session:
+        propios = pdfs_de_empresa(session, a.id)
+    assert propios == {"2026/T2/Factura_A-2026-2.pdf", "2026/T2/Factura_A-2026-3.pdf"}
+
+    resultado = trasladar_carpeta(origen, destino, empresa_id=a.id, propios=propios)
+
+    assert resultado["movidos"] == 3
+    for sub in ("2026/T1/Factura_A-1.pdf", "2026/T2/Factura_A-2026-2.pdf", "2026/T2/Factura_A-2026-3.pdf"):
+        assert (destino / sub).is_file()
+        assert not (origen / sub).exists()
+        assert _dueno(destino / sub) == a.id
+
+    # Lo de otros (o de nadie) no se toca ni se adopta
+    assert (origen / "2026/T1/Factura_B-1.pdf").read_bytes() == b"b1"
+    assert _dueno(origen / "2026/T1/Factura_B-1.pdf") == b
+    assert (origen / "2026/T2/Factura_X-9.pdf").read_bytes() == b"x9"
+    assert _dueno(origen / "2026/T2/Factura_X-9.pdf") == "sin registro"
+    assert (origen / "2026/T2/Factura_Y-9.pdf").read_bytes() == b"y9"
+    assert _dueno(origen / "2026/T2/Factura_Y-9.pdf") is None
+
+
+def test_trasladar_carpeta_sin_empresa_no_mueve_nada():
+    origen = RAIZ / f"facturas-{uuid.uuid4().hex[:8]}"
+    guardar_bytes(origen / "Factura_1.pdf", b"1")
+
+    resultado = trasladar_carpeta(origen, RAIZ / "otra", propios={"Factura_1.pdf"})
+
+    assert resultado["movidos"] == 0
+    assert (origen / "Factura_1.pdf").is_file()
+
+
+def test_zip_de_la_raiz_no_incluye_el_almacen():
+    rel = f"zip-{uuid.uuid4().hex[:8]}/Factura_A-1.pdf"
+    guardar_bytes(RAIZ / rel, b"%PDF zip")
+
+    request = Request({"type": "http", "headers": [], "session": {"user": {"rol": "admin"}}})
+    respuesta = storage_batch_zip(request, {"paths": ["/"]})
+
+    async def cuerpo():
+        return b"".join([trozo async for trozo in respuesta.body_iterator])
+
+    nombres = zipfile.ZipFile(io.BytesIO(asyncio.run(cuerpo()))).namelist()
+
+    assert rel in nombres
+    assert not [n for n in nombres if n.startswith(".blobs/")]
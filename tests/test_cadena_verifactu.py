@@ -0,0 +1,71 @@
+# tests/test_cadena_verifactu.py
+from datetime import date, datetime, timedelta
+
+from sqlmodel import Session
+
+from app.db.session import engine
+from app.models.cliente import Cliente
+from app.models.factura import Factura, RegistroVerifactu
+from app.services.cadena_verifactu import bloquear_cadena, estado_cadena
+from app.services.verifactu_outbox import _siguientes_de_la_cadena
+
+
+def _cadena_con_relojes_desordenados(empresa_id: int) -> list[int]:
+    """
+    Tres registros encadenados 1, 2, 3 cuyo fecha_registro va al revés
+    (reloj del servidor corregido hacia atrás). Devuelve sus ids por secuencia.
+    """
+    with Session(engine) as session:
+        cliente = Cliente(empresa_id=empresa_id, nombre="Cliente")
+        session.add(cliente)
+        session.flush()
+
+        ahora = datetime.utcnow()
+        ids = []
+        for secuencia in (1, 2, 3):
+            f = Factura(
+                empresa_id=empresa_id, cliente_id=cliente.id, numero=f"A-{secuencia}",
+                fecha=date(2026, 1, secuencia), estado="VALIDADA",
+            )
+            session.add(f)
+            session.flush()
+
+            r = RegistroVerifactu(
+                empresa_id=empresa_id, factura_id=f.id,
+                numero_factura=f.numero, fecha_factura=f.fecha, total_factura=0,
+                hash_actual=f"h{secuencia}", hash_anterior=f"h{secuencia - 1}" if secuencia > 1 else None,
+                secuencia=secuencia,
+                fecha_registro=ahora - timedelta(minutes=secuencia),
+            )
+            session.add(r)
+            session.flush()
+            ids.append(r.id)
+
+        session.commit()
+        return ids
+
+
+def test_outbox_envia_en_orden_de_secuencia(empresa):
+    e, _ = empresa
+    ids = _cadena_con_relojes_desordenados(e.id)
+
+    with Session(engine) as session:
+        siguientes = _siguientes_de_la_cadena(session, e.id, limite=10)
+
+    assert [r.id for r in siguientes] == ids
+
+
+def test_cabeza_es_la_ultima_secuencia(empresa):
+    e, _ = empresa
+    ids = _cadena_con_relojes_desordenados(e.id)
+
+    with Session(engine) as session:
+        assert estado_cadena(session, e.id).ultimo_registro_id == ids[-1]
+
+        # Arranque de la cabeza desde la historia existente
+        cabeza = bloquear_cadena(session, e.id)
+        session.rollback()
+
+    assert cabeza.ultimo_registro_id == ids[-1]
+    assert cabeza.hash == "h3"
+    assert cabeza.secuencia == 3
@@ -0,0 +1,75 @@
+# tests/test_email_masivo.py
+import uuid
+from datetime import datetime, timedelta
+
+from sqlmodel import Session
+
+from app.db.session import engine
+from app.services.email_masivo import CUERPO_DEFECTO, progreso_email_masivo, rellenar
+from app.services.email_outbox import encolar_email
+
+CAMPOS = {
+    "cliente": "Pérez & Hijos <ventas>",
+    "numero": "A-2026-7",
+    "fecha": "01/03/2026",
+    "total": "121,00",
+    "empresa": "Emisor",
+}
+
+
+def test_rellena_y_escapa_el_cuerpo():
+    cuerpo = rellenar(CUERPO_DEFECTO, CAMPOS, html=True)
+
+    assert "Estimado/a Pérez &amp; Hijos &lt;ventas&gt;:" in cuerpo
+    assert "<ventas>" not in cuerpo
+    assert "factura A-2026-7 de fecha 01/03/2026 por importe de 121,00 €" in cuerpo
+
+
+def test_asunto_sin_escapar():
+    assert rellenar("Factura {numero} - {cliente}", CAMPOS) == (
+        "Factura A-2026-7 - Pérez & Hijos <ventas>"
+    )
+
+
+def test_sin_atributos_indices_ni_formato():
+    for plantilla in (
+        "{cliente.__class__.__init__.__globals__}",
+        "{cliente[0]}",
+        "{total:>999999999}",
+        "{0}",
+        "{}",
+    ):
+        assert rellenar(plantilla, CAMPOS) == plantilla
+
+
+def test_marcadores_desconocidos_y_llaves_sueltas():
+    assert rellenar("{desconocido} {numero", CAMPOS) == "{desconocido} {numero"
+
+
+def test_lote_con_reintentos_no_esta_terminado(empresa):
+    e, _ = empresa
+    lote = uuid.uuid4().hex
+
+    with Session(engine) as session:
+        enviado, fallido = (
+            encolar_email(
+                session, empresa_id=e.id, factura_id=1, para=para,
+                asunto="Factura", cuerpo="", lote=lote,
+            )
+            for para in ("a@example.com", "b@example.com")
+        )
+        enviado.estado = "OK"
+        fallido.estado = "ERROR"
+        fallido.proximo_intento = datetime.utcnow() + timedelta(minutes=5)
+        session.add_all([enviado, fallido])
+        session.commit()
+
+        progreso = progreso_email_masivo(session, e.id, lote)
+        assert progreso["reintentando"] == 1
+        assert progreso["terminado"] is False
+
+        # Error definitivo: ya no se reintenta
+        fallido.proximo_intento = None
+        session.add(fallido)
+        session.commit()
+        assert progreso_email_masivo(session, e.id, lote)["terminado"] is True
@@ -0,0 +1,175 @@
+# tests/test_email_outbox.py
+import socket
+from datetime import datetime, timedelta
+
+import pytest
+from sqlmodel import Session, select
+
+from app.core.config import settings
+from app.db.session import engine
+from app.models.configuracion_sistema import ConfiguracionSistema
+from app.models.envios_email import EnviosEmail
+from app.services.email_outbox import encolar_email, procesar_empresa, resumen_emails
+from app.services.smtp_local import ServidorSMTPLocal
+from app.services.smtp_service import cerrar_conexiones_smtp
+
+RECHAZADO = "no-existe@example.com"
+
+
+@pytest.fixture
+def smtp():
+    with ServidorSMTPLocal(rechazar={RECHAZADO}) as servidor:
+        yield servidor
+    cerrar_conexiones_smtp()
+
+
+@pytest.fixture
+def pdf(tmp_path):
+    ruta = tmp_path / "Factura_A-1.pdf"
+    ruta.write_bytes(b"%PDF-1.4\n" + b"x" * 4096)
+    return str(ruta)
+
+
+def _puerto_cerrado() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _configurar(empresa_id: int, host: str, port: int):
+    with Session(engine) as session:
+        config = session.exec(
+            select(ConfiguracionSistema).where(ConfiguracionSistema.empresa_id == empresa_id)
+        ).first() or ConfiguracionSistema(empresa_id=empresa_id)
+        config.smtp_host, config.smtp_port = host, port
+        config.smtp_tls = config.smtp_ssl = False
+        config.smtp_from = "facturas@example.com"
+        session.add(config)
+        session.commit()
+
+
+def _encolar(empresa_id: int, para: str, pdf_path: str | None) -> int:
+    with Session(engine) as session:
+        return encolar_email(
+            session, empresa_id=empresa_id, factura_id=1, para=para,
+            asunto="Factura A-1", cuerpo="<p>Adjunta</p>", pdf_path=pdf_path,
+        ).id
+
+
+def _envio(envio_id: int) -> EnviosEmail:
+    with Session(engine) as session:
+        return session.get(EnviosEmail, envio_id)
+
+
+def _vencer(envio_id: int):
+    with Session(engine) as session:
+        envio = session.get(EnviosEmail, envio_id)
+        envio.proximo_intento = datetime.utcnow() - timedelta(seconds=1)
+        session.add(envio)
+        session.commit()
+
+
+def test_envio_con_adjunto(empresa, smtp, pdf):
+    e, _ = empresa
+    _configurar(e.id, smtp.host, smtp.port)
+    envio_id = _encolar(e.id, "cliente@example.com", pdf)
+
+    assert procesar_empresa(e.id) == 1
+
+    envio = _envio(envio_id)
+    assert envio.estado == "OK"
+    assert envio.proximo_intento is None
+    assert smtp.mensajes[0].destinatarios == ["cliente@example.com"]
+    assert b"Factura_A-1.pdf" in smtp.mensajes[0].datos
+
+
+def test_servidor_caido_reintenta_con_backoff(empresa, smtp, pdf):
+    e, _ = empresa
+    _configurar(e.id, "127.0.0.1", _puerto_cerrado())
+    envio_id = _encolar(e.id, "cliente@example.com", pdf)
+
+    for intento in (1, 2):
+        antes = datetime.utcnow()
+        assert procesar_empresa(e.id) == 0
+
+        envio = _envio(envio_id)
+        espera = settings.EMAIL_BACKOFF_BASE * 2 ** (intento - 1)
+        assert envio.estado == "ERROR"
+        assert envio.intentos == intento
+        assert antes + timedelta(seconds=espera - 1) <= envio.proximo_intento
+        assert envio.proximo_intento <= datetime.utcnow() + timedelta(seconds=espera + 1)
+
+        # Antes de su plazo no se vuelve a tocar
+        assert procesar_empresa(e.id) == 0
+        assert _envio(envio_id).intentos == intento
+        _vencer(envio_id)
+
+    # El servidor vuelve: sale en la siguiente pasada
+    _configurar(e.id, smtp.host, smtp.port)
+    assert procesar_empresa(e.id) == 1
+    assert _envio(envio_id).estado == "OK"
+
+
+def test_rechazo_5xx_es_definitivo(empresa, smtp, pdf):
+    e, _ = empresa
+    _configurar(e.id, smtp.host, smtp.port)
+    envio_id = _encolar(e.id, RECHAZADO, pdf)
+
+    assert procesar_empresa(e.id) == 0
+
+    envio = _envio(envio_id)
+    assert envio.estado == "ERROR"
+    assert envio.intentos == 1
+    assert envio.proximo_intento is None
+    assert smtp.mensajes == []
+
+
+def test_pdf_inexistente_no_frena_el_lote(empresa, smtp, pdf, tmp_path):
+    e, _ = empresa
+    _configurar(e.id, smtp.host, smtp.port)
+    sin_pdf = _encolar(e.id, "cliente@example.com", str(tmp_path / "borrado.pdf"))
+    siguiente = _encolar(e.id, "otro@example.com", pdf)
+
+    assert procesar_empresa(e.id) == 1
+
+    envio = _envio(sin_pdf)
+    assert envio.estado == "ERROR"
+    assert envio.proximo_intento is None
+    assert "borrado.pdf" in envio.error
+    assert _envio(siguiente).estado == "OK"
+    assert len(smtp.mensajes) == 1
+
+
+def test_resumen_emails(empresa, smtp, pdf):
+    e, _ = empresa
+    _configurar(e.id, smtp.host, smtp.port)
+    _encolar(e.id, "cliente@example.com", pdf)
+    _encolar(e.id, RECHAZADO, pdf)
+    procesar_empresa(e.id)
+
+    _configurar(e.id, "127.0.0.1", _puerto_cerrado())
+    _encolar(e.id, "tarde@example.com", pdf)
+    procesar_empresa(e.id)
+
+    pendiente_id = _encolar(e.id, "cola@example.com", pdf)
+
+    with Session(engine) as session:
+        resumen = resumen_emails(session, e.id)
+
+    assert resumen["estados"] == {"OK": 1, "ERROR": 2, "PENDIENTE": 1}
+    assert resumen["reintentando"] == 1
+    assert resumen["pendiente_desde"] == _envio(pendiente_id).creado_en
+    assert resumen["ultimo_envio"] is not None
+
+
+def test_rechazo_no_cierra_la_conexion(empresa, smtp, pdf):
+    e, _ = empresa
+    _configurar(e.id, smtp.host, smtp.port)
+    rechazado = _encolar(e.id, RECHAZADO, pdf)
+    siguiente = _encolar(e.id, "cliente@example.com", pdf)
+
+    assert procesar_empresa(e.id) == 1
+
+    assert _envio(rechazado).estado == "ERROR"
+    assert _envio(siguiente).estado == "OK"
+    assert smtp.conexiones == 1
@@ -0,0 +1,51 @@
+# tests/test_email_stream.py
+from email import message_from_bytes
+from email.header import decode_header, make_header
+from email.policy import default
+
+import pytest
+
+from app.services.email_stream import CabeceraInvalida, MensajeStream
+
+
+def _mensaje(**cambios) -> MensajeStream:
+    datos = dict(
+        remitente="facturas@example.com",
+        para="cliente@example.com",
+        asunto="Factura A-1",
+        cuerpo_html="<p>Adjunta</p>",
+    )
+    return MensajeStream(**{**datos, **cambios})
+
+
+@pytest.mark.parametrize("campo,valor", [
+    ("para", "a@b.c\r\nBcc: x@y.z"),
+    ("para", "a@b.c\nBcc: x@y.z"),
+    ("remitente", "f@example.com\rBcc: x@y.z"),
+    ("cc", ["ok@example.com", "c@d.e\r\nBcc: x@y.z"]),
+    ("para", "pérez@example.com"),
+])
+def test_rechaza_direcciones_no_validas(campo, valor):
+    with pytest.raises(CabeceraInvalida):
+        _mensaje(**{campo: valor})
+
+
+def test_asunto_con_salto_de_linea_no_crea_cabeceras():
+    msg = message_from_bytes(_mensaje(asunto="Factura\r\nBcc: x@y.z").as_bytes())
+
+    assert msg["Bcc"] is None
+    assert "Bcc: x@y.z" in str(make_header(decode_header(msg["Subject"])))
+
+
+def test_nombres_visibles_codificados():
+    crudo = _mensaje(
+        remitente='"Pérez, S.L." <facturas@example.com>',
+        cc=["Ana <ana@example.com>", "otro@example.com"],
+    ).as_bytes()
+    msg = message_from_bytes(crudo, policy=default)
+
+    assert b"From: =?utf-8?" in crudo
+    remitente = msg["From"].addresses[0]
+    assert (remitente.display_name, remitente.addr_spec) == ("Pérez, S.L.", "facturas@example.com")
+    assert [a.addr_spec for a in msg["Cc"].addresses] == ["ana@example.com", "otro@example.com"]
+    assert msg["To"] == "cliente@example.com"
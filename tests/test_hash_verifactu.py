@@ -0,0 +1,63 @@
+# tests/test_hash_verifactu.py
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytest
+
+from app.services.hash_verifactu import hash_registro, importe_canonico
+
+
+# ============================================================
+# VECTORES FIJOS
+# ============================================================
+# Si alguno cambia, los registros ya encadenados dejan de verificar:
+# NO se actualizan los valores, se añade una versión nueva de hash.
+
+PRIMERO = dict(
+    nif_emisor=" b12345678 ",
+    numero=" A-2026-1",
+    fecha=date(2026, 3, 1),
+    total=24.3,
+    fecha_registro=datetime(2026, 3, 1, 10, 15, 30, 123456),
+    hash_anterior=None,
+)
+
+SEGUNDO = dict(
+    nif_emisor="B12345678",
+    numero="A-2026-2",
+    fecha=date(2026, 3, 2),
+    total=0.1 + 0.2,
+    fecha_registro=datetime(2026, 3, 2, 8, 0, 0),
+)
+
+V2_PRIMERO = "aa10eaa1b9c1be660f05f3e16a9e815ce00f5cc98b9709b57d1bc5fb3213b61b"
+V2_SEGUNDO = "07d391adf536ca5ee3d64c2c98904f69b0418cc19120d37046c156b0967bf6fb"
+V1_PRIMERO = "c935231d3d9909991864ddcdafa6f253861b5472e8caff4a89d918ba4e7ccca8"
+V1_SEGUNDO = "9611dbf329cc4144651ffe702c87626d3c658a07e55d21301127ec3c45e6236d"
+
+
+def test_vectores_v2():
+    assert hash_registro(2, **PRIMERO) == V2_PRIMERO
+    assert hash_registro(2, **SEGUNDO, hash_anterior=V2_PRIMERO) == V2_SEGUNDO
+
+
+def test_vectores_v1():
+    assert hash_registro(1, **PRIMERO) == V1_PRIMERO
+    assert hash_registro(1, **SEGUNDO, hash_anterior=V1_PRIMERO) == V1_SEGUNDO
+
+
+def test_v2_no_depende_del_tipo_del_importe():
+    for total in (24.3, "24.30", Decimal("24.300"), Decimal("24.3")):
+        assert hash_registro(2, **{**PRIMERO, "total": total}) == V2_PRIMERO
+
+
+def test_importe_canonico():
+    assert importe_canonico(24.3) == "24.30"
+    assert importe_canonico(0.1 + 0.2) == "0.30"
+    assert importe_canonico(Decimal("2.675")) == "2.68"
+    assert importe_canonico(None) == "0.00"
+
+
+def test_version_desconocida():
+    with pytest.raises(ValueError):
+        hash_registro(99, **PRIMERO)
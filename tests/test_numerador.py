@@ -0,0 +1,55 @@
+# tests/test_numerador.py
+import threading
+
+from sqlmodel import Session
+
+from app.db.session import engine
+from app.services.numerador import reservar_numeros, siguiente_numero_previsto
+
+HILOS = 8
+RESERVAS_POR_HILO = 25
+
+
+def test_reservas_concurrentes_sin_huecos_ni_duplicados(empresa):
+    """Estrés: varios hilos reservando a la vez, cada reserva en su transacción."""
+    _, emisor = empresa
+    entregados, errores = [], []
+    lock = threading.Lock()
+    salida = threading.Barrier(HILOS)
+
+    def trabajador(n):
+        salida.wait()
+        for i in range(RESERVAS_POR_HILO):
+            try:
+                with Session(engine) as session:
+                    numeros = reservar_numeros(session, emisor, 2026, 1 + (n + i) % 3)
+                    session.commit()
+                with lock:
+                    entregados.extend(numeros)
+            except Exception as e:      # noqa: BLE001 — se comprueba abajo
+                with lock:
+                    errores.append(repr(e))
+
+    hilos = [threading.Thread(target=trabajador, args=(n,)) for n in range(HILOS)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+
+    assert errores == []
+    assert sorted(entregados) == list(range(1, len(entregados) + 1))
+
+    with Session(engine) as session:
+        assert siguiente_numero_previsto(session, emisor, 2026) == len(entregados) + 1
+
+
+def test_rollback_devuelve_el_numero(empresa):
+    _, emisor = empresa
+
+    with Session(engine) as session:
+        assert reservar_numeros(session, emisor, 2027, 3) == range(1, 4)
+        session.rollback()
+
+    with Session(engine) as session:
+        assert reservar_numeros(session, emisor, 2027) == range(1, 2)
+        session.commit()
@@ -0,0 +1,69 @@
+# tests/test_qr_lote.py
+from datetime import date
+
+import pytest
+from fastapi import HTTPException
+from sqlmodel import Session
+from starlette.requests import Request
+
+from app.db.session import engine
+from app.models.cliente import Cliente
+from app.models.configuracion_sistema import ConfiguracionSistema
+from app.models.emisor import Emisor
+from app.models.factura import Factura
+from app.routers.facturas import facturas_qr_lote
+
+
+def _qr_lote(empresa_id: int, data: dict) -> dict:
+    request = Request({"type": "http", "headers": [], "session": {"empresa_id": empresa_id}})
+    with Session(engine) as session:
+        return facturas_qr_lote(request, data, session)
+
+
+def _validada(empresa_id: int, emisor_id: int) -> int:
+    with Session(engine) as session:
+        emisor = session.get(Emisor, emisor_id)
+        emisor.nif = "B12345678"
+        session.add(emisor)
+        session.add(ConfiguracionSistema(empresa_id=empresa_id))
+        cliente = Cliente(empresa_id=empresa_id, nombre="Cliente")
+        session.add(cliente)
+        session.flush()
+        f = Factura(
+            empresa_id=empresa_id, cliente_id=cliente.id, numero="A-2026-1",
+            fecha=date(2026, 3, 1), total=121.0, estado="VALIDADA",
+        )
+        session.add(f)
+        session.commit()
+        return f.id
+
+
+def test_ids_como_texto_y_repetidos(empresa):
+    e, emisor = empresa
+    factura_id = _validada(e.id, emisor.id)
+
+    resultados = _qr_lote(e.id, {"ids": [str(factura_id), factura_id]})["resultados"]
+
+    assert len(resultados) == 1
+    assert resultados[0]["id"] == factura_id
+    assert resultados[0]["ok"] is True
+    assert resultados[0]["svg"].lstrip().startswith("<?xml")
+
+
+@pytest.mark.parametrize("data, error", [
+    ({"ids": ["uno"]}, "Identificadores"),
+    ({"ids": [True]}, "Identificadores"),
+    ({"ids": [1.5]}, "Identificadores"),
+    ({"ids": [None]}, "Identificadores"),
+    ({"ids": [1], "size_mm": 2000}, "entre 30 y 40 mm"),
+    ({"ids": [1], "size_mm": "nan"}, "entre 30 y 40 mm"),
+])
+def test_entrada_no_valida_es_400(empresa, data, error):
+    e, emisor = empresa
+    _validada(e.id, emisor.id)
+
+    with pytest.raises(HTTPException) as exc:
+        _qr_lote(e.id, data)
+
+    assert exc.value.status_code == 400
+    assert error in exc.value.detail
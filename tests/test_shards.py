@@ -0,0 +1,57 @@
+# tests/test_shards.py
+import uuid
+from datetime import date
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, select
+
+from app.core.config import settings
+from app.db import shards
+from app.db.session import engine
+from app.models.empresa import Empresa
+from app.models.envios_email import EnviosEmail, registrar_envio_email
+from app.models.factura import Factura
+
+
+@pytest.fixture
+def sharding(monkeypatch):
+    monkeypatch.setattr(settings, "DB_SHARDING", True)
+    yield
+    shards.cerrar_engines()
+
+
+def test_registrar_envio_email_va_al_shard(sharding, empresa):
+    e, _ = empresa
+
+    # Los ids se repiten entre BD: se busca por un asunto único
+    asunto = f"Factura {uuid.uuid4().hex}"
+    registrar_envio_email(
+        factura_id=1, destinatario="a@b.c", asunto=asunto, cuerpo=None,
+        cc=None, adjunto_pdf=False, empresa_id=e.id,
+    )
+
+    consulta = select(EnviosEmail).where(EnviosEmail.asunto == asunto)
+    with shards.sesion_empresa(e.id) as session:
+        assert session.exec(consulta).one().empresa_id == e.id
+    with Session(engine) as session:
+        assert session.exec(consulta).first() is None
+
+
+def test_datos_empresa_confirma_primero_la_principal(sharding):
+    with Session(engine) as session:
+        empresa = Empresa(nombre="Media", cif="B99999999", activa=True)
+        session.add(empresa)
+        session.flush()
+        empresa_id = empresa.id
+
+        with pytest.raises(IntegrityError):
+            with shards.datos_empresa(session, empresa_id) as datos:
+                # Falla en el commit del fichero de la empresa (fecha NOT NULL)
+                datos.add(Factura(empresa_id=empresa_id, cliente_id=1, fecha=None))
+
+    # La empresa existe; su fichero no tiene nada a medias
+    with Session(engine) as session:
+        assert session.get(Empresa, empresa_id) is not None
+    with shards.sesion_empresa(empresa_id) as datos:
+        assert datos.exec(select(Factura)).all() == []
@@ -0,0 +1,69 @@
+# tests/test_validacion_lote.py
+from datetime import date, datetime, time
+
+from sqlmodel import Session
+
+from app.db.session import engine
+from app.models.cliente import Cliente
+from app.models.configuracion_sistema import ConfiguracionSistema
+from app.models.factura import Factura
+from app.services.validacion_lote import validar_facturas_lote
+
+
+def test_fecha_del_lote_no_se_aplica_a_las_rechazadas(empresa):
+    e, _ = empresa
+
+    with Session(engine) as session:
+        cliente = Cliente(empresa_id=e.id, nombre="Cliente")
+        session.add(cliente)
+        session.flush()
+
+        # Ya hay una validada en junio: un lote con fecha de marzo no entra
+        session.add(Factura(
+            empresa_id=e.id, cliente_id=cliente.id, numero="A-2026-1",
+            fecha=date(2026, 6, 1), estado="VALIDADA",
+        ))
+        borrador = Factura(
+            empresa_id=e.id, cliente_id=cliente.id,
+            fecha=date(2026, 7, 1), estado="BORRADOR",
+        )
+        session.add(borrador)
+        session.commit()
+        borrador_id = borrador.id
+
+        resultados, validadas, _ = validar_facturas_lote(
+            session, empresa_id=e.id, factura_ids=[borrador_id], fecha=date(2026, 3, 1),
+        )
+
+    assert validadas == []
+    assert not resultados[0].ok
+
+    with Session(engine) as session:
+        f = session.get(Factura, borrador_id)
+        assert f.estado == "BORRADOR"
+        assert f.fecha == date(2026, 7, 1)
+
+
+def test_fecha_validacion_como_validar_factura(empresa):
+    e, _ = empresa
+
+    with Session(engine) as session:
+        session.add(ConfiguracionSistema(empresa_id=e.id))
+        cliente = Cliente(empresa_id=e.id, nombre="Cliente")
+        session.add(cliente)
+        session.flush()
+        borrador = Factura(
+            empresa_id=e.id, cliente_id=cliente.id, fecha=date.today(), estado="BORRADOR",
+        )
+        session.add(borrador)
+        session.commit()
+        borrador_id = borrador.id
+
+        _, validadas, _ = validar_facturas_lote(session, empresa_id=e.id, factura_ids=[borrador_id])
+
+    assert validadas == [borrador_id]
+
+    with Session(engine) as session:
+        f = session.get(Factura, borrador_id)
+        # validar_factura guarda date.today(): medianoche, no la hora UTC
+        assert f.fecha_validacion == datetime.combine(date.today(), time())
@@ -0,0 +1,64 @@
+# tests/test_validar_factura.py
+from datetime import date
+
+import pytest
+from fastapi import HTTPException
+from sqlmodel import Session, select
+from starlette.requests import Request
+
+from app.db.session import engine
+from app.models.cliente import Cliente
+from app.models.configuracion_sistema import ConfiguracionSistema
+from app.models.factura import Factura
+from app.routers import facturas
+from app.services.numerador import siguiente_numero_previsto
+
+
+def _peticion(empresa_id: int) -> Request:
+    return Request({"type": "http", "headers": [], "session": {"empresa_id": empresa_id}})
+
+
+def _borrador(empresa_id: int) -> int:
+    with Session(engine) as session:
+        session.add(ConfiguracionSistema(empresa_id=empresa_id))
+        cliente = Cliente(empresa_id=empresa_id, nombre="Cliente")
+        session.add(cliente)
+        session.flush()
+        f = Factura(empresa_id=empresa_id, cliente_id=cliente.id, fecha=date.today(), estado="BORRADOR")
+        session.add(f)
+        session.commit()
+        return f.id
+
+
+@pytest.mark.parametrize("error", [HTTPException(400, "VeriFactu no disponible"), RuntimeError("caído")])
+def test_fallo_verifactu_no_gasta_numero(empresa, monkeypatch, error):
+    e, emisor = empresa
+    factura_id = _borrador(e.id)
+
+    def fallar(*_a, **_k):
+        raise error
+
+    monkeypatch.setattr(facturas, "verificar_verifactu", fallar)
+
+    with Session(engine) as session:
+        antes = siguiente_numero_previsto(session, emisor, date.today().year)
+
+    with Session(engine) as session:
+        if isinstance(error, HTTPException):
+            respuesta = facturas.validar_factura(
+                factura_id, fecha=date.today(), mensaje_iva="", session=session,
+                request=_peticion(e.id),
+            )
+            assert respuesta == {"ok": False, "error": "VeriFactu no disponible"}
+        else:
+            with pytest.raises(RuntimeError):
+                facturas.validar_factura(
+                    factura_id, fecha=date.today(), mensaje_iva="", session=session,
+                    request=_peticion(e.id),
+                )
+
+    with Session(engine) as session:
+        assert siguiente_numero_previsto(session, emisor, date.today().year) == antes
+        f = session.get(Factura, factura_id)
+        assert f.estado == "BORRADOR"
+        assert f.numero is None
@@ -0,0 +1,92 @@
+# tests/test_verifactu_http.py
+import asyncio
+import datetime as dt
+import os
+from types import SimpleNamespace
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives.serialization import BestAvailableEncryption, pkcs12
+from cryptography.x509.oid import NameOID
+
+from app.services import verifactu_http
+
+
+def _p12(ruta, password: bytes):
+    clave = ec.generate_private_key(ec.SECP256R1())
+    nombre = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "AEAT test")])
+    ahora = dt.datetime.now(dt.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(nombre).issuer_name(nombre)
+        .public_key(clave.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(ahora).not_valid_after(ahora + dt.timedelta(days=1))
+        .sign(clave, hashes.SHA256())
+    )
+    ruta.write_bytes(pkcs12.serialize_key_and_certificates(
+        b"aeat", clave, cert, None, BestAvailableEncryption(password)
+    ))
+
+
+def _config(tmp_path, empresa_id, password="secreto"):
+    ruta = tmp_path / "aeat.p12"
+    if not ruta.exists():
+        _p12(ruta, password.encode())
+    return SimpleNamespace(
+        empresa_id=empresa_id, cert_aeat_path=str(ruta), cert_aeat_password=password
+    )
+
+
+def test_la_clave_nunca_toca_el_disco_en_claro(tmp_path, monkeypatch):
+    volcados = []
+    borrar = os.remove
+
+    def espiar(ruta):
+        volcados.append(open(ruta, "rb").read())
+        borrar(ruta)
+
+    monkeypatch.setattr(verifactu_http.os, "remove", espiar)
+
+    verifactu_http._contexto_ssl(_config(tmp_path, 1))
+
+    assert len(volcados) == 1
+    assert b"BEGIN ENCRYPTED PRIVATE KEY" in volcados[0]
+    assert b"BEGIN PRIVATE KEY" not in volcados[0]
+
+
+def test_cliente_async_sustituido_se_cierra(tmp_path):
+    async def escenario():
+        config = _config(tmp_path, 901)
+        primero = verifactu_http.obtener_cliente_async(config)
+        assert verifactu_http.obtener_cliente_async(config) is primero
+
+        # Otro mtime del certificado → clave distinta → cliente nuevo
+        os.utime(config.cert_aeat_path, (1, 1))
+        segundo = verifactu_http.obtener_cliente_async(config)
+        assert segundo is not primero
+
+        await asyncio.sleep(0)
+        await asyncio.gather(*verifactu_http._cierres)
+        assert primero.is_closed
+        assert not segundo.is_closed
+        await verifactu_http.cerrar_clientes_async()
+
+    asyncio.run(escenario())
+
+
+def test_cliente_sustituido_no_se_cierra_mientras_se_usa(tmp_path):
+    config = _config(tmp_path, 902)
+
+    with verifactu_http.usar_cliente(config) as primero:
+        # Otro hilo ve el certificado cambiado mientras este sigue enviando
+        os.utime(config.cert_aeat_path, (1, 1))
+        with verifactu_http.usar_cliente(config) as segundo:
+            assert segundo is not primero
+        assert not primero.is_closed
+
+    assert primero.is_closed
+    assert not segundo.is_closed
+    verifactu_http.cerrar_clientes()
+    assert segundo.is_closed
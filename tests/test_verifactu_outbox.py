@@ -0,0 +1,123 @@
+# tests/test_verifactu_outbox.py
+from datetime import date, datetime, timedelta
+
+import httpx
+from sqlmodel import Session, select
+
+from app.core.config import settings
+from app.db.session import engine
+from app.models.cliente import Cliente
+from app.models.configuracion_sistema import ConfiguracionSistema
+from app.models.factura import Factura, RegistroVerifactu
+from app.services import verifactu_outbox
+from app.services.verifactu_envio import ResultadoEnvio, _resultados_por_registro
+
+
+def _cadena(empresa_id: int, n: int) -> list[int]:
+    """n registros PENDIENTES encadenados (ids por secuencia) y config con URL."""
+    with Session(engine) as session:
+        session.add(ConfiguracionSistema(empresa_id=empresa_id, verifactu_url="https://aeat.invalid"))
+        cliente = Cliente(empresa_id=empresa_id, nombre="Cliente")
+        session.add(cliente)
+        session.flush()
+
+        antes = datetime.utcnow() - timedelta(hours=1)
+        ids = []
+        for secuencia in range(1, n + 1):
+            f = Factura(
+                empresa_id=empresa_id, cliente_id=cliente.id, numero=f"A-{secuencia}",
+                fecha=date(2026, 1, secuencia), estado="VALIDADA",
+            )
+            session.add(f)
+            session.flush()
+            r = RegistroVerifactu(
+                empresa_id=empresa_id, factura_id=f.id, numero_factura=f.numero,
+                fecha_factura=f.fecha, total_factura=0, hash_actual=f"h{secuencia}",
+                secuencia=secuencia, fecha_registro=antes,
+            )
+            session.add(r)
+            session.flush()
+            ids.append(r.id)
+
+        session.commit()
+        return ids
+
+
+def _estados(ids: list[int]) -> list[tuple]:
+    with Session(engine) as session:
+        filas = {
+            r.id: (r.estado_envio, r.intentos_envio)
+            for r in session.exec(select(RegistroVerifactu).where(RegistroVerifactu.id.in_(ids)))
+        }
+    return [filas[i] for i in ids]
+
+
+def test_fallo_parcial_corta_la_cadena(empresa, monkeypatch):
+    e, _ = empresa
+    ids = _cadena(e.id, 4)
+
+    monkeypatch.setattr(settings, "VERIFACTU_LOTE_MAX", 4)
+    monkeypatch.setattr(
+        verifactu_outbox, "enviar_registros_lote",
+        lambda **_: [
+            ResultadoEnvio(ok=True),
+            ResultadoEnvio(ok=False, error="Rechazado"),
+            ResultadoEnvio(ok=True),
+            ResultadoEnvio(ok=True),
+        ],
+    )
+
+    assert verifactu_outbox.procesar_empresa(e.id) == 1
+    assert _estados(ids) == [
+        ("ENVIADO", 0),
+        ("ERROR", 1),
+        ("PENDIENTE", 0),
+        ("PENDIENTE", 0),
+    ]
+
+
+def _respuesta(resultados) -> httpx.Response:
+    return httpx.Response(200, json={"resultados": resultados})
+
+
+def test_resultado_sin_ok_es_rechazo():
+    registros = [RegistroVerifactu(hash_actual="h1"), RegistroVerifactu(hash_actual="h2")]
+
+    resultados = _resultados_por_registro(registros, _respuesta([
+        {"hash_actual": "h1", "ok": True},
+        {"hash_actual": "h2"},
+    ]))
+
+    assert [r.ok for r in resultados] == [True, False]
+
+
+def test_cabeza_agotada_se_recupera_reencolando(empresa, monkeypatch):
+    e, _ = empresa
+    ids = _cadena(e.id, 2)
+
+    with Session(engine) as session:
+        cabeza = session.get(RegistroVerifactu, ids[0])
+        cabeza.estado_envio = "ERROR"
+        cabeza.error_envio = "Rechazado"
+        cabeza.intentos_envio = settings.VERIFACTU_MAX_INTENTOS
+        session.add(cabeza)
+        session.commit()
+
+    monkeypatch.setattr(
+        verifactu_outbox, "enviar_registros_lote",
+        lambda registros, **_: [ResultadoEnvio(ok=True) for _ in registros],
+    )
+
+    # Cadena detenida: el worker no envía y el resumen dice por qué
+    assert verifactu_outbox.procesar_empresa(e.id) == 0
+    with Session(engine) as session:
+        resumen = verifactu_outbox.resumen_outbox(session, e.id)
+    assert resumen["bloqueada"] is True
+    assert resumen["registro_bloqueante"] == ids[0]
+    assert resumen["sin_endpoint"] is False
+
+    with Session(engine) as session:
+        assert verifactu_outbox.reencolar_errores(session, e.id) == 1
+
+    assert verifactu_outbox.procesar_empresa(e.id) == 2
+    assert _estados(ids) == [("ENVIADO", 0), ("ENVIADO", 0)]